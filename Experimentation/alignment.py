@@ -0,0 +1,26 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def char_spans(buf: bytes, byte_offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Char [start, end) of each token, given the concatenated token bytes and the
+    n + 1 byte offsets where tokens start (the last one being len(buf)).
+
+    Every non-continuation byte (not 0b10xxxxxx) starts a new character, so a
+    token that splits a multi-byte (e.g. CJK) character still maps onto it; a
+    token that ends inside a character is extended to cover the whole character.
+    """
+    raw = np.frombuffer(bytes(buf), dtype=np.uint8)
+    leads = (raw & 0xC0) != 0x80
+    # char_at[b] = index of the character that byte b belongs to
+    char_at = np.empty(len(raw) + 1, dtype=np.int64)
+    np.maximum(np.cumsum(leads) - 1, 0, out=char_at[:-1])
+    char_at[-1] = int(leads.sum())
+
+    byte_starts = byte_offsets[:-1]
+    byte_ends = byte_offsets[1:]
+    starts = char_at[byte_starts]
+    ends = np.where(byte_ends > byte_starts, char_at[np.maximum(byte_ends - 1, 0)] + 1, starts)
+    return starts, ends
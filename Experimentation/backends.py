@@ -0,0 +1,393 @@
+import os, dotenv, json, hashlib, time, asyncio, threading, weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, RateLimitError
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from Experimentation.ratelimit import RateLimiter, estimate_tokens, get_limiter, retry_after
+from Experimentation.tracing import count
+
+DEFAULT_RECORDING = Path(__file__).resolve().parent / "logprob.json"
+
+
+class TranslationBackend(ABC):
+    """
+    Anything that can answer a chat-completions request.
+
+    `create` takes the same arguments as `client.chat.completions.create` and
+    returns a `ChatCompletion`, so callers don't care where the answer came from.
+    """
+
+    @abstractmethod
+    def create(self, model: str, messages: List[dict], **params) -> ChatCompletion:
+        ...
+
+    async def acreate(self, model: str, messages: List[dict], **params) -> ChatCompletion:
+        # Backends without a native async client run the blocking call in a thread
+        return await asyncio.to_thread(self.create, model, messages, **params)
+
+    def stream(self, model: str, messages: List[dict], **params) -> Iterator[ChatCompletionChunk]:
+        # Backends that can't stream answer with the whole completion as one chunk
+        response = self.create(model, messages, **params)
+        choice = response.choices[0]
+        tokens = [tok.model_dump() for tok in choice.logprobs.content] if choice.logprobs else None
+        yield completion_chunk(response.id, response.model, choice.message.content, tokens, choice.finish_reason)
+
+
+def completion_chunk(id: str, model: str, content: Optional[str], tokens: Optional[List[dict]],
+                     finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate({
+        "id": id,
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": content},
+            "logprobs": {"content": tokens} if tokens is not None else None,
+            "finish_reason": finish_reason,
+        }],
+    })
+
+
+class OpenAIBackend(TranslationBackend):
+    """
+    The OpenAI API over one connection pool per process: every session's
+    blocking calls share the sync client, and each event loop gets one async
+    client with the same limits (an async pool can't outlive its loop, and
+    document mode runs a fresh loop per document).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: int = 32):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _api_key(self) -> str:
+        dotenv.load_dotenv()
+        secret_key = self.api_key or os.getenv("OPENAI_API_KEY")
+        if not secret_key:
+            raise ValueError("OPENAI_API_KEY not found in environment.")
+        return secret_key
+
+    @property
+    def client(self) -> OpenAI:
+        # Built on first use, not at import time, so the app can start without a key
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=self._api_key(), base_url=self.base_url, http_client=DefaultHttpxClient(limits=self.limits)
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = AsyncOpenAI(
+                api_key=self._api_key(), base_url=self.base_url, http_client=DefaultAsyncHttpxClient(limits=self.limits)
+            )
+        return client
+
+    def create(self, model, messages, **params):
+        return self.client.chat.completions.create(model=model, messages=messages, **params)
+
+    async def acreate(self, model, messages, **params):
+        return await self.async_client.chat.completions.create(model=model, messages=messages, **params)
+
+    def stream(self, model, messages, **params):
+        # include_usage adds a final chunk with token counts for the metrics
+        return self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **params
+        )
+
+
+def _load_recording(path: Union[str, Path]) -> dict:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "choices" in data:
+        return data
+    # A bare logprobs.content list such as logprob.json
+    return {
+        "id": "",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "".join(tok["token"] for tok in data)},
+            "logprobs": {"content": data},
+        }],
+    }
+
+
+class ReplayBackend(TranslationBackend):
+    """
+    Serves recorded responses instead of calling the API.
+
+    The same request always gets the same recording (picked by a hash of the
+    messages), which makes it usable for offline UI work and for measuring the
+    rest of the pipeline without network noise. `latency` adds a fixed delay in
+    seconds to mimic a round trip.
+    """
+
+    def __init__(self, recordings: Optional[List[Union[str, Path]]] = None, latency: float = 0.0):
+        paths = recordings or [DEFAULT_RECORDING]
+        self.recordings = [_load_recording(p) for p in paths]
+        self.latency = latency
+
+    def _replay(self, model, messages) -> ChatCompletion:
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+        payload = dict(self.recordings[int(digest, 16) % len(self.recordings)])
+        payload["id"] = f"replay-{digest[:24]}"
+        payload["model"] = model
+        return ChatCompletion.model_validate(payload)
+
+    def create(self, model, messages, **params):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._replay(model, messages)
+
+    async def acreate(self, model, messages, **params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._replay(model, messages)
+
+    def stream(self, model, messages, **params):
+        # One chunk per recorded token, with `latency` spread across the stream
+        response = self._replay(model, messages)
+        tokens = response.choices[0].logprobs.content
+        for i, tok in enumerate(tokens):
+            if self.latency:
+                time.sleep(self.latency / len(tokens))
+            finish_reason = "stop" if i == len(tokens) - 1 else None
+            yield completion_chunk(response.id, model, tok.token, [tok.model_dump()], finish_reason)
+        if (params.get("stream_options") or {}).get("include_usage") and response.usage is not None:
+            yield ChatCompletionChunk.model_validate({
+                "id": response.id,
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [],
+                "usage": response.usage.model_dump(),
+            })
+
+
+class _Broadcast:
+    """The chunks of one in-flight stream, replayed to every subscriber as they arrive."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def subscribe(self) -> Iterator[ChatCompletionChunk]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                if i >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[i]
+            i += 1
+            yield chunk
+
+
+class CoalescingBackend(TranslationBackend):
+    """
+    Single-flight in front of another backend: concurrent identical requests
+    (same model, messages and parameters) share one call and all get its
+    result. Streams are pumped on their own thread and fanned out chunk by
+    chunk, so a session that joins late still sees the stream from the start
+    and one that stops reading early doesn't cut it short for the others.
+
+    Only the call that goes out is rate limited, when a `limiter` is given. A
+    429 drains the limiter for its retry-after and is raised: retrying is up to
+    the caller (afanyi_retrying, packing), so attempts don't multiply across
+    layers. Streams have no caller that retries them, so a stream that got a
+    429 before its first chunk is retried here, up to `rate_limit_retries`
+    times. With coalesce=False every request goes out on its own but is still
+    rate limited.
+    """
+
+    def __init__(self, backend: TranslationBackend, limiter: Optional[RateLimiter] = None, rate_limit_retries: int = 3,
+                 coalesce: bool = True):
+        self.backend = backend
+        self.limiter = limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.coalesce = coalesce
+        self._inflight: Dict[str, Union[Future, _Broadcast]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind, model, messages, params) -> str:
+        payload = json.dumps([kind, model, messages, params], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _join(self, key, make):
+        # (flight, True) when this caller has to make the call
+        if not self.coalesce:
+            count("backend_requests_total", result="called")
+            return make(), True
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                count("backend_requests_total", result="coalesced")
+                return flight, False
+            flight = self._inflight[key] = make()
+        count("backend_requests_total", result="called")
+        return flight, True
+
+    def _land(self, key):
+        if not self.coalesce:
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _call(self, model, messages, params):
+        estimate = estimate_tokens(messages, params.get("max_tokens"))
+        if self.limiter is not None:
+            self.limiter.acquire(estimate)
+        try:
+            response = self.backend.create(model, messages, **params)
+        except RateLimitError as e:
+            # The next call through the limiter, the caller's retry included, waits out retry-after
+            if self.limiter is not None:
+                self.limiter.backoff(retry_after(e))
+            raise
+        if self.limiter is not None:
+            self.limiter.settle(estimate, response.usage)
+        return response
+
+    async def _acall(self, model, messages, params):
+        estimate = estimate_tokens(messages, params.get("max_tokens"))
+        if self.limiter is not None:
+            await self.limiter.aacquire(estimate)
+        try:
+            response = await self.backend.acreate(model, messages, **params)
+        except RateLimitError as e:
+            if self.limiter is not None:
+                self.limiter.backoff(retry_after(e))
+            raise
+        if self.limiter is not None:
+            self.limiter.settle(estimate, response.usage)
+        return response
+
+    def create(self, model, messages, **params):
+        key = self._key("create", model, messages, params)
+        future, leader = self._join(key, Future)
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(self._call(model, messages, params))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._land(key)
+        return future.result()
+
+    async def acreate(self, model, messages, **params):
+        # Sync and async callers share flights; followers may be on other threads and loops
+        key = self._key("create", model, messages, params)
+        future, leader = self._join(key, Future)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            future.set_result(await self._acall(model, messages, params))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._land(key)
+        return future.result()
+
+    def stream(self, model, messages, **params):
+        key = self._key("stream", model, messages, params)
+        broadcast, leader = self._join(key, _Broadcast)
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(key, broadcast, model, messages, params), name="stream-flight", daemon=True
+            ).start()
+        return broadcast.subscribe()
+
+    def _pump(self, key, broadcast, model, messages, params):
+        estimate = estimate_tokens(messages, params.get("max_tokens"))
+        usage = None
+        try:
+            for attempt in range(self.rate_limit_retries + 1):
+                if self.limiter is not None:
+                    self.limiter.acquire(estimate)
+                try:
+                    for chunk in self.backend.stream(model, messages, **params):
+                        usage = getattr(chunk, "usage", None) or usage
+                        broadcast.publish(chunk)
+                    break
+                except RateLimitError as e:
+                    if self.limiter is None:
+                        raise
+                    self.limiter.backoff(retry_after(e))
+                    # Subscribers can't take back chunks they've seen, so only a stream that hadn't started is retried
+                    if broadcast.chunks or attempt == self.rate_limit_retries:
+                        raise
+        except BaseException as e:
+            self._land(key)
+            broadcast.finish(e)
+            return
+        if self.limiter is not None:
+            self.limiter.settle(estimate, usage)
+        self._land(key)
+        broadcast.finish()
+
+
+@lru_cache(maxsize=None)
+def get_backend() -> TranslationBackend:
+    """
+    Process-wide default backend, picked from the environment:
+
+    TRANSLATION_BACKEND=openai (default) or replay
+    TRANSLATION_REPLAY_FILES=path1.json:path2.json (replay only)
+    OPENAI_BASE_URL=http://localhost:8001/v1 (openai only, e.g. the stub server)
+    TRANSLATION_HTTP_CONNECTIONS=32 (openai only, size of the shared connection pool)
+    TRANSLATION_RPM / TRANSLATION_TPM: provider limits to stay under (unset: unlimited)
+    TRANSLATION_COALESCE=off to send concurrent identical requests separately (still rate limited)
+    """
+    dotenv.load_dotenv()
+    kind = os.getenv("TRANSLATION_BACKEND", "openai").lower()
+    if kind == "replay":
+        files = os.getenv("TRANSLATION_REPLAY_FILES")
+        backend = ReplayBackend(files.split(os.pathsep) if files else None)
+    elif kind == "openai":
+        backend = OpenAIBackend(
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            max_connections=int(os.getenv("TRANSLATION_HTTP_CONNECTIONS", "32")),
+        )
+    else:
+        raise ValueError(f"Unknown TRANSLATION_BACKEND: {kind}")
+    coalesce = os.getenv("TRANSLATION_COALESCE", "on").lower() != "off"
+    limiter = get_limiter()
+    if not coalesce and limiter is None:
+        return backend
+    return CoalescingBackend(backend, limiter, coalesce=coalesce)
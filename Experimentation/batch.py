@@ -0,0 +1,233 @@
+"""
+Translate a JSONL file of source segments, with phrase alternatives.
+
+Each input line is an object with an id and a text field (names configurable);
+lines without an id are numbered. Results are appended to the output JSONL as
+they finish and every finished id is recorded in <output>.checkpoint, so
+re-running the same command after a crash picks up where it stopped.
+
+    python -m Experimentation.batch segments.jsonl translations.jsonl --concurrency 8
+
+With --pack-tokens, short segments are sent many to a request (see
+Experimentation.packing), each request filled up to that many tokens.
+"""
+import argparse, asyncio, json, logging, os, sys, time
+from pathlib import Path
+
+from Experimentation.chatcompletion import generate_candidate_sentences, generate_phrase_alternatives, translation_processing
+from Experimentation.document import afanyi_retrying
+from Experimentation.logs import configure_logging
+from Experimentation.nlp import DEFAULT_LANGUAGE
+from Experimentation.packing import DEFAULT_MAX_SEGMENTS, PACK_OVERHEAD, apack_translate, segment_cost
+from Experimentation.tracing import flush, span
+
+logger = logging.getLogger(__name__)
+
+
+def read_segments(path, id_field="id", text_field="text"):
+    # Streamed line by line, so the input can be larger than memory
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get(id_field, line_no)), record[text_field]
+
+
+def load_checkpoint(output_path: Path, checkpoint_path: Path) -> set:
+    """
+    Ids finished by an earlier run. Output lines for ids that never reached the
+    checkpoint (the run died between the two writes) are dropped, as is a
+    half-written last line.
+    """
+    if not checkpoint_path.exists():
+        if output_path.exists() and output_path.stat().st_size:
+            raise SystemExit(f"{output_path} exists but has no checkpoint; refusing to append to it")
+        return set()
+
+    with open(checkpoint_path, encoding="utf-8") as f:
+        done = {line.rstrip("\n") for line in f if line.endswith("\n")}
+
+    if output_path.exists():
+        kept = []
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("id") in done:
+                    kept.append(line if line.endswith("\n") else line + "\n")
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+    return done
+
+
+def read_packs(segments, token_budget, max_segments=DEFAULT_MAX_SEGMENTS):
+    # The same greedy fill as packing.plan_batches, without holding the whole input
+    pack, used = [], PACK_OVERHEAD
+    for segment_id, source in segments:
+        cost = segment_cost(source)
+        if pack and (used + cost > token_budget or len(pack) >= max_segments):
+            yield pack
+            pack, used = [], PACK_OVERHEAD
+        pack.append((segment_id, source))
+        used += cost
+    if pack:
+        yield pack
+
+
+def process_result(segment_id, source, response, with_alternatives=True, translate_to=DEFAULT_LANGUAGE) -> dict:
+    record = {"id": segment_id, "source": source}
+    if isinstance(response, Exception):
+        record["error"] = str(response)
+        return record
+
+    result = translation_processing(response)
+    if not result:
+        record["error"] = "No logprobs in response"
+        return record
+
+    full_sent, table = result
+    record["translation"] = full_sent
+    record["tokens"] = len(table)
+    if response.usage is not None:
+        record["usage"] = {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+        }
+    if with_alternatives:
+        record["candidates"] = generate_candidate_sentences(table)
+        record["phrases"] = generate_phrase_alternatives(full_sent, table, translate_to=translate_to)
+    return record
+
+
+class Throughput:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.segments = 0
+        self.tokens = 0
+        self.errors = 0
+
+    def add(self, record):
+        self.segments += 1
+        self.tokens += record.get("tokens", 0)
+        self.errors += "error" in record
+
+    def report(self, prefix=""):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        print(
+            f"{prefix}{self.segments} segments ({self.errors} failed) in {elapsed:.1f}s: "
+            f"{self.segments / elapsed:.2f} segments/s, {self.tokens / elapsed:.1f} tokens/s",
+            file=sys.stderr,
+        )
+
+
+async def run_batch(input_path, output_path, concurrency=8, retries=3, id_field="id", text_field="text",
+                    with_alternatives=True, report_every=50, pack_tokens=0, **fanyi_kwargs) -> Throughput:
+    output_path = Path(output_path)
+    checkpoint_path = output_path.with_name(output_path.name + ".checkpoint")
+    done = load_checkpoint(output_path, checkpoint_path)
+    if done:
+        print(f"Resuming: {len(done)} segments already translated", file=sys.stderr)
+
+    stats = Throughput()
+    # Bounded, so reading the input never runs far ahead of the workers
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    with open(output_path, "a", encoding="utf-8") as out, open(checkpoint_path, "a", encoding="utf-8") as ckpt:
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                # A pack of (id, source) pairs, or a single one
+                items = item if pack_tokens else [item]
+                with span("translate_request", segment=items[0][0], segments=len(items)):
+                    try:
+                        if pack_tokens:
+                            responses = await apack_translate(
+                                [source for _, source in items], token_budget=pack_tokens,
+                                concurrency=1, retries=retries, **fanyi_kwargs
+                            )
+                        else:
+                            responses = [await afanyi_retrying(items[0][1], retries, **fanyi_kwargs)]
+                    except Exception as e:
+                        # A worker that dies leaves the producer blocked on the full queue
+                        logger.exception("Request for %s failed", items[0][0])
+                        responses = [e] * len(items)
+                    records = []
+                    for (segment_id, source), response in zip(items, responses):
+                        try:
+                            records.append(process_result(
+                                segment_id, source, response, with_alternatives,
+                                fanyi_kwargs.get("translate_to", DEFAULT_LANGUAGE),
+                            ))
+                        except Exception as e:
+                            logger.exception("Processing %s failed", segment_id)
+                            records.append({"id": segment_id, "source": source, "error": str(e)})
+                # Results first, then the checkpoint, so a crash in between only repeats work
+                out.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                out.flush()
+                finished = [record["id"] + "\n" for record in records if "error" not in record]
+                if finished:
+                    ckpt.writelines(finished)
+                    ckpt.flush()
+                    os.fsync(ckpt.fileno())
+                for record in records:
+                    stats.add(record)
+                    if report_every and stats.segments % report_every == 0:
+                        stats.report("... ")
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        todo = (
+            (segment_id, source) for segment_id, source in read_segments(input_path, id_field, text_field)
+            if segment_id not in done
+        )
+        for item in (read_packs(todo, pack_tokens) if pack_tokens else todo):
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    stats.report()
+    flush()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of source segments")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--translate-from", default="Chinese(Simplified)")
+    parser.add_argument("--translate-to", default="English (United Kingdom)")
+    parser.add_argument("--no-alternatives", action="store_true", help="Skip candidate and phrase generation")
+    parser.add_argument("--report-every", type=int, default=50, help="Progress line every N segments")
+    parser.add_argument("--pack-tokens", type=int, default=0,
+                        help="Pack segments into requests of about this many tokens (0: one segment per request)")
+    args = parser.parse_args()
+
+    configure_logging()
+    asyncio.run(run_batch(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        id_field=args.id_field,
+        text_field=args.text_field,
+        with_alternatives=not args.no_alternatives,
+        report_every=args.report_every,
+        pack_tokens=args.pack_tokens,
+        model=args.model,
+        translate_from=args.translate_from,
+        translate_to=args.translate_to,
+    ))
+
+
+if __name__ == "__main__":
+    main()
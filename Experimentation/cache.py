@@ -0,0 +1,154 @@
+import os, json, hashlib, logging, sqlite3, threading, time, unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.result_codec import dump_response, load_response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / ".translation_cache.sqlite3"
+
+
+def normalize_text(text: str) -> str:
+    # Same text typed twice should hit, even if whitespace or Unicode forms differ
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, translate_from: str, translate_to: str, model: str, instruction: str) -> str:
+    payload = json.dumps(
+        [normalize_text(text), translate_from, translate_to, model, instruction],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    Persistent SQLite cache of full chat-completion responses (logprobs included),
+    stored in result_codec's binary form; JSON rows from older caches still load.
+
+    Entries expire after `ttl` seconds; past `max_entries` or `max_bytes` the
+    least recently read entries are evicted first.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10_000, max_bytes: int = 256 * 1024 * 1024):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Streamlit serves sessions from several threads; the lock serializes access
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            if isinstance(row[0], str):
+                return ChatCompletion.model_validate_json(row[0])
+            return load_response(row[0])
+        except Exception:
+            # A corrupt or partly written row is a miss, not a failed translation
+            logger.warning("Dropping unreadable cache entry %s", key, exc_info=True)
+            with self._lock:
+                # Only the row that failed: another thread may have rewritten it meanwhile
+                self._conn.execute("DELETE FROM responses WHERE key = ? AND response = ?", (key, row[0]))
+                self._conn.commit()
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, key: str, response: ChatCompletion):
+        # Called after a paid request succeeded: failing to cache it must not fail the translation
+        try:
+            data = dump_response(response)
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, data, len(data), now, now),
+                )
+                self._evict(now)
+                self._conn.commit()
+        except Exception:
+            logger.warning("Could not cache response %s", getattr(response, "id", "?"), exc_info=True)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least recently used, dropping until both caps are met
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def get_cache() -> Optional[TranslationCache]:
+    """
+    Process-wide cache, configured from the environment:
+
+    TRANSLATION_CACHE=off disables it
+    TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_TTL, TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_CACHE_MAX_BYTES override the defaults
+    """
+    if os.getenv("TRANSLATION_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    settings = {}
+    for name, field, cast in (
+        ("TRANSLATION_CACHE_PATH", "path", str),
+        ("TRANSLATION_CACHE_TTL", "ttl", float),
+        ("TRANSLATION_CACHE_MAX_ENTRIES", "max_entries", int),
+        ("TRANSLATION_CACHE_MAX_BYTES", "max_bytes", int),
+    ):
+        if os.getenv(name):
+            settings[field] = cast(os.getenv(name))
+    return TranslationCache(**settings)
@@ -0,0 +1,80 @@
+import heapq
+from itertools import accumulate
+from operator import itemgetter
+from typing import List, Union
+
+import numpy as np
+
+from Experimentation.logprob_table import LogprobTable, as_table
+
+
+def _branch_points(table: LogprobTable, prob_threshold):
+    # Positions with at least one usable alternative, and the score change of
+    # taking each one instead of the chosen token
+    usable = table.usable_alternatives(prob_threshold)
+    deltas = table.alt_logprobs.astype(np.float64) - table.logprobs[:, None]
+    for i in np.flatnonzero(usable.any(axis=1)):
+        yield int(i), [
+            (table.pool[table.alt_ids[i, j]], float(deltas[i, j]))
+            for j in np.flatnonzero(usable[i])
+        ]
+
+
+def _materialize(original, starts, ends, subs):
+    # subs is a linked list (position, token, parent) ordered from the last
+    # substitution backwards, so the text is spliced right to left
+    parts = []
+    cursor = len(original)
+    while subs is not None:
+        i, token, subs = subs
+        parts.append(original[ends[i]:cursor])
+        parts.append(token)
+        cursor = starts[i]
+    parts.append(original[:cursor])
+    return "".join(reversed(parts)).replace("Ġ", " ").strip()
+
+
+def beam_candidates(logprobs: Union[LogprobTable, List[dict]], beam_width: int = 32, max_substitutions: int = 2,
+                    top_n: int = 20, prob_threshold: float = -1.5) -> List[dict]:
+    """
+    Best-scoring variants of the translation over the top_logprobs lattice.
+
+    Every candidate keeps the chosen token except at up to `max_substitutions`
+    positions, and is scored by its cumulative log-probability. Only positions
+    with an alternative above `prob_threshold` branch; at most `beam_width`
+    partial candidates survive each branch point. Candidates share their
+    substitution prefix as a linked list, so no token list is copied and only
+    the final `top_n` are turned into strings.
+
+    Returns up to min(top_n, beam_width) dicts with "text", "score" and
+    "substitutions" ([(position, token)]), best first, one per distinct text.
+    """
+    table = as_table(logprobs)
+    tokens = table.tokens()
+    original = "".join(tokens)
+    ends = list(accumulate(len(tok) for tok in tokens))
+    starts = [end - len(tok) for end, tok in zip(ends, tokens)]
+
+    # (score, substitutions used, substitution linked list)
+    beam = [(float(table.logprobs.sum(dtype=np.float64)), 0, None)]
+    for i, alts in _branch_points(table, prob_threshold):
+        expanded = list(beam)
+        for score, n_subs, subs in beam:
+            if n_subs < max_substitutions:
+                for token, delta in alts:
+                    expanded.append((score + delta, n_subs + 1, (i, token, subs)))
+        beam = heapq.nlargest(beam_width, expanded, key=itemgetter(0))
+
+    candidates = []
+    seen = set()
+    for score, _, subs in heapq.nlargest(top_n, beam, key=itemgetter(0)):
+        text = _materialize(original, starts, ends, subs)
+        if text in seen:
+            continue
+        seen.add(text)
+        substitutions = []
+        while subs is not None:
+            i, token, subs = subs
+            substitutions.append((i, token))
+        candidates.append({"text": text, "score": score, "substitutions": substitutions[::-1]})
+    return candidates
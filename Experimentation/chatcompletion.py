@@ -1,157 +1,276 @@
-import os, dotenv, json, math
-from openai import OpenAI
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
 from openai.types.chat import ChatCompletion
-import spacy
-
-nlp = spacy.load("en_core_web_sm")
-dotenv.load_dotenv()
-client = OpenAI()
-secret_key = os.getenv("OPENAI_API_KEY")
-if not secret_key:
-    raise ValueError("OPENAI_API_KEY not found in environment.")
-client = OpenAI(api_key=secret_key)
-
-def fanyi(input, model="gpt-4o", translate_from: str = "Chinese(Simplified)"):
-    main_instruction = f"You are a translator and for this task, your objective is to translate from {translate_from} to English (United Kingdom). The response should only contain the translated text."
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": main_instruction},
-            {"role": "user", "content": f"Please Translate:{input}"},
-        ],
-        logprobs=True,
-        top_logprobs=3,
-    )
+
+from Experimentation.backends import TranslationBackend, get_backend
+from Experimentation.candidates import beam_candidates
+from Experimentation.cache import TranslationCache, cache_key, get_cache
+from Experimentation.glossary import Glossary, get_glossary, prompt_terms
+from Experimentation.logprob_table import LogprobTable, as_table
+from Experimentation.logs import configure_logging, debug, debug_enabled
+from Experimentation.languages import USER_TEMPLATE, prompt_template
+from Experimentation.nlp import DEFAULT_LANGUAGE, phrase_chunks
+from Experimentation.tracing import count, record_usage, span
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for "use the shared one", so callers can pass cache=None or glossary=None to go without
+DEFAULT = object()
+
+def build_messages(input, translate_from: str = "Chinese(Simplified)", translate_to: str = "English (United Kingdom)",
+                   terms=None):
+    # The instruction and system message are built once per language pair
+    main_instruction, system_message = prompt_template(translate_from, translate_to)
+    if terms:
+        # Only the glossary terms found in this input, so the prompt grows with the matches, not the glossary
+        main_instruction = f"{main_instruction}\n{prompt_terms(terms)}"
+        system_message = {"role": "system", "content": main_instruction}
+    messages = [
+        system_message,
+        {"role": "user", "content": USER_TEMPLATE.format(input=input)},
+    ]
+    return main_instruction, messages
+
+
+def glossary_terms(input, translate_from, translate_to, glossary=DEFAULT):
+    glossary = get_glossary() if glossary is DEFAULT else glossary
+    return glossary.match(input, translate_from, translate_to) if glossary is not None else []
+
+
+def cache_lookup(cache, key):
+    cached = cache.get(key)
+    count("translation_cache_requests_total", result="miss" if cached is None else "hit")
+    return cached
+
+
+def logprob_count(response):
+    logprobs = response.choices[0].logprobs if response.choices else None
+    return len(logprobs.content) if logprobs and logprobs.content else None
+
+
+def fanyi(input, model="gpt-4o", translate_from: str = "Chinese(Simplified)",
+          translate_to: str = "English (United Kingdom)", backend: TranslationBackend = None,
+          cache: Optional[TranslationCache] = DEFAULT, glossary: Optional[Glossary] = DEFAULT):
+    backend = backend or get_backend()
+    cache = get_cache() if cache is DEFAULT else cache
+    terms = glossary_terms(input, translate_from, translate_to, glossary)
+    main_instruction, messages = build_messages(input, translate_from, translate_to, terms)
+
+    if cache is not None:
+        key = cache_key(input, translate_from, translate_to, model, main_instruction)
+        cached = cache_lookup(cache, key)
+        if cached is not None:
+            return cached
+
+    with span("api_call", model=model):
+        response = backend.create(model=model, messages=messages, logprobs=True, top_logprobs=3)
+    record_usage(response.usage, model, completion_tokens=logprob_count(response))
+    if cache is not None:
+        cache.put(key, response)
     return response
 
 
+async def afanyi(input, model="gpt-4o", translate_from: str = "Chinese(Simplified)",
+                 translate_to: str = "English (United Kingdom)", backend: TranslationBackend = None,
+                 cache: Optional[TranslationCache] = DEFAULT, glossary: Optional[Glossary] = DEFAULT):
+    """Async twin of fanyi() for concurrent callers such as document mode."""
+    backend = backend or get_backend()
+    cache = get_cache() if cache is DEFAULT else cache
+    terms = glossary_terms(input, translate_from, translate_to, glossary)
+    main_instruction, messages = build_messages(input, translate_from, translate_to, terms)
+
+    if cache is not None:
+        key = cache_key(input, translate_from, translate_to, model, main_instruction)
+        cached = cache_lookup(cache, key)
+        if cached is not None:
+            return cached
+
+    with span("api_call", model=model):
+        response = await backend.acreate(model=model, messages=messages, logprobs=True, top_logprobs=3)
+    record_usage(response.usage, model, completion_tokens=logprob_count(response))
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+def token_record(item) -> dict:
+    # Assuming item has fields: token, bytes, logprob, top_logprobs
+    return {
+        "token": item.token,
+        "bytes": item.bytes,
+        "logprob": item.logprob,
+        "top_logprobs": [
+            {"token": alt.token, "logprob": alt.logprob}
+            for alt in item.top_logprobs
+        ] if item.top_logprobs else []
+    }
+
+
+def fanyi_stream(input, model="gpt-4o", translate_from: str = "Chinese(Simplified)",
+                 translate_to: str = "English (United Kingdom)", backend: TranslationBackend = None,
+                 cache: Optional[TranslationCache] = DEFAULT, glossary: Optional[Glossary] = DEFAULT):
+    """
+    Streaming fanyi(): yields (text_delta, token_records) as the model produces
+    them. A cache hit is yielded as a single delta; a finished stream is
+    written back to the cache as a regular ChatCompletion.
+    """
+    backend = backend or get_backend()
+    cache = get_cache() if cache is DEFAULT else cache
+    terms = glossary_terms(input, translate_from, translate_to, glossary)
+    main_instruction, messages = build_messages(input, translate_from, translate_to, terms)
+
+    if cache is not None:
+        key = cache_key(input, translate_from, translate_to, model, main_instruction)
+        cached = cache_lookup(cache, key)
+        if cached is not None:
+            choice = cached.choices[0]
+            # fanyi(), afanyi() and packing also cache responses that carry no logprobs
+            items = choice.logprobs.content if choice.logprobs and choice.logprobs.content else []
+            yield choice.message.content, [token_record(item) for item in items]
+            return
+
+    content = []
+    tokens = []
+    response_id = ""
+    finish_reason = None
+    usage = None
+    # Not activated: the caller's own spans run between our yields
+    with span("api_call", activate=False, model=model, stream=True) as call:
+        for chunk in backend.stream(model=model, messages=messages, logprobs=True, top_logprobs=3):
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            response_id = chunk.id
+            finish_reason = choice.finish_reason or finish_reason
+            items = choice.logprobs.content if choice.logprobs and choice.logprobs.content else []
+            delta = choice.delta.content or ""
+            if not content:
+                call.set(first_chunk_ms=round((time.perf_counter() - call.start) * 1000, 3))
+            content.append(delta)
+            tokens.extend(items)
+            yield delta, [token_record(item) for item in items]
+        call.set(tokens=len(tokens))
+
+    record_usage(usage, model, completion_tokens=len(tokens))
+
+    if cache is not None and finish_reason == "stop":
+        cache.put(key, ChatCompletion.model_validate({
+            "id": response_id,
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": finish_reason,
+                "message": {"role": "assistant", "content": "".join(content)},
+                "logprobs": {"content": [item.model_dump() for item in tokens]},
+            }],
+        }))
+
+
 def translation_processing(response: ChatCompletion):
     full_sent = response.choices[0].message.content
-    logprobs_content = response.choices[0].logprobs.content
 
-    print("Translation:", full_sent)
-    print("\nExtracting logprobs...\n")
-
-    processed_logprobs = []
+    logger.info("Translation: %s", full_sent)
 
     try:
-        for item in logprobs_content:
-            # Assuming item has fields: token, logprob, top_logprobs
-            token_data = {
-                "token": item.token,
-                "logprob": item.logprob,
-                "top_logprobs": [
-                    {"token": alt.token, "logprob": alt.logprob}
-                    for alt in item.top_logprobs
-                ] if item.top_logprobs else []
-            }
-            processed_logprobs.append(token_data)
-
-            # Optional: pretty print each token's info
-            print(f"TOKEN: {item.token}")
-            for alt in token_data["top_logprobs"]:
-                print(f"  Alt: {alt['token']}, logprob: {alt['logprob']:.3f}")
-            print()
-
-    except Exception as e:
-        print(f"Error while processing logprobs: {e}")
+        # A response without logprobs fails here, so a document marks just that sentence as failed
+        logprobs_content = response.choices[0].logprobs.content
+        # Columnar, so long translations don't become lists of nested dicts
+        with span("logprob_extraction", tokens=len(logprobs_content or ())):
+            table = LogprobTable.from_logprobs(logprobs_content)
+    except Exception:
+        logger.warning("Error while processing logprobs", exc_info=True)
         return
 
-    # Return structured logprobs for downstream use
-    return full_sent, processed_logprobs
-
+    # Per-token dump; skipped entirely unless debug is on
+    if debug_enabled(logger):
+        for i in range(len(table)):
+            debug(logger, "TOKEN: %s", table.token(i))
+            for alt_token, alt_logprob in table.alternatives(i):
+                debug(logger, "  Alt: %s, logprob: %.3f", alt_token, alt_logprob)
 
-def generate_candidate_sentences(logprobs, prob_threshold=-1.5):
-    original_tokens = [tok["token"] for tok in logprobs]
-    candidates = set()
-    candidates.add("".join(original_tokens).replace("Ġ", " ").strip())
-
-    for i, tok in enumerate(logprobs):
-        for alt in tok["top_logprobs"]:
-            if alt["token"] != tok["token"] and alt["logprob"] > prob_threshold:
-                # Create a copy of tokens and replace one token with alternative
-                alt_tokens = original_tokens.copy()
-                alt_tokens[i] = alt["token"]
-                alt_sentence = "".join(alt_tokens).replace("Ġ", " ").strip()
-                candidates.add(alt_sentence)
+    # Return structured logprobs for downstream use
+    return full_sent, table
 
-    return list(candidates)
 
+def generate_candidate_sentences(logprobs, prob_threshold=-1.5, beam_width=32, max_substitutions=2, top_n=20):
+    # Best-first sentence variants from a beam search over the top_logprobs lattice
+    with span("candidate_generation", beam_width=beam_width):
+        candidates = beam_candidates(
+            logprobs,
+            beam_width=beam_width,
+            max_substitutions=max_substitutions,
+            top_n=top_n,
+            prob_threshold=prob_threshold,
+        )
+    return [candidate["text"] for candidate in candidates]
 
 
-def extract_phrases(text):
-    doc = nlp(text)
-    return [chunk.text for chunk in doc.noun_chunks]
+def extract_phrases(text, translate_to=DEFAULT_LANGUAGE):
+    return [chunk_text for _, _, chunk_text in phrase_chunks(text, translate_to)]
 
-def generate_phrase_alternatives(full_sent, logprobs, prob_threshold=-10.0):
-    doc = nlp(full_sent)
+def generate_phrase_alternatives(full_sent, logprobs, prob_threshold=-10.0, chunks=None, translate_to=DEFAULT_LANGUAGE):
+    # Parses are cached, so a text already seen by extract_phrases isn't parsed again
+    chunks = chunks if chunks is not None else phrase_chunks(full_sent, translate_to)
 
     output = []
 
-    token_strs = [tok["token"] for tok in logprobs]
-
-    print("\n🔍 OpenAI Tokens:")
-    for idx, tok in enumerate(token_strs):
-        print(f"{idx}: '{tok}'")
+    table = as_table(logprobs)
+    token_strs = table.tokens()
+    usable = table.usable_alternatives(prob_threshold)
+    verbose = debug_enabled(logger)
+
+    # Char span -> token range for every phrase chunk, then the alternatives in it
+    with span("alignment", tokens=len(table)):
+        for start_char, end_char, chunk_text in chunks:
+            if verbose:
+                debug(logger, "Analysing phrase %r: chars %d-%d", chunk_text, start_char, end_char)
+
+            phrase_alts = []
+
+            # Span lookup is a binary search over the table's char offsets
+            lo, hi = table.token_range(start_char, end_char)
+
+            if lo >= hi:
+                if verbose:
+                    debug(logger, "No matching tokens found for phrase %r", chunk_text)
+                output.append({
+                    "original_phrase": chunk_text,
+                    "start_char": start_char,
+                    "end_char": end_char,
+                    "alternatives": ["(Phrase not matched to token span)"]
+                })
+                continue
+
+            phrase_tokens = token_strs[lo:hi]
+            for row, col in zip(*np.nonzero(usable[lo:hi])):
+                alt_tokens = phrase_tokens.copy()
+                alt_tokens[row] = table.pool[table.alt_ids[lo + row, col]]
+                new_phrase = "".join(alt_tokens).replace("Ġ", " ").strip()
+                phrase_alts.append(new_phrase)
+
+            if not phrase_alts:
+                phrase_alts = ["(No good alternatives found)"]
 
-    for chunk in doc.noun_chunks:
-        print(f"\n🧠 Analysing Phrase: '{chunk.text}'")
-        print(f"  → Start Char: {chunk.start_char}, End Char: {chunk.end_char}")
-        print("  → spaCy Tokens:", [t.text for t in chunk])
-
-        phrase_tokens = []
-        phrase_alts = []
-
-        chunk_start = chunk.start_char
-        chunk_end = chunk.end_char
-
-        print("  🧩 Matching tokens in logprobs (by offset):")
-        current_offset = 0
-
-
-        for i, tok in enumerate(token_strs):
-            is_space = tok.startswith("Ġ")
-            tok_text = tok.lstrip("Ġ")
-            effective_tok = (" " if is_space else "") + tok_text
-            tok_len = len(effective_tok)
-
-            print(f"    Token: '{tok}' (offset={current_offset})")
-
-            if chunk_start <= current_offset < chunk_end:
-                print(f"    ✅ Matched token '{tok}' to phrase '{chunk.text}'")
-                phrase_tokens.append((i, tok))
-
-            current_offset += tok_len
-
-        if not phrase_tokens:
-            print("  ⚠️  No matching tokens found for phrase span.")
             output.append({
-                "original_phrase": chunk.text,
-                "alternatives": ["(Phrase not matched to token span)"]
+                "original_phrase": chunk_text,
+                "start_char": start_char,
+                "end_char": end_char,
+                "alternatives": list(set(phrase_alts))
             })
-            continue
-
-        for i, _ in phrase_tokens:
-            tok_log = logprobs[i]
-            for alt in tok_log["top_logprobs"]:
-                if alt["token"] != tok_log["token"] and alt["logprob"] > prob_threshold:
-                    alt_tokens = token_strs.copy()
-                    alt_tokens[i] = alt["token"]
-                    new_phrase = "".join([alt_tokens[j] for j, _ in phrase_tokens]).replace("Ġ", " ").strip()
-                    phrase_alts.append(new_phrase)
-
-        if not phrase_alts:
-            phrase_alts = ["(No good alternatives found)"]
-
-        output.append({
-            "original_phrase": chunk.text,
-            "alternatives": list(set(phrase_alts))
-        })
 
     return output
 
 
 def main():
+    # The CLI shows the translation (INFO) unless told otherwise
+    configure_logging(os.getenv("TRANSLATION_LOG_LEVEL", "INFO"))
     user_input = input("Enter a complete sentence to translate:\n")
     translation_result = fanyi(user_input)
     
@@ -0,0 +1,237 @@
+import asyncio, hashlib, logging, re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from Experimentation.chatcompletion import afanyi, generate_phrase_alternatives, translation_processing
+from Experimentation.logprob_table import LogprobTable
+from Experimentation.nlp import DEFAULT_LANGUAGE, phrase_chunks_many
+from Experimentation.ratelimit import retryable
+from Experimentation.tracing import count
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends: CJK/Latin terminators plus any closing quotes or brackets,
+# a full stop that isn't inside a number (see _full_stop), or a line break
+_CLOSERS = "”’\"'」』）)\\]"
+_BOUNDARY = re.compile(
+    rf"[。！？!?…]+[{_CLOSERS}]*|\.[{_CLOSERS}]*(?=\s|$)|\n"
+)
+_OPENERS = "“‘\"'「『（(["
+# Words a full stop doesn't end a sentence after, compared lowercased
+_ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "e.g", "i.e", "cf", "fig",
+    "inc", "ltd", "co", "corp", "dept", "approx", "jan", "feb", "mar", "apr", "jun", "jul", "aug",
+    "sep", "sept", "oct", "nov", "dec",
+}
+
+
+def _full_stop(text: str, m: re.Match) -> bool:
+    """
+    Whether a "." boundary ends a sentence: it's the end of the text, or the
+    next word starts with an uppercase letter or a CJK character, and the word
+    before isn't an abbreviation or an initial ("Dr. Smith", "J. Smith").
+    """
+    rest = text[m.end():].lstrip().lstrip(_OPENERS)
+    if rest and not (rest[0].isupper() or ord(rest[0]) >= 0x2E80):
+        return False
+    before = text[:m.start()].split()
+    word = before[-1].lstrip(_OPENERS) if before else ""
+    return not (word.lower() in _ABBREVIATIONS or (len(word) == 1 and word.isalpha()))
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """Return (start, end) char spans of the sentences in text, whitespace trimmed."""
+    spans = []
+    start = 0
+    for m in _BOUNDARY.finditer(text):
+        if m.group().startswith(".") and not _full_stop(text, m):
+            continue
+        _add_span(text, start, m.end(), spans)
+        start = m.end()
+    _add_span(text, start, len(text), spans)
+    return spans
+
+
+def _add_span(text, start, end, spans):
+    segment = text[start:end]
+    if segment.strip():
+        spans.append((start + len(segment) - len(segment.lstrip()), start + len(segment.rstrip())))
+
+
+def sentence_key(source: str) -> str:
+    # Whitespace-insensitive, so re-wrapping a paragraph doesn't count as an edit
+    return hashlib.sha1(" ".join(source.split()).encode("utf-8")).hexdigest()
+
+
+def _filler(text: str) -> LogprobTable:
+    # Text the model didn't produce (separators, untranslated sentences) still
+    # gets a token so the document's logprobs cover every character
+    return LogprobTable.from_records([{"token": text, "logprob": 0.0, "top_logprobs": []}])
+
+
+def assemble_document(text: str, spans: List[Tuple[int, int]], results: list) -> dict:
+    """
+    Stitch per-sentence responses back together in source order.
+
+    Each sentence keeps its own LogprobTable ("logprobs", offsets relative to
+    the sentence, which starts at "target_start" in the document). The document
+    "logprobs" table covers the whole translated text, so its char offsets are
+    document offsets; "token_sentence" gives each of its tokens' sentence index
+    (-1 for separators). A sentence whose request failed keeps its source text
+    and an "error". A result that is a sentence dict from an earlier document
+    is reused as it is, with its phrase alternatives if it has them.
+    """
+    if not spans:
+        # Empty or whitespace-only input: an empty document, not a concat of nothing
+        return {
+            "text": "",
+            "sentences": [],
+            "logprobs": LogprobTable.from_records([]),
+            "token_sentence": np.zeros(0, dtype=int),
+        }
+
+    parts = []
+    sentences = []
+    tables = []
+    token_sentence = []
+    offset = 0
+
+    for i, ((start, end), result) in enumerate(zip(spans, results)):
+        if i:
+            sep = "\n" if "\n" in text[spans[i - 1][1]:start] else " "
+            parts.append(sep)
+            tables.append(_filler(sep))
+            token_sentence.append(np.full(1, -1))
+            offset += len(sep)
+
+        error = None
+        processed = None
+        reused = isinstance(result, dict)
+        if reused:
+            processed = result["translation"], result["logprobs"]
+        elif isinstance(result, Exception):
+            error = str(result)
+        else:
+            processed = translation_processing(result)
+            if not processed:
+                error = "No logprobs in response"
+
+        if processed:
+            translated, table = processed
+        else:
+            translated = text[start:end]
+            table = _filler(translated)
+
+        sentence = {
+            "source": text[start:end],
+            "source_start": start,
+            "source_end": end,
+            "translation": translated,
+            "target_start": offset,
+            "target_end": offset + len(translated),
+            "logprobs": table,
+        }
+        if error:
+            sentence["error"] = error
+        if reused and "phrases" in result:
+            sentence["phrases"] = result["phrases"]
+        sentences.append(sentence)
+        parts.append(translated)
+        tables.append(table)
+        token_sentence.append(np.full(len(table), i))
+        offset += len(translated)
+
+    return {
+        "text": "".join(parts),
+        "sentences": sentences,
+        "logprobs": LogprobTable.concat(tables),
+        "token_sentence": np.concatenate(token_sentence) if token_sentence else np.zeros(0, dtype=int),
+    }
+
+
+async def afanyi_retrying(text: str, retries: int = 3, backoff: float = 0.5, **fanyi_kwargs):
+    """
+    afanyi() with up to `retries` retries and exponential backoff; returns the
+    last error instead of raising. Errors a retry can't fix (a bad request, a
+    missing key) are returned at once.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await afanyi(text, **fanyi_kwargs)
+        except Exception as e:
+            if not retryable(e):
+                logger.warning("Not retrying: %s", e)
+                return e
+            if attempt == retries:
+                logger.warning("Giving up after %d attempts: %s", retries + 1, e)
+                return e
+            logger.info("Attempt %d failed, retrying: %s", attempt + 1, e)
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+def reusable_sentences(previous: Optional[dict]) -> dict:
+    """sentence_key -> sentence of an earlier document, for the ones that translated without error."""
+    reusable = {}
+    for sentence in (previous or {}).get("sentences", ()):
+        if "error" not in sentence:
+            reusable.setdefault(sentence_key(sentence["source"]), sentence)
+    return reusable
+
+
+async def atranslate_document(text: str, concurrency: int = 8, retries: int = 3,
+                              backoff: float = 0.5, previous: Optional[dict] = None, **fanyi_kwargs) -> dict:
+    """
+    Translate text sentence by sentence, at most `concurrency` requests in flight.
+
+    Each sentence is retried up to `retries` times with exponential backoff
+    when the error is transient (see ratelimit.retryable); a sentence that fails doesn't sink the rest of the document.
+    With `previous` (an earlier document in the same language pair), only
+    sentences that are new or changed since then are sent; the others are
+    spliced back in from it. Remaining keyword arguments go to afanyi().
+    """
+    spans = split_sentences(text)
+    semaphore = asyncio.Semaphore(concurrency)
+    reusable = reusable_sentences(previous)
+
+    async def translate_one(start, end):
+        kept = reusable.get(sentence_key(text[start:end]))
+        if kept is not None:
+            count("document_sentences_total", result="reused")
+            return kept
+        count("document_sentences_total", result="translated")
+        async with semaphore:
+            return await afanyi_retrying(text[start:end], retries, backoff, **fanyi_kwargs)
+
+    results = await asyncio.gather(*(translate_one(start, end) for start, end in spans))
+    return assemble_document(text, spans, results)
+
+
+def translate_document(text: str, **kwargs) -> dict:
+    return asyncio.run(atranslate_document(text, **kwargs))
+
+
+def document_phrase_alternatives(document: dict, translate_to: str = DEFAULT_LANGUAGE) -> List[dict]:
+    """
+    generate_phrase_alternatives() over every translated sentence, with the
+    sentences parsed together through nlp.pipe. Offsets are into document["text"].
+
+    Each sentence keeps its phrases (offsets relative to the sentence) under
+    "phrases", so sentences reused in a later edit aren't parsed or aligned again.
+    """
+    sentences = [s for s in document["sentences"] if "error" not in s]
+    fresh = [s for s in sentences if "phrases" not in s]
+    chunks = phrase_chunks_many((s["translation"] for s in fresh), translate_to)
+    for sentence, sentence_chunks in zip(fresh, chunks):
+        sentence["phrases"] = generate_phrase_alternatives(
+            sentence["translation"], sentence["logprobs"], chunks=sentence_chunks
+        )
+    output = []
+    for sentence in sentences:
+        for phrase in sentence["phrases"]:
+            output.append({
+                **phrase,
+                "start_char": phrase["start_char"] + sentence["target_start"],
+                "end_char": phrase["end_char"] + sentence["target_start"],
+            })
+    return output
@@ -0,0 +1,273 @@
+"""
+Terminology glossaries.
+
+A glossary is a term base of (source term, target term) entries, loaded once
+per process into an Aho-Corasick automaton over the source terms. Scanning an
+input finds every glossary term in it in one pass, however big the glossary
+is, and only those entries go into the prompt. The matched target terms are
+then checked against the translation and its phrase alternatives.
+
+Term bases are CSV or TSV files with `source` and `target` columns, plus
+optional `translate_from` / `translate_to` columns for entries that only
+apply to one language pair. Latin-script terms match case-insensitively and
+only as whole words; CJK terms match anywhere.
+"""
+import csv, logging, os
+from array import array
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from Experimentation.languages import ALIASES
+
+logger = logging.getLogger(__name__)
+
+# Code points fit in 21 bits, so a transition is keyed by one int: node << 21 | ord(char)
+_SHIFT = 21
+# Most terms a prompt lists; past this the first ones in the text are kept
+MAX_PROMPT_TERMS = 200
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over a list of keys.
+
+    Transitions live in one flat dict and the per-node data in typed arrays,
+    about 100 bytes per trie node (100k terms is on the order of 100 MB).
+    `finditer` reports every occurrence of every key, overlapping or not;
+    `longest` the leftmost-longest non-overlapping ones.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = []
+        self.goto = {}
+        self.depth = array("i", [0])
+        self.key_at = array("i", [-1])  # key ending at the node, or -1
+        for key in keys:
+            self._insert(key)
+        self._link()
+
+    def _insert(self, key: str):
+        index = len(self.keys)
+        self.keys.append(key)
+        if not key:
+            return
+        goto, depth = self.goto, self.depth
+        node = 0
+        for ch in key:
+            k = node << _SHIFT | ord(ch)
+            child = goto.get(k)
+            if child is None:
+                child = goto[k] = len(depth)
+                depth.append(depth[node] + 1)
+                self.key_at.append(-1)
+            node = child
+        if self.key_at[node] < 0:
+            self.key_at[node] = index
+
+    def _link(self):
+        # Breadth first: a node's failure link needs those of every shallower node
+        n = len(self.depth)
+        self.fail = fail = array("i", bytes(4 * n))
+        # Nearest proper suffix node that ends a key, so finditer skips the others
+        self.out = out = array("i", [-1]) * n
+        goto, key_at = self.goto, self.key_at
+        by_depth = sorted(goto.items(), key=lambda item: self.depth[item[1]])
+        for k, child in by_depth:
+            parent, c = k >> _SHIFT, k & ((1 << _SHIFT) - 1)
+            f = 0
+            if parent:
+                f = fail[parent]
+                while True:
+                    nxt = goto.get(f << _SHIFT | c)
+                    if nxt is not None:
+                        f = nxt
+                        break
+                    if f == 0:
+                        break
+                    f = fail[f]
+            fail[child] = f
+            out[child] = f if key_at[f] >= 0 else out[f]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """(start, end, key index) of every key occurrence, in order of end offset."""
+        goto, fail, out, key_at, depth = self.goto, self.fail, self.out, self.key_at, self.depth
+        node = 0
+        for i, ch in enumerate(text):
+            c = ord(ch)
+            while True:
+                nxt = goto.get(node << _SHIFT | c)
+                if nxt is not None:
+                    node = nxt
+                    break
+                if node == 0:
+                    break
+                node = fail[node]
+            m = node if key_at[node] >= 0 else out[node]
+            while m > 0:
+                yield i + 1 - depth[m], i + 1, key_at[m]
+                m = out[m]
+
+    def longest(self, text: str, accept=None) -> List[Tuple[int, int, int]]:
+        """
+        Leftmost-longest non-overlapping occurrences, in one pass over the
+        occurrences plus one over the text. `accept(start, end, key index)` can
+        reject a match (e.g. one that isn't a whole word).
+        """
+        # Longest accepted match starting at each position: end offset and key index
+        best_end = array("i", bytes(4 * (len(text) + 1)))
+        best_key = {}
+        for start, end, index in self.finditer(text):
+            if end > best_end[start] and (accept is None or accept(start, end, index)):
+                best_end[start] = end
+                best_key[start] = index
+        matches = []
+        start = 0
+        while start < len(text):
+            end = best_end[start]
+            if end:
+                matches.append((start, end, best_key[start]))
+                start = end
+            else:
+                start += 1
+        return matches
+
+
+def _wordish(ch: str) -> bool:
+    # Letters and digits of space-separated scripts; CJK terms need no boundaries
+    return ch.isalnum() and ord(ch) < 0x2E80
+
+
+def whole_word(text: str, start: int, end: int) -> bool:
+    if _wordish(text[start]) and start > 0 and _wordish(text[start - 1]):
+        return False
+    if _wordish(text[end - 1]) and end < len(text) and _wordish(text[end]):
+        return False
+    return True
+
+
+def _fold(text: str) -> str:
+    # lower() keeps offsets for everything but a handful of characters; those fall back to exact case
+    folded = text.lower()
+    return folded if len(folded) == len(text) else text
+
+
+def _pair(name: Optional[str]) -> Optional[str]:
+    return ALIASES.get(name, name) if name else None
+
+
+class Glossary:
+    def __init__(self, entries: Iterable[dict]):
+        self.entries = []
+        # Automaton key index -> indexes of the entries with that source term (one per language pair)
+        self.by_key = []
+        key_index = {}
+        for entry in entries:
+            source, target = (entry.get("source") or "").strip(), (entry.get("target") or "").strip()
+            if not source or not target:
+                continue
+            key = _fold(source)
+            if key not in key_index:
+                key_index[key] = len(self.by_key)
+                self.by_key.append([])
+            self.by_key[key_index[key]].append(len(self.entries))
+            self.entries.append({
+                "source": source,
+                "target": target,
+                "translate_from": _pair(entry.get("translate_from")),
+                "translate_to": _pair(entry.get("translate_to")),
+            })
+        self.automaton = Automaton(key_index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def match(self, text: str, translate_from: Optional[str] = None, translate_to: Optional[str] = None) -> List[dict]:
+        """
+        The entries whose source term occurs in `text` for this language pair, in
+        order of first occurrence. Overlapping terms resolve leftmost-longest, so
+        "board" inside "board of directors" isn't listed on its own.
+        """
+        folded = _fold(text)
+        translate_from, translate_to = _pair(translate_from), _pair(translate_to)
+
+        def applies(entry):
+            return (
+                (not translate_from or entry["translate_from"] in (None, translate_from))
+                and (not translate_to or entry["translate_to"] in (None, translate_to))
+            )
+
+        def entry_for(key):
+            # A pair-specific entry wins over one for every pair
+            candidates = [self.entries[i] for i in self.by_key[key] if applies(self.entries[i])]
+            candidates.sort(key=lambda e: (e["translate_from"] is None) + (e["translate_to"] is None))
+            return candidates[0] if candidates else None
+
+        def accept(start, end, key):
+            return whole_word(folded, start, end) and entry_for(key) is not None
+
+        seen = set()
+        matched = []
+        for _, _, key in self.automaton.longest(folded, accept):
+            if key not in seen:
+                seen.add(key)
+                matched.append(entry_for(key))
+        return matched
+
+
+def prompt_terms(terms: List[dict]) -> str:
+    """The glossary part of the system instruction; empty when nothing matched."""
+    if not terms:
+        return ""
+    lines = [f"{t['source']} → {t['target']}" for t in terms[:MAX_PROMPT_TERMS]]
+    return "Use these translations for the following terms:\n" + "\n".join(lines)
+
+
+def load_glossary(path) -> Glossary:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        dialect = "excel-tab" if str(path).endswith((".tsv", ".tab")) else "excel"
+        return Glossary(csv.DictReader(f, dialect=dialect))
+
+
+@lru_cache(maxsize=None)
+def get_glossary() -> Optional[Glossary]:
+    """Process-wide glossary from TRANSLATION_GLOSSARY (term base paths, os.pathsep separated), or None."""
+    paths = os.getenv("TRANSLATION_GLOSSARY")
+    if not paths:
+        return None
+    entries = []
+    for path in paths.split(os.pathsep):
+        entries.extend(load_glossary(path).entries)
+    glossary = Glossary(entries)
+    logger.info("Loaded glossary: %d terms", len(glossary))
+    return glossary
+
+
+def term_counter(targets: List[str]):
+    """
+    A function counting how many of `targets` occur in a text, for checking a
+    translation and its alternatives. The automaton covers just the matched
+    terms, so it is tiny. Targets shared by several entries (synonymous
+    sources) are compiled once and count for every entry that has them.
+    """
+    keys = {}
+    owners = []
+    for i, target in enumerate(targets):
+        key = _fold(target)
+        if key not in keys:
+            keys[key] = len(owners)
+            owners.append([])
+        owners[keys[key]].append(i)
+    automaton = Automaton(keys)
+
+    def present(text: str) -> set:
+        folded = _fold(text)
+        found = set()
+        for start, end, index in automaton.finditer(folded):
+            if whole_word(folded, start, end):
+                found.update(owners[index])
+        return found
+
+    return present
@@ -0,0 +1,75 @@
+"""
+Language registry: how each language is named in prompts, which spaCy
+pipeline parses it and how its translations are chunked into phrases.
+
+Nothing here loads a model. Pipelines are loaded by Experimentation.nlp the
+first time a language is used as a target, so languages nobody selects cost
+nothing at startup.
+"""
+from functools import lru_cache
+from typing import Tuple
+
+# chunking: "noun_chunks"  spaCy's noun chunk iterator (needs a parser)
+#           "pos_runs"     runs of adjective/noun tokens ending in a noun, for languages
+#                          whose spaCy support has a tagger but no noun_chunks (CJK)
+#           "clauses"      punctuation-delimited clauses; the fallback when no pipeline is installed
+LANGUAGES = {
+    "English": {
+        "prompt_name": "English (United Kingdom)",
+        "spacy_model": "en_core_web_sm",
+        "chunking": "noun_chunks",
+    },
+    "Spanish": {
+        "prompt_name": "Spanish",
+        "spacy_model": "es_core_news_sm",
+        "chunking": "noun_chunks",
+    },
+    "French": {
+        "prompt_name": "French",
+        "spacy_model": "fr_core_news_sm",
+        "chunking": "noun_chunks",
+    },
+    "German": {
+        "prompt_name": "German",
+        "spacy_model": "de_core_news_sm",
+        "chunking": "noun_chunks",
+    },
+    "Chinese": {
+        "prompt_name": "Chinese(Simplified)",
+        "spacy_model": "zh_core_web_sm",
+        "chunking": "pos_runs",
+        "style": "Use Simplified Chinese characters and full-width Chinese punctuation.",
+    },
+}
+
+# Names used before the selectors were wired up, still accepted everywhere
+ALIASES = {
+    "English (United Kingdom)": "English",
+    "Chinese(Simplified)": "Chinese",
+    "Chinese (Simplified)": "Chinese",
+}
+
+INSTRUCTION = (
+    "You are a translator and for this task, your objective is to translate from {source} to {target}. "
+    "The response should only contain the translated text."
+)
+USER_TEMPLATE = "Please Translate:{input}"
+
+
+def language(name: str) -> dict:
+    """Settings for a language name or alias; unknown names get a prompt name and clause chunking."""
+    name = ALIASES.get(name, name)
+    return LANGUAGES.get(name) or {"prompt_name": name, "spacy_model": None, "chunking": "clauses"}
+
+
+@lru_cache(maxsize=None)
+def prompt_template(translate_from: str, translate_to: str) -> Tuple[str, dict]:
+    """
+    The system instruction for a language pair and its ready-made system
+    message, built once per pair. Callers must not mutate the message.
+    """
+    target = language(translate_to)
+    instruction = INSTRUCTION.format(source=language(translate_from)["prompt_name"], target=target["prompt_name"])
+    if target.get("style"):
+        instruction += " " + target["style"]
+    return instruction, {"role": "system", "content": instruction}
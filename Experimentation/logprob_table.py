@@ -0,0 +1,247 @@
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from Experimentation.alignment import char_spans
+
+# Padding for rows with fewer than k alternatives
+NO_TOKEN = -1
+NO_LOGPROB = -np.inf
+
+
+class StringPool:
+    """Interns token strings so each distinct token is stored once."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids = {}
+
+    def intern(self, s: str) -> int:
+        idx = self._ids.get(s)
+        if idx is None:
+            idx = self._ids[s] = len(self.strings)
+            self.strings.append(s)
+        return idx
+
+    def __getitem__(self, idx: int) -> str:
+        return self.strings[idx]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class LogprobTable:
+    """
+    Columnar store for one translation's logprobs.
+
+    token_ids   (n,)   chosen token, as an id into `pool`
+    logprobs    (n,)   chosen token logprob
+    alt_ids     (n, k) top_logprobs token ids, NO_TOKEN padded
+    alt_logprobs(n, k) top_logprobs logprobs, -inf padded
+    raw / byte_offsets (n+1,) the UTF-8 text and where each token starts in it
+    char_starts / char_ends (n,) the chars each token covers in `text`
+    """
+
+    def __init__(self, pool: StringPool, token_ids, logprobs, alt_ids, alt_logprobs, raw: bytes, byte_offsets):
+        self.pool = pool
+        self.token_ids = np.asarray(token_ids, dtype=np.int32)
+        self.logprobs = np.asarray(logprobs, dtype=np.float32)
+        n = len(self.token_ids)
+        alt_ids = np.asarray(alt_ids, dtype=np.int32)
+        # Width given by 2-D input; flat input is split evenly (-1 can't be inferred for empty tables)
+        k = alt_ids.shape[1] if alt_ids.ndim == 2 else (alt_ids.size // n if n else 0)
+        self.alt_ids = alt_ids.reshape(n, k)
+        self.alt_logprobs = np.asarray(alt_logprobs, dtype=np.float32).reshape(n, k)
+        self.raw = bytes(raw)
+        self.byte_offsets = np.asarray(byte_offsets, dtype=np.int64)
+        self.text = self.raw.decode("utf-8", errors="replace")
+        self.char_starts, self.char_ends = char_spans(self.raw, self.byte_offsets)
+
+    @classmethod
+    def _build(cls, rows: Iterable[Tuple[str, Optional[list], float, list]], k: int = 0,
+               pool: Optional[StringPool] = None) -> "LogprobTable":
+        pool = pool or StringPool()
+        token_ids, logprobs, alts = [], [], []
+        buf = bytearray()
+        byte_offsets = [0]
+        for token, raw, logprob, top in rows:
+            token_ids.append(pool.intern(token))
+            logprobs.append(logprob)
+            alts.append([(pool.intern(alt_token), alt_logprob) for alt_token, alt_logprob in top])
+            buf.extend(bytes(raw) if raw is not None else token.encode("utf-8"))
+            byte_offsets.append(len(buf))
+
+        k = max([k] + [len(row) for row in alts])
+        alt_ids = np.full((len(alts), k), NO_TOKEN, dtype=np.int32)
+        alt_logprobs = np.full((len(alts), k), NO_LOGPROB, dtype=np.float32)
+        for i, row in enumerate(alts):
+            for j, (alt_id, alt_logprob) in enumerate(row):
+                alt_ids[i, j] = alt_id
+                alt_logprobs[i, j] = alt_logprob
+        return cls(pool, token_ids, logprobs, alt_ids, alt_logprobs, buf, byte_offsets)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], k: int = 0, pool: Optional[StringPool] = None) -> "LogprobTable":
+        """From translation token records ({"token", "bytes", "logprob", "top_logprobs"})."""
+        return cls._build(
+            (
+                (tok["token"], tok.get("bytes"), tok["logprob"],
+                 [(alt["token"], alt["logprob"]) for alt in tok["top_logprobs"]])
+                for tok in records
+            ),
+            k, pool,
+        )
+
+    @classmethod
+    def from_logprobs(cls, content, k: int = 0, pool: Optional[StringPool] = None) -> "LogprobTable":
+        """From a response's choices[0].logprobs.content, without intermediate dicts."""
+        return cls._build(
+            (
+                (item.token, item.bytes, item.logprob,
+                 [(alt.token, alt.logprob) for alt in item.top_logprobs or []])
+                for item in content
+            ),
+            k, pool,
+        )
+
+    @classmethod
+    def concat(cls, tables: List["LogprobTable"]) -> "LogprobTable":
+        """One table over several, with offsets into the concatenated text."""
+        pool = StringPool()
+        k = max([t.alt_ids.shape[1] for t in tables] + [0])
+        token_ids, logprobs, alt_ids, alt_logprobs = [], [], [], []
+        buf = bytearray()
+        byte_offsets = [np.zeros(1, dtype=np.int64)]
+        for t in tables:
+            # Re-intern into the shared pool through a per-table id map
+            remap = np.array([pool.intern(s) for s in t.pool.strings] + [NO_TOKEN], dtype=np.int32)
+            token_ids.append(remap[t.token_ids])
+            logprobs.append(t.logprobs)
+            pad = k - t.alt_ids.shape[1]
+            alt_ids.append(np.pad(remap[t.alt_ids], ((0, 0), (0, pad)), constant_values=NO_TOKEN))
+            alt_logprobs.append(np.pad(t.alt_logprobs, ((0, 0), (0, pad)), constant_values=NO_LOGPROB))
+            byte_offsets.append(t.byte_offsets[1:] + len(buf))
+            buf.extend(t.raw)
+        return cls(
+            pool,
+            np.concatenate(token_ids) if token_ids else [],
+            np.concatenate(logprobs) if logprobs else [],
+            np.concatenate(alt_ids) if alt_ids else np.zeros((0, k)),
+            np.concatenate(alt_logprobs) if alt_logprobs else np.zeros((0, k)),
+            buf,
+            np.concatenate(byte_offsets),
+        )
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def token(self, i: int) -> str:
+        return self.pool[self.token_ids[i]]
+
+    def tokens(self) -> List[str]:
+        strings = self.pool.strings
+        return [strings[i] for i in self.token_ids.tolist()]
+
+    def alternatives(self, i: int) -> List[Tuple[str, float]]:
+        return [
+            (self.pool[alt_id], float(alt_logprob))
+            for alt_id, alt_logprob in zip(self.alt_ids[i].tolist(), self.alt_logprobs[i].tolist())
+            if alt_id != NO_TOKEN
+        ]
+
+    def usable_alternatives(self, prob_threshold: float) -> np.ndarray:
+        """(n, k) mask of alternatives that differ from the chosen token and beat the threshold."""
+        return (
+            (self.alt_ids != NO_TOKEN)
+            & (self.alt_ids != self.token_ids[:, None])
+            & (self.alt_logprobs > prob_threshold)
+        )
+
+    def near_alternatives(self, delta: float) -> np.ndarray:
+        """Positions where some alternative is within `delta` logprob of the chosen token."""
+        mask = self.usable_alternatives(-np.inf) & (self.alt_logprobs >= self.logprobs[:, None] - delta)
+        return np.flatnonzero(mask.any(axis=1))
+
+    def confidence(self) -> dict:
+        """
+        Per-token uncertainty from the top_logprobs distribution, all (n,) float32:
+
+        prob     probability of the chosen token
+        margin   its lead over the best other alternative (negative if one beat it)
+        entropy  in nats, over the top-k plus the unlisted remainder as one outcome,
+                 so a lower bound on the full distribution's entropy
+        """
+        alt_p = np.exp(self.alt_logprobs.astype(np.float64))  # -inf padding -> 0
+        rest = np.clip(1.0 - alt_p.sum(axis=1), 0.0, 1.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            plogp = np.where(alt_p > 0, alt_p * np.log(alt_p), 0.0).sum(axis=1)
+            rlogr = np.where(rest > 0, rest * np.log(rest), 0.0)
+        prob = np.exp(self.logprobs.astype(np.float64))
+        best_other = np.where(self.usable_alternatives(-np.inf), alt_p, 0.0).max(axis=1, initial=0.0)
+        return {
+            "prob": prob.astype(np.float32),
+            "margin": (prob - best_other).astype(np.float32),
+            "entropy": (-(plogp + rlogr)).astype(np.float32),
+        }
+
+    def span_confidence(self, start_chars, end_chars, confidence: Optional[dict] = None) -> dict:
+        """
+        Confidence of char spans (e.g. noun chunks), all (m,) arrays:
+
+        logprob / prob  summed over the span's tokens: the cumulative phrase probability
+        entropy         mean token entropy
+        margin          smallest token margin
+        tokens          how many tokens the span covers; empty spans get prob 1, NaN elsewhere
+        """
+        confidence = confidence if confidence is not None else self.confidence()
+        lo = np.searchsorted(self.char_ends, np.asarray(start_chars), side="right")
+        hi = np.maximum(np.searchsorted(self.char_starts, np.asarray(end_chars), side="left"), lo)
+        n_tokens = hi - lo
+
+        # Prefix sums make every span's total two lookups
+        cum_logprob = np.concatenate([[0.0], np.cumsum(self.logprobs, dtype=np.float64)])
+        cum_entropy = np.concatenate([[0.0], np.cumsum(confidence["entropy"], dtype=np.float64)])
+        logprob = cum_logprob[hi] - cum_logprob[lo]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            entropy = np.where(n_tokens > 0, (cum_entropy[hi] - cum_entropy[lo]) / n_tokens, np.nan)
+
+        # reduceat over interleaved (lo, hi) pairs: every even slot is min(margin[lo:hi])
+        margin = np.full(len(lo), np.nan, dtype=np.float64)
+        if len(lo) and len(self):
+            padded = np.append(confidence["margin"].astype(np.float64), np.inf)
+            bounds = np.stack([lo, hi], axis=1).ravel()
+            margin = np.where(n_tokens > 0, np.minimum.reduceat(padded, bounds)[::2], np.nan)
+
+        return {
+            "logprob": logprob,
+            "prob": np.exp(logprob),
+            "entropy": entropy,
+            "margin": margin,
+            "tokens": n_tokens,
+        }
+
+    def token_range(self, start_char: int, end_char: int) -> Tuple[int, int]:
+        """Return (lo, hi) so tokens lo..hi-1 overlap chars [start_char, end_char)."""
+        lo = int(np.searchsorted(self.char_ends, start_char, side="right"))
+        hi = int(np.searchsorted(self.char_starts[lo:], end_char, side="left")) + lo
+        return lo, hi
+
+    def to_records(self) -> List[dict]:
+        buf = self.raw
+        offsets = self.byte_offsets.tolist()
+        return [
+            {
+                "token": self.token(i),
+                "bytes": list(buf[offsets[i]:offsets[i + 1]]),
+                "logprob": float(self.logprobs[i]),
+                "top_logprobs": [{"token": t, "logprob": lp} for t, lp in self.alternatives(i)],
+            }
+            for i in range(len(self))
+        ]
+
+
+def as_table(logprobs) -> LogprobTable:
+    """Accept either a LogprobTable or a list of token records."""
+    if isinstance(logprobs, LogprobTable):
+        return logprobs
+    return LogprobTable.from_records(logprobs)
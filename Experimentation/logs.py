@@ -0,0 +1,57 @@
+"""
+Leveled logging for the translation pipeline.
+
+Modules log through standard `logging` loggers named after the module. The
+token- and phrase-level diagnostics are DEBUG and are guarded by
+`debug_enabled()`, so with debug off the hot loops skip them before any
+formatting happens. Debug can be turned on globally (TRANSLATION_LOG_LEVEL=DEBUG)
+or for a single request, whatever the configured level:
+
+    with request_debug():
+        translation_processing(response)
+"""
+import os, logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_request_debug: ContextVar[bool] = ContextVar("translation_request_debug", default=False)
+
+
+def debug_enabled(logger: logging.Logger) -> bool:
+    """Check once, outside a loop, whether debug records would go anywhere."""
+    return _request_debug.get() or logger.isEnabledFor(logging.DEBUG)
+
+
+def debug(logger: logging.Logger, msg: str, *args):
+    """
+    logger.debug() that also gets through when debug is on for the current
+    request only. Arguments are formatted by the handler, not here.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args, stacklevel=2)
+    elif _request_debug.get():
+        # Logger level is above DEBUG: build the record ourselves and hand it
+        # to the handlers, which don't filter on the logger's level
+        fn, lno, func, _ = logger.findCaller(stacklevel=2)
+        logger.handle(logger.makeRecord(logger.name, logging.DEBUG, fn, lno, msg, args, None, func))
+
+
+@contextmanager
+def request_debug(enabled: bool = True):
+    """Turn debug diagnostics on (or off) for code run inside the block, including tasks it starts."""
+    token = _request_debug.set(enabled)
+    try:
+        yield
+    finally:
+        _request_debug.reset(token)
+
+
+def configure_logging(level=None):
+    """
+    Send log records to stderr at `level` (default TRANSLATION_LOG_LEVEL, else
+    WARNING). Does nothing if the root logger already has handlers.
+    """
+    level = level or os.getenv("TRANSLATION_LOG_LEVEL", "WARNING")
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level, format=LOG_FORMAT)
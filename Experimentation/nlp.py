@@ -0,0 +1,189 @@
+import logging, os, re, threading
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+import spacy
+from spacy.tokens import Doc
+
+from Experimentation.languages import language
+from Experimentation.tracing import span
+
+logger = logging.getLogger(__name__)
+
+SPACY_MODEL = "en_core_web_sm"
+DEFAULT_LANGUAGE = "English"
+# noun_chunks only need the tagger (POS via attribute_ruler) and the parser
+UNUSED_COMPONENTS = ["ner", "lemmatizer", "textcat", "senter"]
+# Pipelines kept loaded at once; past this the least recently used one is dropped
+MAX_PIPELINES = int(os.getenv("TRANSLATION_NLP_MAX_PIPELINES", "2"))
+
+_pipelines = OrderedDict()
+_pipelines_lock = threading.Lock()
+# Held only while loading, so lookups of resident pipelines never wait on a load
+_load_lock = threading.Lock()
+_missing_models = set()
+
+
+def get_nlp(model: str = SPACY_MODEL):
+    """
+    The spaCy pipeline for `model`, loaded on first use without unused
+    components. At most MAX_PIPELINES stay resident; evicting one also drops
+    its cached Docs.
+    """
+    with _pipelines_lock:
+        nlp = _pipelines.get(model)
+        if nlp is not None:
+            _pipelines.move_to_end(model)
+            return nlp
+    with _load_lock:
+        with _pipelines_lock:
+            nlp = _pipelines.get(model)
+        if nlp is None:
+            nlp = spacy.load(model, exclude=UNUSED_COMPONENTS)
+        with _pipelines_lock:
+            _pipelines[model] = nlp
+            _pipelines.move_to_end(model)
+            evicted = []
+            while len(_pipelines) > max(MAX_PIPELINES, 1):
+                evicted.append(_pipelines.popitem(last=False)[0])
+    for old in evicted:
+        _docs.drop(old)
+        logger.info("Unloaded spaCy pipeline %s", old)
+    return nlp
+
+
+def model_available(model: str) -> bool:
+    """Whether `model` loads; a missing one is reported once and then skipped."""
+    if model in _missing_models:
+        return False
+    try:
+        get_nlp(model)
+        return True
+    except OSError as e:
+        _missing_models.add(model)
+        logger.warning("spaCy pipeline %s is not installed, phrases fall back to clauses: %s", model, e)
+        return False
+
+
+class DocCache:
+    """Small thread-safe LRU of parsed Docs keyed by (model, text)."""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+            return doc
+
+    def put(self, key, doc: Doc):
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.maxsize:
+                self._docs.popitem(last=False)
+
+    def drop(self, model: str):
+        with self._lock:
+            for key in [k for k in self._docs if k[0] == model]:
+                del self._docs[key]
+
+
+_docs = DocCache()
+
+
+def parse(text: str, model: str = SPACY_MODEL) -> Doc:
+    doc = _docs.get((model, text))
+    if doc is None:
+        with span("spacy_parse", texts=1):
+            doc = get_nlp(model)(text)
+        _docs.put((model, text), doc)
+    return doc
+
+
+def parse_many(texts: Iterable[str], model: str = SPACY_MODEL, batch_size: int = 64) -> List[Doc]:
+    """Parse several texts, sending only the uncached ones through nlp.pipe in batches."""
+    texts = list(texts)
+    docs = [_docs.get((model, text)) for text in texts]
+    missing = [i for i, doc in enumerate(docs) if doc is None]
+    if missing:
+        with span("spacy_parse", texts=len(missing)):
+            piped = get_nlp(model).pipe((texts[i] for i in missing), batch_size=batch_size)
+            for i, doc in zip(missing, piped):
+                docs[i] = doc
+                _docs.put((model, texts[i]), doc)
+    return docs
+
+
+# Phrase chunking. A chunk is (start_char, end_char, text); which chunker a
+# language uses is its "chunking" setting in Experimentation.languages.
+
+NOUN_POS = {"NOUN", "PROPN"}
+# Tokens a pos_runs chunk may contain; it has to end on a noun
+RUN_POS = NOUN_POS | {"ADJ", "NUM"}
+# Clause boundaries for both Latin and CJK punctuation
+CLAUSE = re.compile(r"[^,.;:!?()\"\n，。；：！？、（）「」“”]+")
+
+Chunk = Tuple[int, int, str]
+
+
+def pos_runs(doc: Doc) -> List[Chunk]:
+    """Maximal runs of adjective/number/noun tokens, trimmed to end on a noun."""
+    chunks = []
+    start = end = None
+    for token in list(doc) + [None]:
+        if token is not None and token.pos_ in RUN_POS:
+            if start is None:
+                start = token.idx
+            if token.pos_ in NOUN_POS:
+                end = token.idx + len(token.text)
+            continue
+        if start is not None and end is not None:
+            chunks.append((start, end, doc.text[start:end]))
+        start = end = None
+    return chunks
+
+
+def clause_chunks(text: str) -> List[Chunk]:
+    """Punctuation-delimited clauses, stripped of surrounding whitespace."""
+    chunks = []
+    for match in CLAUSE.finditer(text):
+        clause = match.group(0)
+        stripped = clause.strip()
+        if stripped and not stripped.isdigit():
+            start = match.start() + len(clause) - len(clause.lstrip())
+            chunks.append((start, start + len(stripped), stripped))
+    return chunks
+
+
+def doc_chunks(doc: Doc, chunking: str = "noun_chunks") -> List[Chunk]:
+    if chunking == "noun_chunks":
+        try:
+            return [(c.start_char, c.end_char, c.text) for c in doc.noun_chunks]
+        except NotImplementedError:
+            # The language has no noun_chunks iterator
+            pass
+    return pos_runs(doc)
+
+
+def phrase_chunks(text: str, translate_to: str = DEFAULT_LANGUAGE) -> List[Chunk]:
+    """Phrases of a `translate_to` text, chunked the way that language is configured to be."""
+    settings = language(translate_to)
+    model = settings["spacy_model"]
+    if settings["chunking"] == "clauses" or not model or not model_available(model):
+        return clause_chunks(text)
+    return doc_chunks(parse(text, model), settings["chunking"])
+
+
+def phrase_chunks_many(texts: Iterable[str], translate_to: str = DEFAULT_LANGUAGE) -> List[List[Chunk]]:
+    """phrase_chunks() over several texts, parsed together through nlp.pipe."""
+    texts = list(texts)
+    settings = language(translate_to)
+    model = settings["spacy_model"]
+    if settings["chunking"] == "clauses" or not model or not model_available(model):
+        return [clause_chunks(text) for text in texts]
+    return [doc_chunks(doc, settings["chunking"]) for doc in parse_many(texts, model)]
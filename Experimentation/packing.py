@@ -0,0 +1,282 @@
+"""
+Packed translation: many short segments (UI strings, subtitles) in one request.
+
+Segments are numbered with markers (⟦1⟧ text ⟦2⟧ text ...) and the model is
+asked to answer in the same shape. The reply is split on the markers, and each
+segment gets its own ChatCompletion carrying just its slice of the logprobs,
+so everything downstream (translation_processing, the translation cache,
+phrase alternatives) treats it exactly like a single-segment response.
+Segments whose marker is missing, repeated or empty fall back to one
+afanyi() call each. A packed request that keeps failing with a transient
+error (see ratelimit.retryable) fails its segments instead, so the retries
+don't start over for each of them.
+
+Batches are sized against a token budget (prompt plus expected completion),
+so each request carries as many segments as fit.
+"""
+import asyncio, logging, re
+from typing import List, Optional, Union
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.backends import TranslationBackend, get_backend
+from Experimentation.cache import TranslationCache, cache_key, get_cache
+from Experimentation.chatcompletion import DEFAULT, build_messages, glossary_terms, logprob_count
+from Experimentation.document import afanyi_retrying
+from Experimentation.glossary import prompt_terms
+from Experimentation.languages import language
+from Experimentation.ratelimit import estimate_tokens, retryable
+from Experimentation.tracing import count, record_usage, span
+
+logger = logging.getLogger(__name__)
+
+PACK_INSTRUCTION = (
+    "You are a translator. Translate each numbered segment below from {source} to {target}, "
+    "independently of the others. Reply with the translation of every segment, each starting with "
+    "its marker exactly as given (⟦1⟧, ⟦2⟧, ...), in the same order and nothing else."
+)
+MARKER = re.compile(r"⟦(\d+)⟧")
+# Tokens per request, prompt and completion together; about what one round trip amortises well
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_MAX_SEGMENTS = 50
+
+
+def segment_cost(segment: str) -> int:
+    # The rate limiter's estimate: source in and about as much out; its per-message allowance covers the marker
+    return estimate_tokens([{"content": segment}])
+
+
+# The instruction, sent once per request and not answered
+PACK_OVERHEAD = estimate_tokens([{"role": "system", "content": PACK_INSTRUCTION}], max_tokens=0)
+
+
+def plan_batches(segments: List[str], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS) -> List[List[int]]:
+    """
+    Greedy, in order: indexes of the segments that go together in each request.
+    A segment that alone exceeds the budget gets a request to itself.
+    """
+    overhead = PACK_OVERHEAD
+    batches, current, used = [], [], overhead
+    for i, segment in enumerate(segments):
+        cost = segment_cost(segment)
+        if current and (used + cost > token_budget or len(current) >= max_segments):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def pack_instruction(translate_from: str, translate_to: str, terms=None) -> str:
+    instruction = PACK_INSTRUCTION.format(
+        source=language(translate_from)["prompt_name"], target=language(translate_to)["prompt_name"]
+    )
+    style = language(translate_to).get("style")
+    if style:
+        instruction += " " + style
+    if terms:
+        instruction += "\n" + prompt_terms(terms)
+    return instruction
+
+
+def build_packed_messages(segments: List[str], translate_from: str, translate_to: str, terms=None):
+    instruction = pack_instruction(translate_from, translate_to, terms)
+    content = "\n".join(f"⟦{i}⟧ {segment}" for i, segment in enumerate(segments, 1))
+    return [{"role": "system", "content": instruction}, {"role": "user", "content": content}]
+
+
+def split_packed(text: str, n: int, complete: bool = True) -> dict:
+    """
+    {segment number (1-based): (start, end)} char spans of the translations in
+    a packed reply, whitespace trimmed. Numbers that are missing, out of range,
+    repeated or empty are left out, and so is a segment not followed by the
+    next number's marker: where it ends is a guess (the model may have merged
+    the next segment into it). With complete=False (the reply was cut off),
+    the segment running to the end of the reply is left out too.
+    """
+    markers = list(MARKER.finditer(text))
+    numbers = [int(m.group(1)) for m in markers]
+    spans = {}
+    for k, m in enumerate(markers):
+        number = numbers[k]
+        following = numbers[k + 1] if k + 1 < len(numbers) else None
+        if not 1 <= number <= n or numbers.count(number) > 1:
+            continue
+        if following != (number + 1 if number < n else None):
+            continue
+        if k + 1 == len(markers) and not complete:
+            continue
+        start = m.end()
+        end = markers[k + 1].start() if k + 1 < len(markers) else len(text)
+        piece = text[start:end]
+        if not piece.strip():
+            continue
+        start += len(piece) - len(piece.lstrip())
+        end = start + len(piece.strip())
+        spans[number] = (start, end)
+    return spans
+
+
+def _slice_tokens(items: List[dict], raw: bytes, byte_start: int, byte_end: int) -> List[dict]:
+    """
+    The token records covering bytes [byte_start, byte_end) of the reply. A
+    token straddling the edge is cut to the part inside; it keeps its
+    alternatives only if what was cut off is whitespace (" Hello" after a
+    marker), with the same whitespace trimmed from them.
+    """
+    sliced = []
+    offset = 0
+    for item in items:
+        token_bytes = bytes(item["bytes"]) if item.get("bytes") is not None else item["token"].encode("utf-8")
+        a, b = offset, offset + len(token_bytes)
+        offset = b
+        if b <= byte_start or a >= byte_end:
+            continue
+        lo, hi = max(a, byte_start), min(b, byte_end)
+        if (lo, hi) == (a, b):
+            sliced.append(item)
+            continue
+        cut = token_bytes[lo - a:hi - a]
+        dropped = token_bytes[:lo - a] + token_bytes[hi - a:]
+        alternatives = []
+        if hi == b and not dropped.strip():
+            alternatives = [
+                {**alt, "token": alt["token"].lstrip(), "bytes": None} for alt in item["top_logprobs"]
+            ]
+        sliced.append({
+            "token": cut.decode("utf-8", errors="replace"),
+            "bytes": list(cut),
+            "logprob": item["logprob"],
+            "top_logprobs": alternatives,
+        })
+    return sliced
+
+
+def unpack_response(response: ChatCompletion, n: int) -> dict:
+    """
+    {segment index (0-based): ChatCompletion with just that segment's text and
+    logprobs}. A segment is only returned once its end is known, so each one
+    finished with "stop"; if the packed reply didn't (it hit max_tokens), its
+    last segment is left out.
+    """
+    choice = response.choices[0]
+    items = [item.model_dump() for item in (choice.logprobs.content if choice.logprobs else None) or ()]
+    raw = b"".join(
+        bytes(item["bytes"]) if item.get("bytes") is not None else item["token"].encode("utf-8") for item in items
+    )
+    # Offsets come from the tokens, so the text is rebuilt from them rather than taken from the message
+    text = raw.decode("utf-8", errors="replace") if items else (choice.message.content or "")
+    responses = {}
+    for number, (start, end) in split_packed(text, n, complete=choice.finish_reason == "stop").items():
+        byte_start, byte_end = len(text[:start].encode("utf-8")), len(text[:end].encode("utf-8"))
+        tokens = _slice_tokens(items, raw, byte_start, byte_end) if items else []
+        responses[number - 1] = ChatCompletion.model_validate({
+            "id": f"{response.id}-{number}",
+            "object": "chat.completion",
+            "created": response.created,
+            "model": response.model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": text[start:end]},
+                "logprobs": {"content": tokens} if items else None,
+            }],
+        })
+    return responses
+
+
+async def apack_translate(segments: List[str], model: str = "gpt-4o", translate_from: str = "Chinese(Simplified)",
+                          translate_to: str = "English (United Kingdom)", backend: TranslationBackend = None,
+                          cache: Optional[TranslationCache] = DEFAULT, glossary=DEFAULT,
+                          token_budget: int = DEFAULT_TOKEN_BUDGET, max_segments: int = DEFAULT_MAX_SEGMENTS,
+                          concurrency: int = 4, retries: int = 3) -> List[Union[ChatCompletion, Exception]]:
+    """
+    Translate `segments` in packed requests, at most `concurrency` in flight.
+    Returns one response (or the final error) per segment, in order. Segments
+    already in the translation cache, from fanyi() or an earlier packed run,
+    aren't sent. Split results are cached under a key built from the packed
+    instruction, never under fanyi()'s: they come from a different prompt and
+    tokens cut at a marker lose their alternatives.
+    """
+    backend = backend or get_backend()
+    cache = get_cache() if cache is DEFAULT else cache
+    results: List[Optional[Union[ChatCompletion, Exception]]] = [None] * len(segments)
+    terms = [glossary_terms(s, translate_from, translate_to, glossary) for s in segments]
+    keys = []
+    for i, segment in enumerate(segments):
+        keys.append(cache_key(segment, translate_from, translate_to, model,
+                              pack_instruction(translate_from, translate_to, terms[i])))
+        if cache is None:
+            continue
+        instruction, _ = build_messages(segment, translate_from, translate_to, terms[i])
+        single_key = cache_key(segment, translate_from, translate_to, model, instruction)
+        cached = cache.get(single_key) or cache.get(keys[i])
+        count("translation_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            count("packed_segments_total", result="cached")
+            results[i] = cached
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    semaphore = asyncio.Semaphore(concurrency)
+    fanyi_kwargs = dict(model=model, translate_from=translate_from, translate_to=translate_to,
+                        backend=backend, cache=cache, glossary=glossary)
+
+    async def translate_batch(batch: List[int]):
+        batch_terms = {id(t): t for i in batch for t in terms[i]}
+        messages = build_packed_messages([segments[i] for i in batch], translate_from, translate_to,
+                                         list(batch_terms.values()))
+        unpacked = {}
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    with span("packed_call", model=model, segments=len(batch)):
+                        response = await backend.acreate(model=model, messages=messages, logprobs=True, top_logprobs=3)
+                    record_usage(response.usage, model, completion_tokens=logprob_count(response))
+                    unpacked = unpack_response(response, len(batch))
+                    break
+                except Exception as e:
+                    logger.info("Packed request attempt %d failed: %s", attempt + 1, e)
+                    if not retryable(e):
+                        # Possibly the packed prompt itself (too long, malformed): single requests may still work
+                        break
+                    if attempt == retries:
+                        # Still rate limited or unreachable: retrying every segment alone would only multiply calls
+                        logger.warning("Giving up on %d packed segments after %d attempts: %s",
+                                       len(batch), retries + 1, e)
+                        for i in batch:
+                            count("packed_segments_total", result="failed")
+                            results[i] = e
+                        return
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+
+        missing = []
+        for position, i in enumerate(batch):
+            response = unpacked.get(position)
+            if response is None:
+                missing.append(i)
+                continue
+            count("packed_segments_total", result="packed")
+            results[i] = response
+            if cache is not None:
+                cache.put(keys[i], response)
+        if missing:
+            logger.info("Split failed for %d of %d segments, translating them one by one", len(missing), len(batch))
+        # Not packed: the usual single-segment path, with its own retries, under the same concurrency cap
+        async def fallback(i):
+            async with semaphore:
+                return await afanyi_retrying(segments[i], retries, **fanyi_kwargs)
+
+        for i, response in zip(missing, await asyncio.gather(*(fallback(i) for i in missing))):
+            count("packed_segments_total", result="fallback")
+            results[i] = response
+
+    batches = plan_batches([segments[i] for i in pending], token_budget, max_segments)
+    await asyncio.gather(*(translate_batch([pending[j] for j in batch]) for batch in batches))
+    return results
+
+
+def pack_translate(segments: List[str], **kwargs) -> List[Union[ChatCompletion, Exception]]:
+    return asyncio.run(apack_translate(segments, **kwargs))
@@ -1,21 +1,15 @@
-import os
-import dotenv
-from openai import OpenAI
+from Experimentation.backends import TranslationBackend, get_backend
 
-dotenv.load_dotenv()
-client = OpenAI()
-secret_key = os.getenv("OPENAI_API_KEY")
 
-
-def test_prompt(prompt, model="gpt-4.1"):
-    response = client.chat.completions.create(
+def test_prompt(prompt, model="gpt-4.1", backend: TranslationBackend = None):
+    response = (backend or get_backend()).create(
         model=model, messages=[{"role": "user", "content": prompt}]
     )
     return response
 
 
-def mandarin_to_eng(input, model="gpt-4.1"):
-    response = client.chat.completions.create(
+def mandarin_to_eng(input, model="gpt-4.1", backend: TranslationBackend = None):
+    response = (backend or get_backend()).create(
         model=model,
         messages=[{"role": "user", "content": f"Translate to English: {input}"}],
     )
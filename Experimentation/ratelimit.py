@@ -0,0 +1,123 @@
+"""
+Token-bucket limits for the provider's requests-per-minute and
+tokens-per-minute quotas.
+
+A call reserves one request and its estimated tokens up front and waits
+until both buckets can cover them; reservations may overdraw a bucket, which
+just makes later callers wait longer. Once the real usage is known,
+`settle()` corrects the token bucket, and a 429 that slips through drains
+both buckets for the provider's retry-after.
+"""
+import asyncio, json, os, threading, time
+from typing import List, Optional
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from Experimentation.tracing import METRICS, count
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` now; the seconds until the bucket is no longer overdrawn."""
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float, now: float):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds: float, now: float):
+        # Empty enough that the next reservation waits at least `seconds`
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.rate)
+
+
+def estimate_tokens(messages: List[dict], max_tokens: Optional[int] = None) -> int:
+    """
+    Rough prompt + completion size, before the real usage is known. About four
+    UTF-8 bytes per token covers both Latin text and CJK (three bytes a
+    character); a translation is assumed to be about as long as its prompt.
+    """
+    prompt = sum(len(json.dumps(m.get("content", ""), ensure_ascii=False).encode("utf-8")) for m in messages) // 4
+    prompt += 4 * len(messages)
+    return prompt + (max_tokens if max_tokens is not None else prompt)
+
+
+class RateLimiter:
+    """RPM and TPM buckets shared by every caller in the process; either may be None (unlimited)."""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = self.requests.reserve(1, now) if self.requests else 0.0
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+        if wait > 0:
+            count("rate_limit_waits_total")
+        METRICS.observe("rate_limit_wait", wait)
+        return wait
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, usage):
+        """Give back (or take) the difference between the estimate and the response's usage."""
+        if self.tokens is None or usage is None or not usage.total_tokens:
+            return
+        with self._lock:
+            self.tokens.adjust(estimated - usage.total_tokens, time.monotonic())
+
+    def backoff(self, seconds: float):
+        """The provider said 429: make everyone wait out its retry-after."""
+        count("rate_limit_waits_total", reason="429")
+        now = time.monotonic()
+        with self._lock:
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain(seconds, now)
+
+
+def retry_after(error, default: float = 1.0) -> float:
+    # openai.RateLimitError carries the HTTP response and its retry-after header
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def retryable(error: BaseException) -> bool:
+    """Whether trying again can help: a 429, a timeout, a dropped connection or a 5xx. Not a 400 or a missing key."""
+    if isinstance(error, (RateLimitError, APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def get_limiter() -> Optional[RateLimiter]:
+    """TRANSLATION_RPM / TRANSLATION_TPM from the environment; None when neither is set."""
+    rpm = float(os.getenv("TRANSLATION_RPM", "0") or 0)
+    tpm = float(os.getenv("TRANSLATION_TPM", "0") or 0)
+    return RateLimiter(rpm, tpm) if rpm or tpm else None
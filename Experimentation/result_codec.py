@@ -0,0 +1,231 @@
+"""
+Compact binary form of a translation result: the text, its LogprobTable and
+the response metadata, for the cache and anything else that persists or ships
+results. The JSON a response dumps to repeats every token's bytes and its
+top_logprobs dicts; here each distinct token string is stored once, logprobs
+are float32 (or float16) columns, token lengths are varints, and the body can
+optionally be zstd-compressed (`pip install zstandard`).
+
+Layout, little-endian:
+
+    header   magic, version, flags, n tokens, k alternatives, n strings,
+             then (offset, length) of each section in the body
+    body     meta       JSON: id, model, created, finish_reason, usage
+             strings    varint UTF-8 lengths, then the concatenated strings
+             token_ids  (n,) int32            ids into strings
+             logprobs   (n,) float32/float16
+             alt_ids    (n, k) int32          NO_TOKEN padded
+             alt_logprobs (n, k) float32/float16
+             lengths    (n,) varint           bytes per token
+             raw        the UTF-8 text the tokens cover
+
+Sections start on 8-byte boundaries, so an uncompressed float32 result is
+read in place: load_result() over a mmap (open_result) makes the arrays views
+of the file rather than copies.
+"""
+import json, mmap, struct
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from openai.types.chat import ChatCompletion
+
+from Experimentation.logprob_table import LogprobTable, StringPool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"TRLP"
+VERSION = 1
+HALF = 1          # logprobs stored as float16
+COMPRESSED = 2    # body is one zstd frame
+NO_LOGPROBS = 4   # the response carried no logprobs; only the meta is meaningful
+
+SECTIONS = ("meta", "strings", "token_ids", "logprobs", "alt_ids", "alt_logprobs", "lengths", "raw")
+HEADER = struct.Struct("<4sBBxxIII" + "QQ" * len(SECTIONS) + "4x")
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def encode_varints(values) -> bytes:
+    """LEB128 for non-negative ints, one numpy pass per byte position."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.concatenate([[0], np.cumsum(nbytes)[:-1]])
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for j in range(int(nbytes.max())):
+        sel = nbytes > j
+        low = (values[sel] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (nbytes[sel] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + j] = (low | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data) -> np.ndarray:
+    b = np.frombuffer(data, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    last = (b & 0x80) == 0
+    starts = np.concatenate([[0], np.flatnonzero(last)[:-1] + 1])
+    group = np.concatenate([[0], np.cumsum(last)[:-1]])
+    shift = (np.arange(len(b)) - starts[group]) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+def _encode_strings(strings) -> bytes:
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+    return encode_varints([len(e) for e in encoded]) + b"".join(encoded)
+
+
+def _decode_strings(data, n: int) -> list:
+    data = bytes(data)
+    # The lengths come first; each varint ends on a byte below 0x80
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) < 0x80)
+    prefix = int(ends[n - 1]) + 1 if n else 0
+    offsets = np.concatenate([[prefix], prefix + np.cumsum(decode_varints(data[:prefix]))]).tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8", "surrogatepass") for i in range(n)]
+
+
+def dump_result(text: Optional[str], table: Optional[LogprobTable], meta: Optional[dict] = None,
+                half: bool = False, compress: bool = False) -> bytes:
+    """
+    Encode translation_processing's (full_sent, table), plus `meta`. float16
+    (`half`) halves the logprob columns at about three significant digits.
+    """
+    if compress and zstandard is None:
+        raise ImportError("zstd compression needs the zstandard package")
+    flags = (HALF if half else 0) | (COMPRESSED if compress else 0)
+    meta = dict(meta or {})
+    if table is None or text != table.text:
+        meta["content"] = text
+    sections = dict.fromkeys(SECTIONS, b"")
+    sections["meta"] = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    if table is None:
+        flags |= NO_LOGPROBS
+    else:
+        float_type = np.float16 if half else np.float32
+        sections.update(
+            strings=_encode_strings(table.pool.strings),
+            token_ids=table.token_ids.astype("<i4").tobytes(),
+            logprobs=table.logprobs.astype(float_type).tobytes(),
+            alt_ids=table.alt_ids.astype("<i4").tobytes(),
+            alt_logprobs=table.alt_logprobs.astype(float_type).tobytes(),
+            lengths=encode_varints(np.diff(table.byte_offsets)),
+            raw=table.raw,
+        )
+    body = bytearray()
+    spans = []
+    for name in SECTIONS:
+        body.extend(b"\0" * (-len(body) % 8))
+        spans += [len(body), len(sections[name])]
+        body.extend(sections[name])
+    if compress:
+        body = zstandard.ZstdCompressor().compress(bytes(body))
+    n, k = table.alt_ids.shape if table is not None else (0, 0)
+    header = HEADER.pack(MAGIC, VERSION, flags, n, k, len(table.pool) if table is not None else 0, *spans)
+    return header + bytes(body)
+
+
+def load_result(buffer: Buffer) -> Tuple[Optional[str], Optional[LogprobTable], dict]:
+    """
+    (text, table, meta) from dump_result's bytes. Without compression the
+    int32/float32 columns are views into `buffer`, not copies.
+    """
+    view = memoryview(buffer)
+    fields = HEADER.unpack_from(view)
+    magic, version, flags, n, k, n_strings = fields[:6]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} translation result")
+    body = view[HEADER.size:]
+    if flags & COMPRESSED:
+        if zstandard is None:
+            raise ImportError("This result is zstd-compressed; install the zstandard package to read it")
+        body = memoryview(zstandard.ZstdDecompressor().decompress(bytes(body)))
+    spans = dict(zip(SECTIONS, zip(fields[6::2], fields[7::2])))
+
+    def section(name):
+        offset, length = spans[name]
+        return body[offset:offset + length]
+
+    def array(name, dtype, count):
+        offset, _ = spans[name]
+        return np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+
+    meta = json.loads(bytes(section("meta")))
+    content = meta.pop("content", None)
+    if flags & NO_LOGPROBS:
+        return content, None, meta
+
+    float_type = "<f2" if flags & HALF else "<f4"
+    pool = StringPool()
+    for s in _decode_strings(section("strings"), n_strings):
+        pool.intern(s)
+    table = LogprobTable(
+        pool,
+        array("token_ids", "<i4", n),
+        array("logprobs", float_type, n),
+        array("alt_ids", "<i4", n * k),
+        array("alt_logprobs", float_type, n * k),
+        section("raw"),
+        np.concatenate([[0], np.cumsum(decode_varints(section("lengths")))]),
+    )
+    return (table.text if content is None else content), table, meta
+
+
+def save_result(path, text, table, meta=None, **kwargs):
+    with open(path, "wb") as f:
+        f.write(dump_result(text, table, meta, **kwargs))
+
+
+def open_result(path) -> Tuple[Optional[str], Optional[LogprobTable], dict]:
+    """load_result() over a read-only mmap of the file: the arrays are paged in as they're read."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # The arrays keep the map alive; it's unmapped once they're gone
+    return load_result(mapped)
+
+
+def dump_response(response: ChatCompletion, **kwargs) -> bytes:
+    """A chat completion as dump_result bytes; the inverse of load_response()."""
+    choice = response.choices[0]
+    content = choice.logprobs.content if choice.logprobs and choice.logprobs.content is not None else None
+    meta = {
+        "id": response.id,
+        "model": response.model,
+        "created": response.created,
+        "finish_reason": choice.finish_reason,
+        "system_fingerprint": response.system_fingerprint,
+        "usage": response.usage.model_dump() if response.usage is not None else None,
+    }
+    table = LogprobTable.from_logprobs(content) if content is not None else None
+    return dump_result(choice.message.content, table, meta, **kwargs)
+
+
+def load_response(buffer: Buffer) -> ChatCompletion:
+    """
+    The ChatCompletion back. Alternatives come back without their own `bytes`
+    (the pipeline never reads them) and logprobs at the stored precision.
+    """
+    text, table, meta = load_result(buffer)
+    return ChatCompletion.model_validate({
+        "id": meta["id"],
+        "object": "chat.completion",
+        "created": meta["created"],
+        "model": meta["model"],
+        "system_fingerprint": meta.get("system_fingerprint"),
+        "usage": meta.get("usage"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": meta["finish_reason"],
+            "message": {"role": "assistant", "content": text},
+            "logprobs": {"content": table.to_records()} if table is not None else None,
+        }],
+    })
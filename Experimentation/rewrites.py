@@ -0,0 +1,148 @@
+"""
+On-demand rewrites of one phrase of a translation.
+
+Instead of swapping single tokens inside a noun chunk, the model is asked for
+N rewrites of just that span, with the rest of the sentence given as fixed
+context. Requests are keyed on (sentence, span, languages, model): identical
+requests share one in-flight call, finished ones come from the translation
+cache, and spans can be prefetched in the background before anyone clicks them.
+"""
+import json, logging, re, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from Experimentation.backends import TranslationBackend, get_backend
+from Experimentation.cache import TranslationCache, cache_key, get_cache
+from Experimentation.languages import language
+from Experimentation.tracing import count, record_usage, span
+
+logger = logging.getLogger(__name__)
+
+# Sentinel so callers can pass cache=None to bypass the shared cache
+_DEFAULT = object()
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+def build_rewrite_messages(sentence: str, start: int, end: int, source: str = "", n: int = 5,
+                           translate_from: str = "Chinese(Simplified)",
+                           translate_to: str = "English (United Kingdom)"):
+    source_name, target_name = language(translate_from)["prompt_name"], language(translate_to)["prompt_name"]
+    instruction = (
+        f"You are revising a {target_name} translation of a {source_name} text. "
+        f"Rewrite only the phrase marked with [[ ]]; the rest of the sentence stays exactly as it is, "
+        f"and every rewrite must fit grammatically in place of the marked phrase. "
+        f"Reply with a JSON array of {n} distinct rewrites of the marked phrase alone."
+    )
+    marked = f"{sentence[:start]}[[{sentence[start:end]}]]{sentence[end:]}"
+    content = f"Source: {source}\nTranslation: {marked}" if source else f"Translation: {marked}"
+    messages = [
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": content},
+    ]
+    return instruction, messages
+
+
+def parse_rewrites(content: str, sentence: str, start: int, end: int, n: int = 5) -> List[str]:
+    """
+    The distinct rewrites in a reply, best first. Accepts a JSON array (fenced or
+    not) or one rewrite per line; a rewrite that repeats the fixed context
+    around the span is cut back to the span.
+    """
+    phrase = sentence[start:end]
+    before, after = sentence[:start].strip(), sentence[end:].strip()
+    match = re.search(r"\[.*\]", content or "", re.S)
+    try:
+        items = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        items = None
+    if not isinstance(items, list):
+        items = (content or "").splitlines()
+
+    rewrites = []
+    for item in items:
+        if not isinstance(item, str):
+            continue
+        text = _LIST_MARKER.sub("", item).strip().strip('"“”').replace("[[", "").replace("]]", "").strip()
+        # The whole sentence came back: keep only the part in place of the span
+        if before and text.startswith(before):
+            text = text[len(before):].strip()
+        if after and text.endswith(after):
+            text = text[:-len(after)].strip()
+        if not text or text == phrase or text in rewrites or len(text) > 3 * len(phrase) + 40:
+            continue
+        rewrites.append(text)
+    return rewrites[:n]
+
+
+class PhraseRewriter:
+    """
+    Phrase rewrite requests, answered on a small thread pool.
+
+    `request()` returns a Future; asking again for the same span while it is
+    in flight (or after it finished, within `memo_size` recent spans) returns
+    the same Future, so a click on a prefetched span doesn't call the model twice.
+    """
+
+    def __init__(self, backend: TranslationBackend = None, cache: Optional[TranslationCache] = _DEFAULT,
+                 model: str = "gpt-4o", n: int = 5, max_workers: int = 4, memo_size: int = 256):
+        self.backend = backend
+        self.cache = get_cache() if cache is _DEFAULT else cache
+        self.model = model
+        self.n = n
+        self.memo_size = memo_size
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="phrase-rewrite")
+
+    def request(self, sentence: str, start: int, end: int, source: str = "",
+                translate_from: str = "Chinese(Simplified)",
+                translate_to: str = "English (United Kingdom)") -> Future:
+        instruction, messages = build_rewrite_messages(
+            sentence, start, end, source, self.n, translate_from, translate_to
+        )
+        key = cache_key(
+            json.dumps([sentence, start, end, source, self.n], ensure_ascii=False),
+            translate_from, translate_to, self.model, instruction,
+        )
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._futures.move_to_end(key)
+                count("phrase_rewrite_requests_total", result="deduplicated")
+                return future
+            future = self._executor.submit(self._rewrite, key, messages, sentence, start, end)
+            self._futures[key] = future
+            while len(self._futures) > self.memo_size:
+                self._futures.popitem(last=False)
+        return future
+
+    def prefetch(self, spans: Iterable[dict]):
+        """Start requests for spans ({"sentence", "start", "end", ...request kwargs}) without waiting."""
+        for s in spans:
+            self.request(**s)
+
+    def _rewrite(self, key, messages, sentence, start, end) -> List[str]:
+        with span("phrase_rewrite", model=self.model, chars=end - start) as current:
+            response = self.cache.get(key) if self.cache is not None else None
+            if response is not None:
+                count("phrase_rewrite_requests_total", result="cached")
+            else:
+                count("phrase_rewrite_requests_total", result="called")
+                backend = self.backend or get_backend()
+                response = backend.create(model=self.model, messages=messages)
+                record_usage(response.usage, self.model)
+                if self.cache is not None:
+                    self.cache.put(key, response)
+            rewrites = parse_rewrites(response.choices[0].message.content, sentence, start, end, self.n)
+            current.set(rewrites=len(rewrites))
+        logger.debug("Rewrites for %r: %s", sentence[start:end], rewrites)
+        return rewrites
+
+
+@lru_cache(maxsize=None)
+def get_rewriter() -> PhraseRewriter:
+    """Process-wide rewriter, so every session shares in-flight requests and the pool."""
+    return PhraseRewriter()
@@ -0,0 +1,78 @@
+import codecs
+
+from Experimentation.chatcompletion import fanyi_stream, generate_phrase_alternatives
+from Experimentation.document import split_sentences
+from Experimentation.logprob_table import LogprobTable
+from Experimentation.nlp import DEFAULT_LANGUAGE
+
+
+def _finish_sentence(index, start, tokens, text, translate_to):
+    # text runs up to the end of this sentence's last token
+    end = len(text)
+    sentence_text = text[start:end]
+    # A backend that sends no logprobs leaves the sentence without a table or phrases
+    table = LogprobTable.from_records(tokens) if tokens else None
+    phrases = generate_phrase_alternatives(sentence_text, table, translate_to=translate_to) if tokens else []
+    for phrase in phrases:
+        phrase["start_char"] += start
+        phrase["end_char"] += start
+    return {
+        "type": "sentence",
+        "index": index,
+        "start": start,
+        "end": end,
+        "text": sentence_text,
+        "logprobs": table,
+        "phrases": phrases,
+    }
+
+
+def stream_translation(input, **fanyi_kwargs):
+    """
+    Stream a translation and work out phrase alternatives as sentences finish.
+
+    Yields dict events:
+      {"type": "delta", "text": ...}      translated text so far, after every chunk
+      {"type": "sentence", ...}           a finished sentence with its LogprobTable (or None) and
+                                          phrase alternatives (offsets into the full text)
+      {"type": "done", "text", "logprobs"} once the stream ends, with a LogprobTable
+                                          (None if the stream carried no logprobs)
+    Keyword arguments go to fanyi_stream().
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = ""
+    all_tokens = []
+    pending = []
+    sentence_start = 0
+    sentence_index = 0
+    # Phrases are chunked for the target language
+    translate_to = fanyi_kwargs.get("translate_to", DEFAULT_LANGUAGE)
+
+    for delta, tokens in fanyi_stream(input, **fanyi_kwargs):
+        if tokens:
+            for tok in tokens:
+                tok["offset"] = len(text)
+                raw = tok["bytes"] if tok["bytes"] is not None else tok["token"].encode("utf-8")
+                text += decoder.decode(bytes(raw))
+                pending.append(tok)
+            all_tokens.extend(tokens)
+        else:
+            text += delta
+        yield {"type": "delta", "text": text}
+
+        # A sentence is finished once text follows its terminator
+        spans = split_sentences(text[sentence_start:])
+        while len(spans) > 1 and pending:
+            boundary = sentence_start + spans[0][1]
+            done = [tok for tok in pending if tok["offset"] < boundary]
+            pending = pending[len(done):]
+            next_start = pending[0]["offset"] if pending else len(text)
+            yield _finish_sentence(sentence_index, sentence_start, done, text[:next_start], translate_to)
+            sentence_index += 1
+            sentence_start = next_start
+            spans = split_sentences(text[sentence_start:])
+
+    text += decoder.decode(b"", final=True)
+    if text[sentence_start:].strip():
+        yield _finish_sentence(sentence_index, sentence_start, pending, text, translate_to)
+    yield {"type": "done", "text": text, "logprobs": LogprobTable.from_records(all_tokens) if all_tokens else None}
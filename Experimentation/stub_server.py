@@ -0,0 +1,68 @@
+"""
+Local, deterministic stand-in for the chat-completions endpoint.
+
+Replays recorded responses over HTTP so the real OpenAI client (and everything
+behind it) can be exercised with no network:
+
+    python -m Experimentation.stub_server --port 8001
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub streamlit run app.py
+"""
+import argparse, json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Experimentation.backends import ReplayBackend
+
+
+def make_handler(backend: ReplayBackend):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            params = {k: v for k, v in request.items() if k not in ("model", "messages", "stream")}
+            if request.get("stream"):
+                self.stream(backend.stream(request.get("model", ""), request.get("messages", []), **params))
+                return
+            response = backend.create(request.get("model", ""), request.get("messages", []), **params)
+
+            body = response.model_dump_json(exclude_none=True).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def stream(self, chunks):
+            # Server-sent events; the connection closing ends the body
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for chunk in chunks:
+                self.wfile.write(f"data: {chunk.model_dump_json(exclude_none=True)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply")
+    parser.add_argument("recordings", nargs="*", help="Recorded responses (defaults to logprob.json)")
+    args = parser.parse_args()
+
+    backend = ReplayBackend(args.recordings or None, latency=args.latency)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    print(f"Replaying {len(backend.recordings)} recording(s) on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Lightweight tracing and metrics for the translate path.
+
+    with span("api_call", model=model) as s:
+        response = backend.create(...)
+        s.set(completion_tokens=...)
+
+Spans nest through a contextvar, so children find their parent across
+asyncio tasks and asyncio.to_thread. Every finished span feeds a latency
+histogram per span name; `count()` feeds counters such as token usage and
+cache hits. Both are exported in the Prometheus text format:
+
+TRANSLATION_METRICS_PORT=9464        serve GET /metrics from this process
+TRANSLATION_METRICS_FILE=metrics.prom rewrite this file (at most every
+                                      TRANSLATION_METRICS_INTERVAL seconds, default 5)
+TRANSLATION_TRACE_FILE=traces.jsonl  append each finished request (root span
+                                      with its children) as one JSON line
+"""
+import os, json, logging, threading, time
+from contextvars import ContextVar
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Upper bounds in seconds; an API call lands in the top half, a parse in the bottom
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("translation_span", default=None)
+
+
+def _label_str(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Thread-safe latency histograms (per span name) and labelled counters."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+                    break
+            hist["sum"] += seconds
+            hist["count"] += 1
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """Plain-dict copy: {"spans": {name: {count, sum, buckets}}, "counters": {(name, labels): value}}."""
+        with self._lock:
+            return {
+                "spans": {name: {**h, "buckets": list(h["buckets"])} for name, h in self._histograms.items()},
+                "counters": dict(self._counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        snap = self.snapshot()
+        lines = [
+            "# HELP translation_span_seconds Time spent in each stage of the translate path.",
+            "# TYPE translation_span_seconds histogram",
+        ]
+        for name, hist in sorted(snap["spans"].items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, hist["buckets"]):
+                cumulative += n
+                lines.append(f'translation_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'translation_span_seconds_bucket{{span="{name}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'translation_span_seconds_sum{{span="{name}"}} {hist["sum"]:.6f}')
+            lines.append(f'translation_span_seconds_count{{span="{name}"}} {hist["count"]}')
+
+        seen = set()
+        for (name, labels), value in sorted(snap["counters"].items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_label_str(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.children = []
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        METRICS.observe(self.name, self.duration)
+        if self.parent is not None:
+            self.parent.children.append(self)
+        else:
+            get_exporter().request_finished(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": self.wall_start,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [c.to_dict() for c in self.children]} if self.children else {}),
+        }
+
+
+class span:
+    """
+    Time a block as a child of the current span (a new request if there is none).
+
+    activate=False records the span without making it the parent of spans opened
+    inside the block; generators need this, since their body runs interleaved
+    with the caller's code.
+    """
+
+    def __init__(self, name: str, activate: bool = True, **attrs):
+        self.name = name
+        self.activate = activate
+        self.attrs = attrs
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, _current.get(), **self.attrs)
+        if self.activate:
+            self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.set(error=exc_type.__name__)
+        if self._token is not None:
+            _current.reset(self._token)
+        self.span.finish()
+        return False
+
+
+def count(name: str, value: float = 1, **labels):
+    METRICS.count(name, value, **labels)
+
+
+def record_usage(usage, model: str, completion_tokens: Optional[int] = None):
+    """
+    Prompt/completion token counters from a response's `usage`. Without usage
+    (replayed or some streamed responses), `completion_tokens` is counted instead.
+    """
+    if usage is None:
+        if completion_tokens is not None:
+            count("translation_tokens_total", completion_tokens, kind="completion", model=model)
+        return
+    count("translation_tokens_total", usage.prompt_tokens or 0, kind="prompt", model=model)
+    count("translation_tokens_total", usage.completion_tokens or 0, kind="completion", model=model)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Exporter:
+    def __init__(self, metrics_file=None, trace_file=None, interval: float = 5.0):
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.interval = interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def request_finished(self, root: Span):
+        if self.trace_file:
+            line = json.dumps(root.to_dict(), ensure_ascii=False, default=str) + "\n"
+            with self._lock, open(self.trace_file, "a", encoding="utf-8") as f:
+                f.write(line)
+        if self.metrics_file and time.monotonic() - self._last_write >= self.interval:
+            self.write_metrics()
+
+    def write_metrics(self):
+        # Written aside and renamed, so a scraper never reads half a file
+        with self._lock:
+            self._last_write = time.monotonic()
+            tmp = f"{self.metrics_file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(METRICS.render())
+            os.replace(tmp, self.metrics_file)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@lru_cache(maxsize=None)
+def get_exporter() -> Exporter:
+    """
+    Process-wide exporter, configured from the environment on first use. Call it
+    at startup to bring the metrics endpoint up before the first request.
+    """
+    exporter = Exporter(
+        metrics_file=os.getenv("TRANSLATION_METRICS_FILE"),
+        trace_file=os.getenv("TRANSLATION_TRACE_FILE"),
+        interval=float(os.getenv("TRANSLATION_METRICS_INTERVAL", 5)),
+    )
+    port = os.getenv("TRANSLATION_METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+    return exporter
+
+
+def flush():
+    """Write the metrics file now, e.g. at the end of a batch run."""
+    exporter = get_exporter()
+    if exporter.metrics_file:
+        exporter.write_metrics()
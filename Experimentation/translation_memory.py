@@ -0,0 +1,199 @@
+import os, json, sqlite3, threading, time, zlib
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from Experimentation.cache import normalize_text
+
+DEFAULT_TM_PATH = Path(__file__).resolve().parent.parent / ".translation_memory.sqlite3"
+
+_PRIME = (1 << 31) - 1
+# Odd multiplier for folding a band's rows into one 64-bit bucket key
+_BAND_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHashIndex:
+    """
+    MinHash/LSH index over character n-grams of source segments.
+
+    A lookup hashes the query once, collects segments that share at least one
+    LSH band with it, and only scores the few with the most shared bands, so
+    its cost doesn't grow with the number of stored segments. Bulk-loaded
+    signatures live in one sorted key array per band (binary-searched);
+    segments added afterwards go to a small dict overlay.
+
+    Character bigrams by default: CJK sources are short and carry a word in one
+    or two characters, so trigram sets of near-identical sentences barely overlap.
+    """
+
+    def __init__(self, n: int = 2, num_perm: int = 32, bands: int = 16, seed: int = 7):
+        assert num_perm % bands == 0
+        self.n = n
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._sorted_keys = [np.zeros(0, dtype=np.uint64) for _ in range(bands)]
+        self._sorted_ids = [np.zeros(0, dtype=np.int64) for _ in range(bands)]
+        self._recent = [defaultdict(list) for _ in range(bands)]
+
+    def grams(self, text: str):
+        text = normalize_text(text).lower()
+        if len(text) <= self.n:
+            return {text}
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in self.grams(text)), dtype=np.uint64)
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(..., num_perm) signatures -> (..., bands) uint64 bucket keys."""
+        rows = signatures.astype(np.uint64).reshape(signatures.shape[:-1] + (self.bands, self.rows))
+        keys = np.zeros(rows.shape[:-1], dtype=np.uint64)
+        for r in range(self.rows):
+            keys = keys * _BAND_MIX + rows[..., r]
+        return keys
+
+    def bulk_load(self, ids: np.ndarray, signatures: np.ndarray):
+        """Replace the sorted arrays with (n,) ids and their (n, num_perm) signatures."""
+        keys = self.band_keys(signatures)
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind="stable")
+            self._sorted_keys[band] = keys[order, band]
+            self._sorted_ids[band] = ids[order]
+            self._recent[band].clear()
+
+    def add(self, segment_id: int, signature: np.ndarray):
+        for band, key in enumerate(self.band_keys(signature).tolist()):
+            self._recent[band][key].append(segment_id)
+
+    def candidates(self, text: str, limit: int = 8) -> List[int]:
+        """Ids sharing the most LSH bands with text, most shared first."""
+        counts = Counter()
+        for band, key in enumerate(self.band_keys(self.signature(text))):
+            keys = self._sorted_keys[band]
+            lo = np.searchsorted(keys, key, side="left")
+            hi = np.searchsorted(keys, key, side="right")
+            if hi > lo:
+                counts.update(self._sorted_ids[band][lo:hi].tolist())
+            recent = self._recent[band].get(int(key))
+            if recent:
+                counts.update(recent)
+        return [segment_id for segment_id, _ in counts.most_common(limit)]
+
+
+class TranslationMemory:
+    """
+    Confirmed (source, target) segment pairs, with the alternatives the
+    translator picked, persisted in SQLite and indexed in memory per language
+    pair for exact and fuzzy lookup. MinHash signatures are stored with each
+    segment, so reopening a large memory doesn't rehash every source.
+    """
+
+    def __init__(self, path=DEFAULT_TM_PATH):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                translate_from TEXT NOT NULL,
+                translate_to TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                selections TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+        # Per language pair: exact-match dict and fuzzy index
+        self._exact = defaultdict(dict)
+        self._fuzzy = defaultdict(MinHashIndex)
+        self._segments = {}
+        loaded = defaultdict(lambda: ([], []))
+        for segment_id, translate_from, translate_to, source, target, selections, signature in self._conn.execute(
+            "SELECT id, translate_from, translate_to, source, target, selections, signature FROM segments"
+        ):
+            pair = (translate_from, translate_to)
+            self._segments[segment_id] = (source, target, selections)
+            self._exact[pair][normalize_text(source)] = segment_id
+            loaded[pair][0].append(segment_id)
+            loaded[pair][1].append(signature)
+        for pair, (ids, signatures) in loaded.items():
+            index = self._fuzzy[pair]
+            matrix = np.frombuffer(b"".join(signatures), dtype=np.uint32).reshape(len(ids), index.num_perm)
+            index.bulk_load(np.array(ids, dtype=np.int64), matrix)
+
+    def add(self, source: str, target: str, translate_from: str, translate_to: str,
+            selections: Optional[list] = None) -> int:
+        pair = (translate_from, translate_to)
+        selections_json = json.dumps(selections or [], ensure_ascii=False)
+        with self._lock:
+            signature = self._fuzzy[pair].signature(source)
+            cursor = self._conn.execute(
+                "INSERT INTO segments (translate_from, translate_to, source, target, selections, signature, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (translate_from, translate_to, source, target, selections_json, signature.tobytes(), time.time()),
+            )
+            self._conn.commit()
+            segment_id = cursor.lastrowid
+            self._segments[segment_id] = (source, target, selections_json)
+            self._exact[pair][normalize_text(source)] = segment_id
+            self._fuzzy[pair].add(segment_id, signature)
+            return segment_id
+
+    def _match(self, segment_id, score):
+        source, target, selections = self._segments[segment_id]
+        return {
+            "id": segment_id,
+            "source": source,
+            "target": target,
+            "selections": json.loads(selections),
+            "score": score,
+        }
+
+    def lookup(self, source: str, translate_from: str, translate_to: str,
+               threshold: float = 0.75, limit: int = 3) -> List[dict]:
+        """
+        Stored segments whose source is at least `threshold` similar to source,
+        best first. An exact match (after normalisation) scores 1.0.
+        """
+        pair = (translate_from, translate_to)
+        normalized = normalize_text(source)
+        with self._lock:
+            exact = self._exact[pair].get(normalized)
+            if exact is not None:
+                return [self._match(exact, 1.0)]
+            if pair not in self._fuzzy:
+                return []
+            matches = []
+            for segment_id in self._fuzzy[pair].candidates(source):
+                candidate = normalize_text(self._segments[segment_id][0])
+                score = SequenceMatcher(None, normalized, candidate, autojunk=False).ratio()
+                if score >= threshold:
+                    matches.append(self._match(segment_id, score))
+        matches.sort(key=lambda m: m["score"], reverse=True)
+        return matches[:limit]
+
+    def __len__(self):
+        return len(self._segments)
+
+
+@lru_cache(maxsize=None)
+def get_memory() -> Optional[TranslationMemory]:
+    """
+    Process-wide translation memory. TRANSLATION_MEMORY=off disables it,
+    TRANSLATION_MEMORY_PATH moves the database.
+    """
+    if os.getenv("TRANSLATION_MEMORY", "on").lower() in ("off", "0", "false"):
+        return None
+    return TranslationMemory(os.getenv("TRANSLATION_MEMORY_PATH", DEFAULT_TM_PATH))
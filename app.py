@@ -4,11 +4,15 @@ from components.app_styles import inject_global_styles
 from components.Input_text_area import Input_text_area
 from components.Output_text_area import Output_text_area
 from components.top_form_selector import render_top_form_selectors
+from Experimentation.logs import configure_logging
 
 
 # --- 1. App Configuration ---
 st.set_page_config(layout="wide", page_title="Nested Containers")
 
+# Log level from TRANSLATION_LOG_LEVEL (default WARNING)
+configure_logging()
+
 # --- 2. Inject Global Styles ---
 inject_global_styles()
 
@@ -36,7 +40,9 @@ with st.container(border=True):
 
 with st.container(border=True):
     st.session_state.output_text_content = Output_text_area(
-        input_value=st.session_state.input_text_content
+        input_value=st.session_state.input_text_content,
+        translate_from=input_language,
+        translate_to=output_language,
     )
 
 # --- 5. Handle Translation Trigger ---
@@ -57,25 +63,18 @@ st.info("Translation will be processed here based on the selected languages and
 
 
 
+# from components.phrase_segmenter import PhraseSegmenter
+
 # def build_dynamic_sentence(sentence, alt_phrases):
+#     # Longest-match segmentation in one pass (see components/phrase_segmenter.py)
 #     components = []
-#     i = 0
-#     while i < len(sentence):
-#         matched = None
-#         for phrase in alt_phrases:
-#             if sentence[i:].startswith(phrase):
-#                 matched = phrase
-#                 break
-#         if matched:
-#             select = pn.widgets.Select(options=alt_phrases[matched], value=matched, width=250)
+#     for token in PhraseSegmenter(alt_phrases).segment(sentence):
+#         if isinstance(token, tuple):
+#             phrase, _ = token
+#             select = pn.widgets.Select(options=alt_phrases[phrase], value=phrase, width=250)
 #             components.append(select)
-#             i += len(matched)
 #         else:
-#             # Add plain text until next phrase
-#             start = i
-#             while i < len(sentence) and all(not sentence[i:].startswith(p) for p in alt_phrases):
-#                 i += 1
-#             components.append(pn.pane.Markdown(sentence[start:i], margin=(0,5)))
+#             components.append(pn.pane.Markdown(token, margin=(0,5)))
 #     return pn.Row(*components)
 
 # dynamic_sentence = build_dynamic_sentence(sentence, ALT_PHRASES)
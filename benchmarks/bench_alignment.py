@@ -0,0 +1,101 @@
+"""
+Compare the per-chunk token rescan that generate_phrase_alternatives used to do
+against the char spans a LogprobTable precomputes.
+
+Run from the repo root:
+    python -m benchmarks.bench_alignment --tokens 10000
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+from Experimentation.logprob_table import LogprobTable
+
+FIXTURE = Path(__file__).resolve().parent.parent / "Experimentation" / "logprob.json"
+
+
+def load_tokens(n_tokens):
+    with open(FIXTURE, encoding="utf-8") as f:
+        base = json.load(f)
+    return [base[i % len(base)] for i in range(n_tokens)]
+
+
+def phrase_spans(text, words_per_phrase=3):
+    # Stand-in for spaCy noun chunks: one span every few words
+    words = [m.span() for m in re.finditer(r"\S+", text)]
+    return [
+        (words[i][0], words[min(i + 1, len(words) - 1)][1])
+        for i in range(0, len(words), words_per_phrase)
+    ]
+
+
+def legacy_match(token_strs, spans):
+    # The original O(chunks x tokens) loop, minus the prints
+    matches = []
+    for chunk_start, chunk_end in spans:
+        phrase_tokens = []
+        current_offset = 0
+        for i, tok in enumerate(token_strs):
+            is_space = tok.startswith("Ġ")
+            tok_text = tok.lstrip("Ġ")
+            effective_tok = (" " if is_space else "") + tok_text
+            if chunk_start <= current_offset < chunk_end:
+                phrase_tokens.append(i)
+            current_offset += len(effective_tok)
+        matches.append(phrase_tokens)
+    return matches
+
+
+def indexed_match(logprobs, spans):
+    table = LogprobTable.from_records(logprobs)
+    return [list(range(*table.token_range(start, end))) for start, end in spans]
+
+
+def check_cjk():
+    # "研究" split so that one token ends in the middle of a character
+    raw = "研究表明".encode("utf-8")
+    logprobs = [
+        {"token": "", "bytes": list(raw[:4]), "logprob": 0.0, "top_logprobs": []},
+        {"token": "", "bytes": list(raw[4:]), "logprob": 0.0, "top_logprobs": []},
+    ]
+    table = LogprobTable.from_records(logprobs)
+    assert table.text == "研究表明"
+    assert table.char_starts.tolist() == [0, 1] and table.char_ends.tolist() == [2, 4]
+    assert table.token_range(0, 1) == (0, 1)
+    assert table.token_range(1, 2) == (0, 2)
+    assert table.token_range(3, 4) == (1, 2)
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=10_000)
+    args = parser.parse_args()
+
+    check_cjk()
+
+    logprobs = load_tokens(args.tokens)
+    token_strs = [tok["token"] for tok in logprobs]
+    spans = phrase_spans("".join(token_strs))
+
+    legacy = timed(legacy_match, token_strs, spans, repeat=1)
+    indexed = timed(indexed_match, logprobs, spans)
+
+    print(f"tokens={len(logprobs)} phrases={len(spans)}")
+    print(f"legacy loop   : {legacy * 1000:10.1f} ms")
+    print(f"LogprobTable  : {indexed * 1000:10.1f} ms")
+    print(f"speedup       : {legacy / indexed:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
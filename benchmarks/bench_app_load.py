@@ -0,0 +1,131 @@
+"""
+Headless load test of app.py: several sessions, each its own AppTest, in one
+process against the replay backend, so they share the backend, caches and
+spaCy pipelines the way a server's sessions do. Every session types an input,
+translates it, then reruns the way a translator's clicks would (heatmap on,
+heatmap off, a plain rerun). AppTest swaps in a process-wide runtime for each
+run, so the sessions take turns step by step rather than running in threads.
+Reports rerun latency percentiles per step and the memory each live session
+holds (tracemalloc, measured in a second pass so tracing doesn't slow the
+timed one).
+
+Translation cache and memory go to a temporary directory, so every run starts
+cold. --save stores the run in benchmarks/results/app_load.jsonl; every run is
+compared with the last stored one with the same parameters.
+
+Run from the repo root:
+    python -m benchmarks.bench_app_load --sessions 8 --reruns 12 --sentences 20 --save
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+INTERACTIONS = ("heatmap_on", "heatmap_off", "rerun")
+
+
+def session(source, reruns, timeout, timings):
+    """One session's script, a step per next(); each step's seconds go to timings[step]."""
+    from streamlit.testing.v1 import AppTest
+
+    def step(name, action):
+        start = time.perf_counter()
+        at = action()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].value}")
+        return at
+
+    at = step("first_run", lambda: AppTest.from_file(str(APP), default_timeout=timeout).run())
+    yield at
+    yield step("input", lambda: at.text_area(key="translation_input").input(source).run())
+    yield step("translate", lambda: at.button(key="centered_sync_button_within_col_top").click().run())
+    actions = {
+        "heatmap_on": lambda: at.toggle(key="confidence_heatmap").set_value(True).run(),
+        "heatmap_off": lambda: at.toggle(key="confidence_heatmap").set_value(False).run(),
+        "rerun": lambda: at.run(),
+    }
+    for i in range(reruns):
+        name = INTERACTIONS[i % len(INTERACTIONS)]
+        yield step(name, actions[name])
+
+
+def run_sessions(n, source, reruns, timeout, timings):
+    """Run n sessions a step each in turn; returns their AppTests, still alive."""
+    scripts = [session(source, reruns, timeout, timings) for _ in range(n)]
+    apps = [None] * n
+    while any(script is not None for script in scripts):
+        for i, script in enumerate(scripts):
+            if script is None:
+                continue
+            try:
+                apps[i] = next(script)
+            except StopIteration:
+                scripts[i] = None
+    return apps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--reruns", type=int, default=12, help="Interactions per session after translating")
+    parser.add_argument("--sentences", type=int, default=20, help="Input length; over 8 uses document mode")
+    parser.add_argument("--memory-sessions", type=int, default=4, help="Sessions kept alive for the memory pass")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds a single rerun may take")
+    parser.add_argument("--save", action="store_true", help="Store the run for later comparisons")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_app_load_")
+    os.environ.setdefault("TRANSLATION_BACKEND", "replay")
+    os.environ["TRANSLATION_CACHE_PATH"] = os.path.join(workdir, "cache.sqlite3")
+    os.environ["TRANSLATION_MEMORY_PATH"] = os.path.join(workdir, "memory.sqlite3")
+
+    # Imported after the environment is set, since the backends and stores read it once
+    from benchmarks.fixtures import source_text
+    from benchmarks.results import compare, save_run
+
+    source = source_text(args.sentences)
+    # One session first, so module imports and model loads aren't billed to the timed ones
+    run_sessions(1, source, 0, args.timeout, {})
+
+    timings = {}
+    start = time.perf_counter()
+    run_sessions(args.sessions, source, args.reruns, args.timeout, timings)
+    wall = time.perf_counter() - start
+
+    metrics = {"wall_s": wall}
+    print(f"{args.sessions} sessions, {args.sentences} sentences, {args.reruns} interactions each: {wall:.1f} s")
+    print(f"{'step':<12} {'count':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, seconds in timings.items():
+        samples = np.array(seconds) * 1000
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        print(f"{name:<12} {len(samples):6d} {p50:6.0f} ms {p90:6.0f} ms {p99:6.0f} ms {samples.max():6.0f} ms")
+        metrics.update({f"{name}/p50_ms": p50, f"{name}/p90_ms": p90, f"{name}/p99_ms": p99})
+
+    # Memory: what a finished session keeps alive, averaged over sessions held at once
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    alive = run_sessions(args.memory_sessions, source, args.reruns, args.timeout, {})
+    gc.collect()
+    per_session = (tracemalloc.get_traced_memory()[0] - baseline) / args.memory_sessions
+    tracemalloc.stop()
+    del alive
+    metrics["memory_per_session_kb"] = per_session / 1024
+    print(f"memory per live session: {per_session / 1024:.0f} KB")
+
+    params = {key: getattr(args, key) for key in ("sessions", "reruns", "sentences", "memory_sessions")}
+    params["backend"] = os.environ["TRANSLATION_BACKEND"]
+    compare("app_load", params, metrics)
+    if args.save:
+        save_run("app_load", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Many sessions translating the same boilerplate at once: backend calls and
+wall time with and without single-flight coalescing, over a replay backend
+with a fixed round-trip latency. A small set of distinct segments is drawn
+at random by every session, so most requests overlap with one in flight.
+
+Run from the repo root:
+    python -m benchmarks.bench_coalescing --sessions 32 --segments 4 --latency 0.2
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Experimentation.backends import CoalescingBackend, ReplayBackend
+from Experimentation.chatcompletion import build_messages
+
+
+class CountingReplay(ReplayBackend):
+    def __init__(self, latency):
+        super().__init__(latency=latency)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **params):
+        with self._lock:
+            self.calls += 1
+        return super().create(model, messages, **params)
+
+
+def run(backend, requests, sessions):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(sessions) as pool:
+        list(pool.map(lambda messages: backend.create("gpt-4o", messages, logprobs=True, top_logprobs=3), requests))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--segments", type=int, default=4, help="Distinct segments the sessions draw from")
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    segments = [build_messages(f"段落 {i}。")[1] for i in range(args.segments)]
+    requests = [rng.choice(segments) for _ in range(args.requests)]
+
+    direct = CountingReplay(args.latency)
+    before = run(direct, requests, args.sessions)
+    shared = CountingReplay(args.latency)
+    after = run(CoalescingBackend(shared), requests, args.sessions)
+
+    print(f"{args.requests} requests from {args.sessions} sessions over {args.segments} segments, "
+          f"{args.latency * 1000:.0f} ms per call")
+    print(f"independent calls   : {direct.calls:5d} calls  {before:6.2f} s")
+    print(f"single-flight       : {shared.calls:5d} calls  {after:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cost of the confidence heatmap on a multi-page document, recomputed from the
+LogprobTable as it is on every rerun: token entropy/margin, phrase
+probabilities and the shading runs sent to the component.
+
+Run from the repo root:
+    python -m benchmarks.bench_confidence --tokens 50000
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+from Experimentation.logprob_table import LogprobTable
+from components.annotated_component import build_payload
+from components.confidence_heatmap import build_heat
+
+FIXTURE = Path(__file__).resolve().parent.parent / "Experimentation" / "logprob.json"
+
+
+def load_table(n_tokens):
+    with open(FIXTURE, encoding="utf-8") as f:
+        base = json.load(f)
+    return LogprobTable.from_records(base[i % len(base)] for i in range(n_tokens))
+
+
+def annotated_payload(text, words_per_phrase=4):
+    # Stand-in for spaCy noun chunks: every few words, a two-word phrase
+    words = [m.span() for m in re.finditer(r"\S+", text)]
+    tokens = []
+    cursor = 0
+    for i in range(0, len(words) - 1, words_per_phrase):
+        start, end = words[i][0], words[i + 1][1]
+        tokens.append(text[cursor:start])
+        tokens.append((text[start:end], str(len(tokens) // 2 + 1)))
+        cursor = end
+    tokens.append(text[cursor:])
+    alt_phrases = {t[0]: [t[0], t[0].upper()] for t in tokens if isinstance(t, tuple)}
+    return build_payload(tokens, alt_phrases)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    table = load_table(args.tokens)
+    payload = annotated_payload(table.text)
+    phrases = sum(len(seg) == 3 for seg in payload["segments"])
+    print(f"{args.tokens} tokens, {len(table.text)} chars, {phrases} phrases, best of {args.repeat}")
+
+    confidence = timed(table.confidence, args.repeat)
+    heat = timed(lambda: build_heat(payload, table), args.repeat)
+    size = len(json.dumps(build_heat(payload, table)))
+    print(f"token entropy / margin / prob : {confidence * 1000:8.2f} ms")
+    print(f"full heatmap (per rerun)      : {heat * 1000:8.2f} ms  ({size / 1024:.0f} KiB of shading)")
+
+
+if __name__ == "__main__":
+    main()
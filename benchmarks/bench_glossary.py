@@ -0,0 +1,71 @@
+"""
+Glossary matching on a large synthetic term base: the one-off automaton
+build, then scanning a segment with the automaton against checking every
+term with `in`, and the prompt size with matched terms only against the
+whole glossary.
+
+Run from the repo root:
+    python -m benchmarks.bench_glossary --terms 100000
+"""
+import argparse
+import random
+import time
+
+from Experimentation.glossary import Glossary, prompt_terms
+
+
+def make_terms(n, rng):
+    latin = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(n // 3)]
+    entries = []
+    for i in range(n):
+        if i % 2:
+            source = " ".join(rng.sample(latin, rng.randint(1, 3)))
+        else:
+            source = "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 5)))
+        entries.append({"source": source, "target": f"term{i}"})
+    return entries
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=100000)
+    parser.add_argument("--chars", type=int, default=2000, help="Length of the scanned segment")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = make_terms(args.terms, rng)
+    # A segment with a handful of glossary terms in otherwise unrelated text
+    filler = "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(args.chars))
+    picked = [e["source"] for e in rng.sample(entries, 10)]
+    text = filler[: args.chars // 2] + " ".join(picked) + filler[args.chars // 2:]
+
+    start = time.perf_counter()
+    glossary = Glossary(entries)
+    build = time.perf_counter() - start
+
+    scan = timed(lambda: glossary.match(text), args.repeat)
+    folded = text.lower()
+    naive = timed(lambda: [e for e in entries if e["source"].lower() in folded], 1)
+    matched = glossary.match(text)
+
+    print(f"{len(glossary)} terms, {len(text)} char segment, best of {args.repeat}")
+    print(f"automaton build (once per process): {build:8.2f} s")
+    print(f"`in` per term                     : {naive * 1000:8.2f} ms")
+    print(f"automaton scan                    : {scan * 1000:8.2f} ms  ({naive / scan:.0f}x faster)")
+    print(f"prompt, matched terms only        : {len(prompt_terms(matched)):8d} chars ({len(matched)} terms)")
+    whole = sum(len(f"{e['source']} → {e['target']}\n") for e in glossary.entries)
+    print(f"prompt, whole glossary            : {whole:8d} chars")
+
+
+if __name__ == "__main__":
+    main()
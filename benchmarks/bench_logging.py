@@ -0,0 +1,103 @@
+"""
+Cost of the token-level diagnostics in translation_processing on a long
+response: the old print() per token and alternative against the leveled
+logger with debug off (the default) and with debug on for one request.
+
+Output that would go to the console is sent to /dev/null, so the "before"
+figure is a lower bound; a real terminal is slower still.
+
+Run from the repo root:
+    python -m benchmarks.bench_logging --tokens 5000
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.chatcompletion import translation_processing
+from Experimentation.logprob_table import LogprobTable
+from Experimentation.logs import LOG_FORMAT, request_debug
+
+FIXTURE = Path(__file__).resolve().parent.parent / "Experimentation" / "logprob.json"
+
+
+def make_response(n_tokens):
+    with open(FIXTURE, encoding="utf-8") as f:
+        base = json.load(f)
+    tokens = [base[i % len(base)] for i in range(n_tokens)]
+    return ChatCompletion.model_validate({
+        "id": "bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "bench",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "".join(t["token"] for t in tokens)},
+            "logprobs": {"content": tokens},
+        }],
+    })
+
+
+def legacy_processing(response):
+    # translation_processing as it was, printing every token and alternative
+    full_sent = response.choices[0].message.content
+    logprobs_content = response.choices[0].logprobs.content
+    print("Translation:", full_sent)
+    print("\nExtracting logprobs...\n")
+    table = LogprobTable.from_logprobs(logprobs_content)
+    for i in range(len(table)):
+        print(f"TOKEN: {table.token(i)}")
+        for alt_token, alt_logprob in table.alternatives(i):
+            print(f"  Alt: {alt_token}, logprob: {alt_logprob:.3f}")
+        print()
+    return full_sent, table
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    response = make_response(args.tokens)
+
+    with open(os.devnull, "w") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(logging.WARNING)
+
+        with contextlib.redirect_stdout(devnull):
+            before = timed(lambda: legacy_processing(response), args.repeat)
+        off = timed(lambda: translation_processing(response), args.repeat)
+
+        def debug_on():
+            with request_debug():
+                translation_processing(response)
+        on = timed(debug_on, args.repeat)
+        root.removeHandler(handler)
+
+    print(f"{args.tokens} tokens, best of {args.repeat}")
+    print(f"print() per token (before)      : {before * 1000:8.2f} ms")
+    print(f"logger, debug off (default)     : {off * 1000:8.2f} ms  ({before / off:.1f}x faster)")
+    print(f"logger, request debug on        : {on * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cold-start and per-request parse cost of the spaCy pipeline, before and after
+the shared trimmed NLP service.
+
+Needs the spaCy model installed (python -m spacy download en_core_web_sm).
+Run from the repo root:
+    python -m benchmarks.bench_nlp_startup
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from Experimentation.nlp import SPACY_MODEL, get_nlp, parse, parse_many
+
+SENTENCE = "An 80-year-long study shows that good interpersonal relationships can make a person happier and healthier."
+
+COLD_FULL = f"import spacy; spacy.load({SPACY_MODEL!r})"
+COLD_TRIMMED = "from Experimentation.nlp import get_nlp; get_nlp()"
+
+
+def cold_start(snippet, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", snippet], check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per variant")
+    parser.add_argument("--sentences", type=int, default=200)
+    args = parser.parse_args()
+
+    try:
+        get_nlp()
+    except OSError as e:
+        sys.exit(f"spaCy model not available: {e}")
+
+    full = cold_start(COLD_FULL, args.runs)
+    trimmed = cold_start(COLD_TRIMMED, args.runs)
+    print(f"cold start, all components : {full * 1000:8.0f} ms")
+    print(f"cold start, trimmed        : {trimmed * 1000:8.0f} ms")
+
+    import spacy
+    nlp_full = spacy.load(SPACY_MODEL)
+    texts = [f"{SENTENCE} ({i})" for i in range(args.sentences)]
+
+    # Old path: extract_phrases and generate_phrase_alternatives each parse the text
+    legacy = timed(lambda: [(nlp_full(t), nlp_full(t)) for t in texts], repeat=1)
+    cached = timed(lambda: [(parse(t), parse(t)) for t in texts], repeat=1)
+    print(f"{args.sentences} sentences parsed twice, full pipeline : {legacy * 1000:8.0f} ms")
+    print(f"{args.sentences} sentences, trimmed + Doc cache (cold) : {cached * 1000:8.0f} ms")
+
+    piped = timed(lambda: parse_many(f"{t}!" for t in texts), repeat=1)
+    print(f"{args.sentences} sentences through nlp.pipe (cold)     : {piped * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Many short segments (UI strings, subtitles): requests and wall time with one
+request per segment against packed requests, over a synthetic backend with a
+fixed round-trip latency that answers packed prompts in the packed format.
+Also checks every packed segment comes back with its own logprobs.
+
+Run from the repo root:
+    python -m benchmarks.bench_packing --segments 500 --latency 0.3 --budget 2000
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.backends import TranslationBackend
+from Experimentation.document import afanyi_retrying
+from Experimentation.packing import MARKER, apack_translate
+
+WORD = re.compile(r"⟦\d+⟧|\s*[^\s⟦]+|\s+")
+
+
+def tokenize(text):
+    # Markers split the way BPE tends to split them, words with their leading space
+    tokens = []
+    for piece in WORD.findall(text):
+        tokens.extend(re.findall(r"⟦|\d+|⟧", piece) if MARKER.fullmatch(piece) else [piece])
+    return tokens
+
+
+class SyntheticBackend(TranslationBackend):
+    """Upper-cases each segment, numbered or not, after `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def _reply(self, messages):
+        source = messages[-1]["content"]
+        if MARKER.match(source):
+            return "\n".join(f"⟦{n}⟧ {text.upper()}" for n, text in re.findall(r"⟦(\d+)⟧ (.*)", source))
+        return source.split(":", 1)[1].upper()
+
+    def create(self, model, messages, **params):
+        time.sleep(self.latency)
+        return self._response(model, messages)
+
+    async def acreate(self, model, messages, **params):
+        await asyncio.sleep(self.latency)
+        return self._response(model, messages)
+
+    def _response(self, model, messages):
+        self.calls += 1
+        text = self._reply(messages)
+        tokens = [
+            {"token": t, "bytes": list(t.encode("utf-8")), "logprob": -0.1,
+             "top_logprobs": [{"token": t, "bytes": None, "logprob": -0.1},
+                              {"token": t.lower(), "bytes": None, "logprob": -2.5}]}
+            for t in tokenize(text)
+        ]
+        return ChatCompletion.model_validate({
+            "id": f"synthetic-{self.calls}", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text},
+                         "logprobs": {"content": tokens}}],
+            "usage": {"prompt_tokens": len(messages[-1]["content"]) // 4,
+                      "completion_tokens": len(tokens), "total_tokens": 0},
+        })
+
+
+async def one_per_request(segments, backend, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(segment):
+        async with semaphore:
+            return await afanyi_retrying(segment, backend=backend, cache=None, glossary=None)
+
+    return await asyncio.gather(*(one(s) for s in segments))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=2000, help="Token budget per packed request")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["save", "cancel", "open file", "settings", "close", "the quick brown fox", "are you sure?", "retry"]
+    segments = [" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(args.segments)]
+
+    single = SyntheticBackend(args.latency)
+    start = time.perf_counter()
+    asyncio.run(one_per_request(segments, single, args.concurrency))
+    before = time.perf_counter() - start
+
+    packed = SyntheticBackend(args.latency)
+    start = time.perf_counter()
+    results = asyncio.run(apack_translate(
+        segments, backend=packed, cache=None, glossary=None,
+        token_budget=args.budget, concurrency=args.concurrency,
+    ))
+    after = time.perf_counter() - start
+
+    ok = sum(
+        r.choices[0].message.content == s.upper()
+        and "".join(t.token for t in r.choices[0].logprobs.content) == s.upper()
+        for r, s in zip(results, segments)
+    )
+    print(f"{args.segments} segments, {args.latency * 1000:.0f} ms per call, {args.concurrency} in flight")
+    print(f"one per request : {single.calls:5d} requests  {before:6.2f} s")
+    print(f"packed          : {packed.calls:5d} requests  {after:6.2f} s  ({ok}/{len(segments)} split with logprobs)")
+
+
+if __name__ == "__main__":
+    main()
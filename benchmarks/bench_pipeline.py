@@ -0,0 +1,79 @@
+"""
+The translate-and-render pipeline end to end, offline, on synthetic
+translations from one sentence to 100k tokens (logprob.json repeated): logprob
+extraction, candidate sentences, phrase chunking (the spaCy parse, or the
+clause fallback when the model isn't installed), phrase alternatives, the
+annotation and the payload sent to the component, with its JSON size.
+
+Times are the best of --repeat, except chunking, which is timed once because
+parses are cached. --save stores the run in benchmarks/results/pipeline.jsonl;
+every run is compared with the last stored one with the same parameters.
+
+Run from the repo root:
+    python -m benchmarks.bench_pipeline --tokens 19,1000,10000,100000 --save
+"""
+import argparse
+import json
+import time
+
+from Experimentation.chatcompletion import generate_candidate_sentences, generate_phrase_alternatives, translation_processing
+from Experimentation.nlp import DEFAULT_LANGUAGE, phrase_chunks
+from benchmarks.fixtures import make_response
+from benchmarks.results import compare, save_run
+from components.annotated_component import build_payload
+from components.Output_text_area import build_annotation
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(n_tokens, repeat, translate_to):
+    response = make_response(n_tokens)
+    metrics = {}
+    metrics["extract_ms"], (text, table) = timed(lambda: translation_processing(response), repeat)
+    metrics["candidates_ms"], _ = timed(lambda: generate_candidate_sentences(table), repeat)
+    metrics["chunking_ms"], chunks = timed(lambda: phrase_chunks(text, translate_to), 1)
+    metrics["phrases_ms"], variants = timed(
+        lambda: generate_phrase_alternatives(text, table, chunks=chunks, translate_to=translate_to), repeat
+    )
+    metrics["annotation_ms"], (tokens, alt_phrases) = timed(lambda: build_annotation(text, variants), repeat)
+    metrics["payload_ms"], payload = timed(lambda: build_payload(tokens, alt_phrases), repeat)
+    metrics = {name: value * 1000 for name, value in metrics.items()}
+    metrics["payload_bytes"] = len(json.dumps(payload).encode("utf-8"))
+    metrics["phrases"] = len(variants)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", default="19,1000,10000,100000", help="Comma-separated translation lengths")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--translate-to", default=DEFAULT_LANGUAGE)
+    parser.add_argument("--save", action="store_true", help="Store the run for later comparisons")
+    args = parser.parse_args()
+
+    sizes = [int(t) for t in args.tokens.split(",")]
+    columns = ("extract_ms", "candidates_ms", "chunking_ms", "phrases_ms", "annotation_ms", "payload_ms")
+    print(f"{'tokens':>7}  " + "  ".join(f"{c[:-3]:>10}" for c in columns) + f"  {'payload':>10}  {'phrases':>7}")
+    metrics = {}
+    for n in sizes:
+        row = run(n, args.repeat, args.translate_to)
+        print(f"{n:7d}  " + "  ".join(f"{row[c]:7.1f} ms" for c in columns)
+              + f"  {row['payload_bytes']:8d} B  {row['phrases']:7d}")
+        metrics.update({f"{n}/{name}": value for name, value in row.items()})
+
+    params = {"tokens": sizes, "repeat": args.repeat, "translate_to": args.translate_to}
+    compare("pipeline", params, metrics)
+    if args.save:
+        save_run("pipeline", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
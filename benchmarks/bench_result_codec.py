@@ -0,0 +1,60 @@
+"""
+Size and load time of a translation result as the response's JSON (what the
+cache used to store) against result_codec's binary form, float32 and float16,
+for translations built by repeating logprob.json's tokens. The binary load is
+timed both from bytes and over a mmap of a file.
+
+Run from the repo root:
+    python -m benchmarks.bench_result_codec --tokens 19,1000,100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.result_codec import dump_response, load_response, open_result, zstandard
+from benchmarks.fixtures import make_response
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", default="19,1000,100000", help="Comma-separated translation lengths")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    formats = [("json", None), ("binary f32", {}), ("binary f16", {"half": True})]
+    if zstandard is not None:
+        formats.append(("binary f16+zstd", {"half": True, "compress": True}))
+
+    print(f"{'tokens':>7}  {'format':<16} {'bytes':>10}  {'load':>9}  {'mmap load':>9}")
+    for n in [int(t) for t in args.tokens.split(",")]:
+        response = make_response(n)
+        for name, options in formats:
+            if options is None:
+                data = response.model_dump_json()
+                load = timed(lambda: ChatCompletion.model_validate_json(data), args.repeat)
+                print(f"{n:7d}  {name:<16} {len(data.encode()):10d}  {load * 1000:6.1f} ms  {'-':>9}")
+                continue
+            data = dump_response(response, **options)
+            load = timed(lambda: load_response(data), args.repeat)
+            with tempfile.NamedTemporaryFile(delete=False) as f:
+                f.write(data)
+            # Just the table, as the pipeline uses it: no ChatCompletion rebuilt
+            mapped = timed(lambda: open_result(f.name), args.repeat)
+            os.unlink(f.name)
+            print(f"{n:7d}  {name:<16} {len(data):10d}  {load * 1000:6.1f} ms  {mapped * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Segmenting a document against an alt-phrase dictionary: the prefix scan of
+the old build_dynamic_sentence prototype (startswith for every phrase at
+every character) against PhraseSegmenter's automaton, for growing
+dictionaries. The prototype is only timed up to --max-naive phrases.
+
+Run from the repo root:
+    python -m benchmarks.bench_segmenter --chars 20000
+"""
+import argparse
+import random
+import time
+
+from components.phrase_segmenter import PhraseSegmenter
+
+
+def prefix_scan(sentence, alt_phrases):
+    # build_dynamic_sentence's segmentation, emitting render_annotated tokens instead of widgets
+    tokens = []
+    i = 0
+    while i < len(sentence):
+        matched = None
+        for phrase in alt_phrases:
+            if sentence[i:].startswith(phrase):
+                matched = phrase
+                break
+        if matched:
+            tokens.append((matched, str(len(tokens))))
+            i += len(matched)
+        else:
+            start = i
+            while i < len(sentence) and all(not sentence[i:].startswith(p) for p in alt_phrases):
+                i += 1
+            tokens.append(sentence[start:i])
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, default=20000, help="Document length")
+    parser.add_argument("--max-naive", type=int, default=100, help="Largest dictionary the prefix scan is timed on")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 8))) for _ in range(5000)]
+    words = []
+    while sum(len(w) + 1 for w in words) < args.chars:
+        words.append(rng.choice(vocabulary))
+    text = " ".join(words)
+
+    print(f"{len(text)} char document")
+    print(f"{'phrases':>8}  {'prefix scan':>12}  {'build':>9}  {'segment':>9}  {'matches':>8}")
+    for n in (10, 100, 1000, 10000):
+        phrases = {" ".join(rng.sample(vocabulary, rng.randint(1, 2))): ["alt"] for _ in range(n)}
+        naive = None
+        if n <= args.max_naive:
+            start = time.perf_counter()
+            prefix_scan(text, phrases)
+            naive = time.perf_counter() - start
+        start = time.perf_counter()
+        segmenter = PhraseSegmenter(phrases, whole_words=False)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        tokens = segmenter.segment(text)
+        segment = time.perf_counter() - start
+        matches = sum(isinstance(t, tuple) for t in tokens)
+        naive_ms = f"{naive * 1000:9.1f} ms" if naive is not None else f"{'-':>12}"
+        print(f"{len(phrases):8d}  {naive_ms}  {build * 1000:6.1f} ms  {segment * 1000:6.1f} ms  {matches:8d}")
+
+
+if __name__ == "__main__":
+    main()
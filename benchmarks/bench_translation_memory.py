@@ -0,0 +1,79 @@
+"""
+Translation memory lookup latency at scale: exact, fuzzy and miss lookups
+against a memory of synthetic CJK segments, plus the cost of reopening it.
+
+Run from the repo root:
+    python -m benchmarks.bench_translation_memory --segments 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from Experimentation.translation_memory import TranslationMemory
+
+CHARS = "的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间新什打便位因重被走电四第门相次东政海口使教西再平真听世气信北少关并内加化由却代军产入先山五太水万市眼体别处总才场师书比住员九笑性通目华报立马命张活难神数件安表原车白应路期叫死常提感金何更反合放做系计或司利受光"
+PAIR = ("Chinese(Simplified)", "English (United Kingdom)")
+
+
+def segment(rng):
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(15, 40))) + "。"
+
+
+def perturb(rng, text):
+    # One character swapped, as in a lightly edited repeat
+    i = rng.randrange(len(text) - 1)
+    return text[:i] + rng.choice(CHARS) + text[i + 1:]
+
+
+def lookup_ms(memory, queries):
+    times = []
+    scores = []
+    for query in queries:
+        start = time.perf_counter()
+        matches = memory.lookup(query, *PAIR)
+        times.append((time.perf_counter() - start) * 1000)
+        scores.append(matches[0]["score"] if matches else 0.0)
+    return statistics.median(times), max(times), sum(s > 0 for s in scores) / len(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    sources = [segment(rng) for _ in range(args.segments)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tm.sqlite3")
+        memory = TranslationMemory(path)
+        index = memory._fuzzy[PAIR]
+        start = time.perf_counter()
+        memory._conn.executemany(
+            "INSERT INTO segments (translate_from, translate_to, source, target, selections, signature, created_at) "
+            "VALUES (?, ?, ?, ?, '[]', ?, 0)",
+            ((*PAIR, s, f"translation {i}", index.signature(s).tobytes()) for i, s in enumerate(sources)),
+        )
+        memory._conn.commit()
+        print(f"hash + insert {args.segments} segments : {time.perf_counter() - start:8.2f} s")
+
+        start = time.perf_counter()
+        memory = TranslationMemory(path)
+        print(f"reopen and index                 : {time.perf_counter() - start:8.2f} s")
+
+        picked = rng.sample(sources, args.queries)
+        for name, queries in [
+            ("exact", picked),
+            ("fuzzy (1 char edited)", [perturb(rng, s) for s in picked]),
+            ("miss", [segment(rng) for _ in range(args.queries)]),
+        ]:
+            median, worst, hit_rate = lookup_ms(memory, queries)
+            print(f"{name:22} median {median:6.3f} ms  max {worst:6.3f} ms  hits {hit_rate:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
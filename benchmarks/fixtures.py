@@ -0,0 +1,38 @@
+"""
+Synthetic translations of any length, built by repeating the recorded tokens
+of Experimentation/logprob.json (one 19-token sentence with top-3 logprobs).
+"""
+import json
+from functools import lru_cache
+from pathlib import Path
+
+from openai.types.chat import ChatCompletion
+
+FIXTURE = Path(__file__).resolve().parent.parent / "Experimentation" / "logprob.json"
+# The recorded sentence's source, for inputs of matching length
+SOURCE_SENTENCE = "一项长达80年的研究表明，良好的人际关系能让人更快乐、更健康。"
+
+
+@lru_cache(maxsize=None)
+def _base():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return tuple(json.load(f))
+
+
+def token_records(n_tokens):
+    base = _base()
+    return [base[i % len(base)] for i in range(n_tokens)]
+
+
+def make_response(n_tokens) -> ChatCompletion:
+    tokens = token_records(n_tokens)
+    return ChatCompletion.model_validate({
+        "id": f"fixture-{n_tokens}", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "".join(t["token"] for t in tokens)},
+                     "logprobs": {"content": tokens}}],
+    })
+
+
+def source_text(n_sentences):
+    return SOURCE_SENTENCE * n_sentences
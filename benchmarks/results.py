@@ -0,0 +1,66 @@
+"""
+Stored benchmark runs, so a change can be compared with the run before it.
+
+Each run is one JSON line in benchmarks/results/<bench>.jsonl: when and where
+it ran (git commit, Python, platform), its parameters, and a flat
+{metric: value} dict. compare() prints each metric next to the previous run's.
+"""
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_runs(bench, path=None):
+    path = Path(path or RESULTS_DIR / f"{bench}.jsonl")
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_run(bench, params, metrics, path=None) -> dict:
+    run = {
+        "bench": bench,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "metrics": metrics,
+    }
+    path = Path(path or RESULTS_DIR / f"{bench}.jsonl")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def compare(bench, params, metrics, path=None, out=sys.stdout):
+    """Each metric next to the latest stored run with the same parameters, and the change in percent."""
+    previous = [run for run in load_runs(bench, path) if run["params"] == params]
+    if not previous:
+        print("No earlier run with these parameters to compare with", file=out)
+        return
+    baseline = previous[-1]
+    print(f"Compared with {baseline['time']} ({baseline['commit'] or 'unknown commit'}):", file=out)
+    for name, value in metrics.items():
+        before = baseline["metrics"].get(name)
+        if before is None:
+            continue
+        change = f"{(value - before) / before * 100:+7.1f}%" if before else f"{'-':>8}"
+        print(f"  {name:<40} {before:12.4g} -> {value:12.4g}  {change}", file=out)
@@ -1,224 +1,334 @@
 import streamlit as st
-import time
 from annotated_text import annotated_text
-import streamlit.components.v1 as components
+import bisect, hashlib, json
 import streamlit as st
 from typing import List, Union, Tuple
 
-# Simulated "streaming" function
-def stream_data(text):
-    full_text = ""
-    for word in text.split(" "):
-        full_text += word + " "
-        yield full_text
-        time.sleep(0.01)
+from Experimentation.document import (
+    document_phrase_alternatives, reusable_sentences, sentence_key, split_sentences, translate_document,
+)
+from Experimentation.logs import request_debug
+from Experimentation.streaming import stream_translation
+from Experimentation.tracing import count, get_exporter, span
+from Experimentation.translation_memory import get_memory
+from components.confidence_heatmap import CONFIDENCE_BANDS, build_heat
+from components.glossary_check import apply_glossary, match_glossary
+from components.phrase_rewrites import handle_rewrite_request, prefetch_low_confidence
+from components.phrase_segmenter import PhraseSegmenter
+from components.annotated_component import annotated_text_editor, apply_selections, build_payload, chosen_alternatives
+from components.translation_store import current_result, get_result, put_result, set_current, translation_key
 
-def render_annotated(tokens: List[Union[str, Tuple[str, str]]], alt_phrases: dict):
-    # Convert the tokens list to a JavaScript array representation
-    js_tokens = []
-    for token in tokens:
-        if isinstance(token, tuple):
-            js_tokens.append([token[0], token[1]])
+# Inputs longer than this go through parallel document mode instead of one stream
+STREAM_MAX_SENTENCES = 8
+# Translation memory hits at least this similar are used as-is, without calling the model
+TM_SKIP_SCORE = 0.95
+
+# Brings up the metrics endpoint/file configured in the environment, if any
+get_exporter()
+
+
+def translate_streamed(input_value, translate_from, translate_to, annotated_slot, text_slot):
+    """
+    Stream the translation into the page: the unfinished sentence is shown as
+    plain text while it arrives, finished sentences move into the annotated view
+    as soon as their phrase alternatives are ready.
+    """
+    text = ""
+    finished_end = 0
+    phrase_variants = []
+    table = None
+
+    # Repeat segments and reruns are answered from the translation cache
+    for event in stream_translation(input_value, translate_from=translate_from, translate_to=translate_to):
+        if event["type"] == "delta":
+            text = event["text"]
+            text_slot.markdown(text[finished_end:] + " ▌")
+        elif event["type"] == "sentence":
+            phrase_variants.extend(event["phrases"])
+            finished_end = event["end"]
+            with annotated_slot.container():
+                render_annotated(*build_annotation(text[:finished_end], phrase_variants))
         else:
-            js_tokens.append(token)
-    
-    import json
-    tokens_json = json.dumps(js_tokens)
-    alt_phrases_json = json.dumps(alt_phrases)
-    
-    # Create the React component with safe string formatting
-    react_component = f"""
-    <div id="root"></div>
-    <script src="https://unpkg.com/react@17/umd/react.production.min.js"></script>
-    <script src="https://unpkg.com/react-dom@17/umd/react-dom.production.min.js"></script>
-    <script>
-    const e = React.createElement;
-
-    function AnnotatedText({{ tokens: initialTokens, altPhrases: initialAltPhrases }}) {{
-        const [tokens, setTokens] = React.useState(initialTokens);
-        const [altPhrases, setAltPhrases] = React.useState(initialAltPhrases);
-        const [clickedWord, setClickedWord] = React.useState(null);
-        
-        const handleClick = (word, index) => {{
-            if (clickedWord === word) {{
-                setClickedWord(word);
-            }} else {{
-                setClickedWord(word);
-            }}
-            setTimeout(() => {{
-                window.parent.postMessage({{
-                    type: 'setFrameHeight',
-                    height: document.body.scrollHeight
-                }}, '*');
-            }}, 0);
-        }};
-
-        const handleAlternativeClick = (newWord) => {{
-            const currentAlts = altPhrases[clickedWord];
-            setAltPhrases(prev => ({{
-                ...prev,
-                [newWord]: currentAlts
-            }}));
-            const newTokens = tokens.map(token => {{
-                if (Array.isArray(token) && token[0] === clickedWord) {{
-                    return [newWord, token[1]];
-                }}
-                return token;
-            }});
-            setTokens(newTokens);
-            setClickedWord(null);
-        }};
-        
-        const renderAlternatives = (word) => {{
-            if (!altPhrases || !altPhrases[word]) return null;
-            return e('div', {{
-                style: {{ 
-                    marginTop: '0.5rem',
-                    padding: '8px',
-                    backgroundColor: '#f0f7ff',
-                    borderRadius: '5px'
-                }}
-            }}, [
-                e('div', {{ style: {{ fontWeight: 'bold', marginBottom: '4px' }} }}, 'Alternative phrases:'),
-                ...altPhrases[word].map((alt, i) => 
-                    e('div', {{ 
-                        key: i,
-                        onClick: () => handleAlternativeClick(alt),
-                        style: {{ 
-                            padding: '4px 8px',
-                            margin: '2px 0',
-                            backgroundColor: '#ffffff',
-                            borderRadius: '3px',
-                            cursor: 'pointer',
-                            transition: 'background-color 0.2s'
-                        }}
-                    }}, alt)
-                )
-            ]);
-        }};
-        
-        return e('div', {{
-            style: {{
-                padding: '20px',
-                width: '100%',
-                backgroundColor: '#ffffff',
-                borderRadius: '8px',
-                boxShadow: '0 2px 4px rgba(0,0,0,0.05)'
-            }}
-        }}, [
-            e('p', {{ 
-                key: 'text',
-                style: {{
-                    fontSize: '18px',
-                    lineHeight: '1.6',
-                    margin: '0 0 20px 0'
-                }}
-            }},
-                tokens.map((token, i) => {{
-                    if (Array.isArray(token)) {{
-                        const [word, label] = token;
-                        return e('span', {{
-                            key: i,
-                            className: 'clickable',
-                            onClick: () => handleClick(word, i),
-                            style: {{
-                                backgroundColor: '#d0e6f7',
-                                padding: '4px 8px',
-                                margin: '0 4px',
-                                borderRadius: '5px',
-                                cursor: 'pointer'
-                            }}
-                        }}, word);
-                    }}
-                    return e('span', {{ key: i }}, token);
-                }})
-            ),
-            clickedWord && e('div', {{
-                key: 'output',
-                style: {{ 
-                    marginTop: '1.5rem',
-                    width: '100%',
-                    maxHeight: '500px',
-                    overflowY: 'auto'
-                }}
-            }}, [
-                renderAlternatives(clickedWord)
-            ])
-        ]);
-    }}
-
-    const tokens = {tokens_json};
-    const altPhrases = {alt_phrases_json};
-    
-    ReactDOM.render(
-        e(AnnotatedText, {{ tokens: tokens, altPhrases: altPhrases }}),
-        document.getElementById('root')
-    );
-
-    setTimeout(() => {{
-        window.parent.postMessage({{
-            type: 'setFrameHeight',
-            height: document.body.scrollHeight
-        }}, '*');
-    }}, 0);
-    </script>
-
-    <style>
-    .clickable:hover {{
-        background-color: #a3d0f0 !important;
-    }}
-    </style>
+            text = event["text"]
+            table = event["logprobs"]
+
+    text_slot.empty()
+    return make_result(text, table, phrase_variants)
+
+
+def translate_whole_document(input_value, translate_from, translate_to, previous=None):
+    # Document mode: sentences go out concurrently and come back in order; with
+    # a previous result only the sentences edited since then are sent
+    document = translate_document(
+        input_value, previous=previous, translate_from=translate_from, translate_to=translate_to
+    )
+    # Phrase spans come from spaCy, alternatives from the logprobs
+    phrase_variants = document_phrase_alternatives(document, translate_to)
+    failed = [s for s in document["sentences"] if "error" in s]
+    warnings = [f"{len(failed)} sentence(s) could not be translated and are shown untranslated."] if failed else []
+    result = make_result(document["text"], document["logprobs"], phrase_variants, warnings)
+    # Lets a phrase rewrite see just the source sentence, not the whole document
+    result["source_sentences"] = [
+        (s["target_start"], s["target_end"], s["source"]) for s in document["sentences"]
+    ]
+    # Kept (with their logprobs and phrases) so the next edit can reuse them
+    result["sentences"] = document["sentences"]
+    return result
+
+
+def incremental_base(previous, input_value, translate_from, translate_to):
+    """
+    The last translated result, if it was translated sentence by sentence in
+    the same language pair and shares at least one sentence with the new input.
+    """
+    if previous is None or not previous.get("sentences"):
+        return None
+    if (previous["translate_from"], previous["translate_to"]) != (translate_from, translate_to):
+        return None
+    reusable = reusable_sentences(previous)
+    if not any(sentence_key(input_value[s:e]) in reusable for s, e in split_sentences(input_value)):
+        return None
+    return previous
+
+
+def _segment_starts(payload):
+    starts, cursor = [], 0
+    for segment in payload["segments"]:
+        starts.append(cursor)
+        cursor += len(segment[0])
+    return starts
+
+
+def carry_selections(previous, result):
+    """
+    Keep the translator's choices (and the rewrites they picked from) in the
+    sentences that were reused unchanged, at their new positions.
     """
-    
-    # Start with minimum height and let it adjust dynamically
-    components.html(react_component, height=250, scrolling=True)
+    moved = {}
+    new_sentences = {sentence_key(s["source"]): s for s in result["sentences"] if "error" not in s}
+    for old in previous["sentences"]:
+        new = new_sentences.get(sentence_key(old["source"]))
+        if new is not None and new["translation"] == old["translation"]:
+            moved[old["target_start"]] = (old["target_end"], new["target_start"])
+    if not moved or not previous["selections"]:
+        return
+    old_starts = sorted(moved)
+    old_offsets = _segment_starts(previous["payload"])
+    new_index = {offset: i for i, offset in enumerate(_segment_starts(result["payload"]))}
+    old_payload, new_payload = previous["payload"], result["payload"]
+    for i, choice in previous["selections"].items():
+        offset = old_offsets[int(i)]
+        k = bisect.bisect_right(old_starts, offset) - 1
+        if k < 0:
+            continue
+        start = old_starts[k]
+        end, new_start = moved[start]
+        if offset >= end:
+            continue
+        j = new_index.get(offset - start + new_start)
+        old_segment = old_payload["segments"][int(i)]
+        if j is None or len(new_payload["segments"][j]) < 3 or new_payload["segments"][j][0] != old_segment[0]:
+            continue
+        # Same options in the same order, or the choice would point at a different text
+        if new_payload["alternatives"][new_payload["segments"][j][2]] != old_payload["alternatives"][old_segment[2]]:
+            continue
+        result["selections"][str(j)] = choice
+        if i in previous["rewrites"]:
+            result["rewrites"][str(j)] = previous["rewrites"][i]
+
+
+def translate_from_memory(match):
+    # The stored target already has the translator's choices applied; each one
+    # stays clickable, with what the model had originally as its alternative
+    alt_phrases = {}
+    for choice in match.get("selections") or ():
+        alt_phrases.setdefault(choice["chosen"], []).append(choice["original"])
+    phrase_variants = [
+        {"original_phrase": phrase, "start_char": start, "end_char": end, "alternatives": alt_phrases[phrase]}
+        for start, end, phrase in PhraseSegmenter(alt_phrases).matches(match["target"])
+    ]
+    result = make_result(match["target"], None, phrase_variants)
+    result["tm_source"] = match
+    return result
+
+
+def make_result(text, table, phrase_variants, warnings=()):
+    """Everything later reruns need to redraw the output without recomputing it."""
+    tokens, alt_phrases = build_annotation(text, phrase_variants)
+    return {
+        "text": text,
+        "logprobs": table,
+        "phrase_variants": phrase_variants,
+        "tokens": tokens,
+        "alt_phrases": alt_phrases,
+        "payload": build_payload(tokens, alt_phrases),
+        "selections": {},
+        "rewrites": {},
+        "warnings": list(warnings),
+        "tm_source": None,
+        "tm_matches": [],
+        "glossary_terms": [],
+    }
+
+
+def render_annotated(tokens: List[Union[str, Tuple[str, str]]], alt_phrases: dict):
+    # Unkeyed: used for the in-progress view while a translation streams in
+    payload = build_payload(tokens, alt_phrases)
+    doc_id = hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+    with span("component_render", segments=len(payload["segments"]), streaming=True):
+        annotated_text_editor(doc_id, payload)
+
+
+def build_annotation(full_sent: str, phrase_variants: List[dict]):
+    """
+    Turn generate_phrase_alternatives output into the (tokens, alt_phrases)
+    pair render_annotated expects. Phrases without usable alternatives are
+    clickable too: their alternatives come from on-demand rewrites.
+
+    The phrases come with their char offsets, so this walks them in one pass
+    rather than searching the text; PhraseSegmenter is for texts whose phrases
+    have no offsets (translation memory hits). Searching here would also make
+    every repeat of a phrase clickable, not just the chunk spaCy found.
+    """
+    tokens = []
+    alt_phrases = {}
+    cursor = 0
+    label = 0
+    for phrase in sorted(phrase_variants, key=lambda p: p["start_char"]):
+        alts = [a for a in phrase["alternatives"] if not a.startswith("(")]
+        start, end = phrase["start_char"], phrase["end_char"]
+        if start < cursor:
+            continue
+        label += 1
+        tokens.append(full_sent[cursor:start])
+        tokens.append((phrase["original_phrase"], str(label)))
+        alt_phrases[phrase["original_phrase"]] = [phrase["original_phrase"]] + [
+            a for a in alts if a != phrase["original_phrase"]
+        ]
+        cursor = end
+    tokens.append(full_sent[cursor:])
+    return tokens, alt_phrases
+
+
+def heatmap_payload(result, enabled):
+    """
+    The (doc_id, payload) to show. With the heatmap on, the payload gains
+    per-segment confidence shading; segments are unchanged, so selections
+    carry over when it's toggled. Recomputed each rerun, it's a few vectorised
+    passes over the LogprobTable.
+    """
+    key = st.session_state.current_translation_key
+    if not enabled:
+        return key, result["payload"]
+    with span("confidence_heatmap", tokens=len(result["logprobs"]) if result["logprobs"] is not None else 0):
+        heat = build_heat(result["payload"], result["logprobs"])
+    if heat is None:
+        st.caption("No confidence data for this translation.")
+        return key, result["payload"]
+    high, mid, low = CONFIDENCE_BANDS
+    st.caption(
+        f"Shaded by confidence: yellow below {high:.0%}, orange below {mid:.0%}, red below {low:.0%}. "
+        "Phrases use their cumulative probability, other text each token's lead over its best alternative."
+    )
+    return f"{key}:heatmap", {**result["payload"], "heat": heat}
+
+
+def render_tm_suggestions(result):
+    # Fuzzy matches below TM_SKIP_SCORE, shown next to the model's translation
+    suggestions = [m for m in result["tm_matches"] if m is not result["tm_source"]]
+    if not suggestions:
+        return
+    with st.expander(f"Translation memory suggestions ({len(suggestions)})"):
+        for match in suggestions:
+            st.markdown(f"**{match['score']:.0%}** · {match['source']}")
+            st.text(match["target"])
+
 
 # Main output function
-def Output_text_area(input_value=""):
+def Output_text_area(input_value="", translate_from="Chinese(Simplified)", translate_to="English (United Kingdom)"):
     if "translation_output" not in st.session_state:
         st.session_state.translation_output = ""
 
+    # Same slots on every rerun, so an unchanged result keeps its frame
+    annotated_slot = st.empty()
+    text_slot = st.empty()
+
     if st.session_state.get("sync_button_clicked_status", False):
         sentence = input_value # value user typed in
-        
-        # Define the tokens and their alternatives together
-        tokens = [
-            "",
-            ("An 80-year-long study", "1"),
-            ("shows that good interpersonal relationships ", "2"),
-            "can make a person ",
-            ("happier", "3"),
-            " and ",
-            ("healthier", "4")
-        ]
-        
-        alt_phrases = {
-            "An 80-year-long study": [
-                "An 80-year-long study",
-                "A study of 80 years",
-                "An 8-decade-long research"
-            ],
-            "shows that good interpersonal relationships ": [
-                "shows that good interpersonal relationships ",
-                "demonstrates that strong social bonds ",
-                "reveals that healthy personal connections "
-            ],
-            "happier": [
-                "happier",
-                "more joyful",
-                "more content"
-            ],
-            "healthier": [
-                "healthier",
-                "more healthy",
-                "in better health"
-            ]
-        }
-        
-        # Pass both tokens and alt_phrases to render_annotated
-        render_annotated(tokens, alt_phrases)
+
+        if sentence and sentence.strip():
+            key = translation_key(sentence, translate_from, translate_to)
+            # Only a new (text, language pair) is translated; anything else comes from the session store
+            if get_result(key) is None:
+                # ?debug=1 in the URL logs token-level diagnostics for this request only
+                debug_this = st.query_params.get("debug") == "1"
+                with span("translate_request", chars=len(sentence)) as request, request_debug(debug_this):
+                    memory = get_memory()
+                    matches = memory.lookup(sentence, translate_from, translate_to) if memory else []
+                    # The last version translated in this session, if only some sentences changed since
+                    previous = incremental_base(current_result(), sentence, translate_from, translate_to)
+                    if matches and matches[0]["score"] >= TM_SKIP_SCORE:
+                        count("translation_memory_requests_total", result="hit")
+                        request.set(mode="memory")
+                        result = translate_from_memory(matches[0])
+                    elif previous is not None:
+                        count("translation_memory_requests_total", result="miss")
+                        request.set(mode="incremental")
+                        result = translate_whole_document(sentence, translate_from, translate_to, previous)
+                    elif len(split_sentences(sentence)) > STREAM_MAX_SENTENCES:
+                        count("translation_memory_requests_total", result="miss")
+                        request.set(mode="document")
+                        result = translate_whole_document(sentence, translate_from, translate_to)
+                    else:
+                        count("translation_memory_requests_total", result="miss")
+                        request.set(mode="stream")
+                        result = translate_streamed(sentence, translate_from, translate_to, annotated_slot, text_slot)
+                result.update(source=sentence, translate_from=translate_from, translate_to=translate_to, tm_matches=matches)
+                apply_glossary(result, match_glossary(sentence, translate_from, translate_to))
+                if previous is not None and result.get("sentences"):
+                    carry_selections(previous, result)
+                put_result(key, result)
+            set_current(key)
 
         st.session_state.sync_button_clicked_status = False
         # st.success("Translation completed!")
-    
+
+    result = current_result()
+    if result is not None:
+        with annotated_slot.container():
+            for warning in result["warnings"]:
+                st.warning(warning)
+            if result["tm_source"] is not None:
+                st.info(f"From translation memory ({result['tm_source']['score']:.0%} match)")
+            doc_id, payload = heatmap_payload(result, st.toggle("Confidence heatmap", key="confidence_heatmap"))
+            # A phrase the translator just opened: get its rewrites before redrawing
+            handle_rewrite_request(
+                result, st.session_state.get("translation_output_editor"), st.session_state.current_translation_key
+            )
+            # After the first render only the doc id, selections and rewrites travel to the frame
+            with span("component_render", segments=len(payload["segments"])):
+                reported = annotated_text_editor(
+                    doc_id,
+                    payload,
+                    result["selections"],
+                    key="translation_output_editor",
+                    rewrites=result["rewrites"],
+                )
+            prefetch_low_confidence(result)
+        if reported and reported.get("doc_id") == doc_id:
+            result["selections"] = reported.get("selections") or {}
+        st.session_state.translation_output = apply_selections(result["payload"], result["selections"], result["rewrites"])
+        render_tm_suggestions(result)
+
+        memory = get_memory()
+        if memory is not None and st.button("Confirm translation", key="confirm_translation_button"):
+            memory.add(
+                result["source"],
+                st.session_state.translation_output,
+                result["translate_from"],
+                result["translate_to"],
+                chosen_alternatives(result["payload"], result["selections"], result["rewrites"]),
+            )
+            st.success("Saved to translation memory.")
+
     return input_value
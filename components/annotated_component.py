@@ -0,0 +1,90 @@
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# Static assets are served by Streamlit itself, so the view works offline
+_FRONTEND = Path(__file__).resolve().parent / "annotated_frontend"
+_annotated_text_editor = components.declare_component("annotated_text_editor", path=str(_FRONTEND))
+
+
+def build_payload(tokens: List[Union[str, Tuple[str, str]]], alt_phrases: dict,
+                  flags: Optional[dict] = None) -> dict:
+    """
+    Compact JSON form of render_annotated's (tokens, alt_phrases):
+    plain text is [text], an annotated phrase is [text, label, alternatives index],
+    and each distinct alternatives list is sent once. `flags` ({phrase: [option
+    index, ...]}) marks options that break the glossary.
+    """
+    segments = []
+    alternatives = []
+    alt_index = {}
+    for token in tokens:
+        if isinstance(token, tuple):
+            text, label = token
+            options = alt_phrases.get(text) or [text]
+            if text not in alt_index:
+                alt_index[text] = len(alternatives)
+                alternatives.append(options)
+            segments.append([text, label, alt_index[text]])
+        elif token:
+            segments.append([token])
+    payload = {"segments": segments, "alternatives": alternatives}
+    if flags:
+        payload["flags"] = {str(alt_index[text]): flagged for text, flagged in flags.items() if text in alt_index}
+    return payload
+
+
+def _chosen_text(payload: dict, index: int, choice: int, rewrites: Optional[dict]) -> str:
+    # Choices past the phrase's alternatives pick from its rewrites, in order
+    options = payload["alternatives"][payload["segments"][index][2]]
+    if choice < len(options):
+        return options[choice]
+    return (rewrites or {})[str(index)][choice - len(options)]
+
+
+def apply_selections(payload: dict, selections: dict, rewrites: Optional[dict] = None) -> str:
+    """The translation text with the translator's chosen alternatives swapped in."""
+    parts = []
+    for i, segment in enumerate(payload["segments"]):
+        choice = selections.get(str(i))
+        if len(segment) == 3 and choice:
+            parts.append(_chosen_text(payload, i, choice, rewrites))
+        else:
+            parts.append(segment[0])
+    return "".join(parts)
+
+
+def chosen_alternatives(payload: dict, selections: dict, rewrites: Optional[dict] = None) -> List[dict]:
+    """The phrases the translator replaced, as [{"original", "chosen"}], in text order."""
+    chosen = []
+    for i, segment in enumerate(payload["segments"]):
+        choice = selections.get(str(i))
+        if len(segment) == 3 and choice:
+            chosen.append({"original": segment[0], "chosen": _chosen_text(payload, i, choice, rewrites)})
+    return chosen
+
+
+def annotated_text_editor(doc_id: str, payload: dict, selections: Optional[dict] = None,
+                          key: Optional[str] = None, rewrites: Optional[dict] = None) -> Optional[dict]:
+    """
+    Render the annotated translation and return what the frame reports back:
+    {"doc_id", "ready", "selections"} with selections as {segment index: choice},
+    plus {"rewrite": segment index} when the translator opened a phrase that
+    has no rewrites yet.
+
+    With a key, the document is only sent while the frame doesn't hold it yet;
+    after that reruns send just the doc_id, selections and rewrites
+    ({segment index: [rewrite, ...]}).
+    """
+    reported = st.session_state.get(key) if key else None
+    has_doc = isinstance(reported, dict) and reported.get("ready") and reported.get("doc_id") == doc_id
+    return _annotated_text_editor(
+        doc_id=doc_id,
+        doc=None if has_doc else payload,
+        selections=selections or {},
+        rewrites=rewrites or {},
+        key=key,
+        default=None,
+    )
@@ -0,0 +1,200 @@
+// Annotated translation view, served locally as a Streamlit custom component.
+//
+// Python sends {doc_id, doc, selections, rewrites}. `doc` is only sent when
+// this frame doesn't have that document yet; otherwise it is null and the frame
+// keeps the copy it already holds. The frame reports {doc_id, ready, selections}
+// back so the chosen alternatives survive reruns on the Python side, adding
+// {rewrite: index} when a phrase is opened that has no rewrites yet.
+(function () {
+    "use strict";
+
+    const state = {
+        docId: null,
+        doc: null,          // {segments: [[text] | [text, label, altIndex]], alternatives: [[...]],
+                            //  heat?: per segment, level | [[chars, level], ...] | [level, tooltip],
+                            //  flags?: altIndex -> [option index, ...] that break the glossary}
+        selections: {},     // segment index -> chosen alternative index (past the
+                            // alternatives: an index into that segment's rewrites)
+        rewrites: {},       // segment index -> [rewrite, ...], from Python
+        requested: {},      // segment indexes whose rewrites were asked for
+        open: null,         // segment index whose alternatives are shown
+    };
+
+    function send(type, payload) {
+        window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, payload), "*");
+    }
+
+    function setValue(value) {
+        send("streamlit:setComponentValue", { value: value, dataType: "json" });
+    }
+
+    function reportState(extra) {
+        setValue(Object.assign(
+            { doc_id: state.docId, ready: state.doc !== null, selections: state.selections },
+            extra || {}
+        ));
+    }
+
+    function resize() {
+        send("streamlit:setFrameHeight", { height: document.body.scrollHeight });
+    }
+
+    function chosenText(index) {
+        const segment = state.doc.segments[index];
+        const choice = state.selections[index];
+        if (segment.length < 3 || choice === undefined) {
+            return segment[0];
+        }
+        const options = state.doc.alternatives[segment[2]];
+        if (choice < options.length) {
+            return options[choice];
+        }
+        return (state.rewrites[index] || [])[choice - options.length] || segment[0];
+    }
+
+    function offGlossary(index, choice) {
+        const segment = state.doc.segments[index];
+        const flagged = (state.doc.flags || {})[segment[2]];
+        return Boolean(flagged) && flagged.indexOf(choice) >= 0;
+    }
+
+    function el(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    // Plain text, split into shaded runs when the heatmap is on
+    function plainSpans(text, heat) {
+        if (heat === undefined || heat === null || heat === 0) {
+            return [el("span", null, text)];
+        }
+        if (typeof heat === "number") {
+            return [el("span", "conf-" + heat, text)];
+        }
+        // Run lengths count code points, as Python does
+        const chars = Array.from(text);
+        let offset = 0;
+        return heat.map(function (run) {
+            const node = el("span", run[1] ? "conf-" + run[1] : null, chars.slice(offset, offset + run[0]).join(""));
+            offset += run[0];
+            return node;
+        });
+    }
+
+    function render() {
+        const root = document.getElementById("root");
+        root.textContent = "";
+        if (!state.doc) {
+            resize();
+            return;
+        }
+
+        const container = el("div", "annotated");
+        const paragraph = el("p");
+        const heat = state.doc.heat || [];
+        state.doc.segments.forEach(function (segment, index) {
+            if (segment.length < 3) {
+                plainSpans(segment[0], heat[index]).forEach(function (node) {
+                    paragraph.appendChild(node);
+                });
+                return;
+            }
+            let className = "clickable";
+            if (heat[index] && heat[index][0]) className += " conf-" + heat[index][0];
+            if (state.open === index) className += " open";
+            if (state.selections[index] !== undefined) className += " edited";
+            if (offGlossary(index, state.selections[index] || 0)) className += " off-glossary";
+            const span = el("span", className, chosenText(index));
+            span.title = heat[index] ? heat[index][1] : segment[1];
+            span.addEventListener("click", function () {
+                state.open = state.open === index ? null : index;
+                render();
+                if (state.open === index && state.rewrites[index] === undefined && !state.requested[index]) {
+                    state.requested[index] = true;
+                    render();
+                    reportState({ rewrite: index });
+                }
+            });
+            paragraph.appendChild(span);
+        });
+        container.appendChild(paragraph);
+
+        if (state.open !== null) {
+            const segment = state.doc.segments[state.open];
+            const options = state.doc.alternatives[segment[2]];
+            const panel = el("div", "alternatives");
+            panel.appendChild(el("div", "title", "Alternative phrases:"));
+            const current = state.selections[state.open] === undefined ? 0 : state.selections[state.open];
+            function addOption(text, choice) {
+                let className = "option" + (current === choice ? " chosen" : "");
+                if (offGlossary(state.open, choice)) className += " off-glossary";
+                const item = el("div", className, text);
+                if (offGlossary(state.open, choice)) item.title = "Doesn't use the glossary term";
+                item.addEventListener("click", function () {
+                    if (choice === 0) {
+                        delete state.selections[state.open];
+                    } else {
+                        state.selections[state.open] = choice;
+                    }
+                    state.open = null;
+                    render();
+                    reportState();
+                });
+                panel.appendChild(item);
+            }
+            options.forEach(addOption);
+
+            // Whole-phrase rewrites from the model, asked for when the phrase was opened
+            const rewrites = state.rewrites[state.open];
+            if (rewrites && rewrites.length) {
+                panel.appendChild(el("div", "title", "Rewrites:"));
+                rewrites.forEach(function (rewrite, k) {
+                    addOption(rewrite, options.length + k);
+                });
+            } else if (rewrites) {
+                panel.appendChild(el("div", "pending", "No rewrites found."));
+            } else if (state.requested[state.open]) {
+                panel.appendChild(el("div", "pending", "Rewriting phrase…"));
+            }
+            container.appendChild(panel);
+        }
+
+        root.appendChild(container);
+        resize();
+    }
+
+    function onRender(args) {
+        state.rewrites = args.rewrites || {};
+        if (args.doc) {
+            const fresh = args.doc_id !== state.docId || state.doc === null;
+            state.docId = args.doc_id;
+            state.doc = args.doc;
+            state.selections = Object.assign({}, args.selections || {});
+            if (fresh) {
+                state.open = null;
+                state.requested = {};
+            }
+            render();
+            reportState();
+        } else if (args.doc_id !== state.docId || state.doc === null) {
+            // Python thinks we already hold this document (e.g. the frame was
+            // reloaded); ask for it again
+            state.docId = null;
+            state.doc = null;
+            state.selections = {};
+            reportState();
+        } else {
+            render();
+        }
+    }
+
+    window.addEventListener("message", function (event) {
+        if (event.data && event.data.type === "streamlit:render") {
+            onRender(event.data.args);
+        }
+    });
+
+    send("streamlit:componentReady", { apiVersion: 1 });
+})();
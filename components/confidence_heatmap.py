@@ -0,0 +1,71 @@
+from typing import List, Optional
+
+import numpy as np
+
+from Experimentation.logprob_table import LogprobTable
+
+# Confidence bands, most to least confident; anything below a band is shaded one step darker
+CONFIDENCE_BANDS = (0.9, 0.6, 0.3)
+
+
+def confidence_level(scores) -> np.ndarray:
+    """0 for confident scores up to len(CONFIDENCE_BANDS) for the least confident; NaN counts as confident."""
+    scores = np.asarray(scores, dtype=np.float64)
+    return (scores[:, None] < np.asarray(CONFIDENCE_BANDS)[None, :]).sum(axis=1)
+
+
+def build_heat(payload: dict, table: Optional[LogprobTable]) -> Optional[list]:
+    """
+    Confidence shading for the component, one entry per payload segment:
+    a phrase gets [level, tooltip] from its cumulative probability; plain text
+    gets a level, or [[chars, level], ...] runs when its tokens differ, from
+    each token's margin over its best alternative.
+
+    None when there are no logprobs for this text (e.g. a translation memory hit).
+    """
+    segments = payload["segments"]
+    lengths = np.fromiter((len(seg[0]) for seg in segments), dtype=np.int64, count=len(segments))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    total = int(ends[-1]) if len(ends) else 0
+    if table is None or not len(table) or len(table.text) != total:
+        return None
+
+    confidence = table.confidence()
+    char_level = np.repeat(confidence_level(confidence["margin"]), table.char_ends - table.char_starts)
+    if len(char_level) != total:
+        return None
+    # Where the shading changes, as char offsets
+    changes = np.flatnonzero(np.diff(char_level)) + 1
+
+    is_phrase = np.fromiter((len(seg) == 3 for seg in segments), dtype=bool, count=len(segments))
+    phrase_idx = np.flatnonzero(is_phrase)
+    phrases = table.span_confidence(starts[phrase_idx], ends[phrase_idx], confidence)
+    phrase_level = confidence_level(phrases["prob"])
+
+    # Plain Python lists from here on: indexing numpy scalars in a loop is slow
+    heat: List = [None] * len(segments)
+    labels = [segments[i][1] for i in phrase_idx.tolist()]
+    for i, label, level, prob, margin, entropy, n in zip(
+        phrase_idx.tolist(), labels, phrase_level.tolist(), phrases["prob"].tolist(),
+        phrases["margin"].tolist(), phrases["entropy"].tolist(), phrases["tokens"].tolist(),
+    ):
+        tooltip = f"{label}: p={prob:.2f}, margin {margin:.2f}, entropy {entropy:.2f}" if n else f"{label}: p={prob:.2f}"
+        heat[i] = [level, tooltip]
+
+    plain_idx = np.flatnonzero(~is_phrase)
+    lo = np.searchsorted(changes, starts[plain_idx], side="right").tolist()
+    hi = np.searchsorted(changes, ends[plain_idx], side="left").tolist()
+    change_levels = char_level[changes].tolist()
+    changes = changes.tolist()
+    level_at_start = char_level[np.minimum(starts[plain_idx], max(total - 1, 0))].tolist()
+    for i, start, end, a, b, level in zip(
+        plain_idx.tolist(), starts[plain_idx].tolist(), ends[plain_idx].tolist(), lo, hi, level_at_start
+    ):
+        if a == b:
+            heat[i] = level if end > start else 0
+            continue
+        cuts = [start] + changes[a:b] + [end]
+        levels = [level] + change_levels[a:b]
+        heat[i] = [[y - x, run_level] for x, y, run_level in zip(cuts, cuts[1:], levels)]
+    return heat
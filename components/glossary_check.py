@@ -0,0 +1,39 @@
+from typing import List
+
+from Experimentation.glossary import get_glossary, term_counter
+from components.annotated_component import build_payload
+
+
+def match_glossary(source: str, translate_from: str, translate_to: str) -> List[dict]:
+    glossary = get_glossary()
+    return glossary.match(source, translate_from, translate_to) if glossary is not None else []
+
+
+def apply_glossary(result: dict, terms: List[dict]):
+    """
+    Check a fresh result against the glossary terms matched in its source:
+    warn about terms the translation doesn't use, and within each phrase move
+    the alternatives that use more of them forward and flag the ones that use
+    fewer. The original stays first, since it is choice 0.
+    """
+    result["glossary_terms"] = terms
+    if not terms:
+        return
+    present = term_counter([t["target"] for t in terms])
+    used = present(result["text"])
+    missing = [t for i, t in enumerate(terms) if i not in used]
+    if missing:
+        listed = "; ".join(f"{t['source']} → {t['target']}" for t in missing)
+        result["warnings"].append(f"Glossary terms not used in the translation: {listed}")
+
+    flags = {}
+    for phrase, options in result["alt_phrases"].items():
+        scores = [len(present(option)) for option in options]
+        best = max(scores)
+        if best == min(scores):
+            continue
+        order = [0] + sorted(range(1, len(options)), key=lambda j: -scores[j])
+        result["alt_phrases"][phrase] = [options[j] for j in order]
+        flags[phrase] = [k for k, j in enumerate(order) if scores[j] < best]
+    if flags:
+        result["payload"] = build_payload(result["tokens"], result["alt_phrases"], flags)
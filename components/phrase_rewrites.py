@@ -0,0 +1,78 @@
+import numpy as np
+import streamlit as st
+
+from Experimentation.document import split_sentences
+from Experimentation.rewrites import get_rewriter
+from components.confidence_heatmap import CONFIDENCE_BANDS
+
+# Lowest-confidence phrases whose rewrites are fetched before anyone clicks them
+PREFETCH_PHRASES = 3
+REWRITE_TIMEOUT = 60
+
+
+def phrase_offsets(payload: dict):
+    """(segment index, start char, end char) of every annotated phrase."""
+    offsets = []
+    cursor = 0
+    for i, segment in enumerate(payload["segments"]):
+        if len(segment) == 3:
+            offsets.append((i, cursor, cursor + len(segment[0])))
+        cursor += len(segment[0])
+    return offsets
+
+
+def rewrite_request(result: dict, index: int, start: int, end: int) -> dict:
+    """PhraseRewriter.request() arguments for one phrase: its sentence as context, plus the source."""
+    text = result["text"]
+    sentence_start, sentence_end = next(
+        ((s, e) for s, e in split_sentences(text) if s <= start and end <= e), (0, len(text))
+    )
+    # Document mode knows which source sentence each target sentence came from
+    source = next(
+        (src for s, e, src in result.get("source_sentences", ()) if s <= start and end <= e),
+        result.get("source", ""),
+    )
+    return {
+        "sentence": text[sentence_start:sentence_end],
+        "start": start - sentence_start,
+        "end": end - sentence_start,
+        "source": source,
+        "translate_from": result["translate_from"],
+        "translate_to": result["translate_to"],
+    }
+
+
+def prefetch_low_confidence(result: dict):
+    """Once per result, start rewrites for the least confident phrases in the background."""
+    if result.get("rewrites_prefetched") or result["logprobs"] is None:
+        return
+    result["rewrites_prefetched"] = True
+    offsets = phrase_offsets(result["payload"])
+    if not offsets:
+        return
+    _, starts, ends = map(np.array, zip(*offsets))
+    prob = result["logprobs"].span_confidence(starts, ends)["prob"]
+    lowest = [j for j in np.argsort(prob)[:PREFETCH_PHRASES].tolist() if prob[j] < CONFIDENCE_BANDS[0]]
+    get_rewriter().prefetch(rewrite_request(result, *offsets[j]) for j in lowest)
+
+
+def handle_rewrite_request(result: dict, reported, key: str):
+    """
+    Answer the frame's {"rewrite": segment index}, waiting for the model unless
+    the rewrites were prefetched. Results are kept in result["rewrites"].
+    """
+    if not isinstance(reported, dict) or not str(reported.get("doc_id", "")).startswith(key):
+        return
+    index = reported.get("rewrite")
+    if index is None or str(index) in result["rewrites"]:
+        return
+    offsets = {i: (start, end) for i, start, end in phrase_offsets(result["payload"])}
+    if index not in offsets:
+        return
+    future = get_rewriter().request(**rewrite_request(result, index, *offsets[index]))
+    with st.spinner("Rewriting phrase..."):
+        try:
+            result["rewrites"][str(index)] = future.result(timeout=REWRITE_TIMEOUT)
+        except Exception as e:
+            st.warning(f"Could not rewrite this phrase: {e}")
+            result["rewrites"][str(index)] = []
@@ -0,0 +1,43 @@
+from typing import List, Tuple, Union
+
+from Experimentation.glossary import Automaton, whole_word
+
+
+class PhraseSegmenter:
+    """
+    Splits text into the (tokens) render_annotated expects, given an
+    alt-phrase dictionary ({phrase: [alternatives]}): plain text stays a str,
+    each phrase occurrence becomes (phrase, label).
+
+    The dictionary is compiled once into an Aho-Corasick automaton, so
+    segmenting is one pass over the text however many phrases there are;
+    overlapping phrases resolve leftmost-longest. With `whole_words`, a
+    Latin-script phrase only matches between word boundaries ("a person"
+    doesn't match inside "a personal").
+    """
+
+    def __init__(self, alt_phrases: dict, whole_words: bool = True):
+        self.phrases = [phrase for phrase in alt_phrases if phrase]
+        self.automaton = Automaton(self.phrases)
+        self.whole_words = whole_words
+
+    def matches(self, text: str) -> List[Tuple[int, int, str]]:
+        accept = (lambda start, end, _: whole_word(text, start, end)) if self.whole_words else None
+        return [(start, end, self.phrases[i]) for start, end, i in self.automaton.longest(text, accept)]
+
+    def segment(self, text: str) -> List[Union[str, Tuple[str, str]]]:
+        tokens = []
+        cursor = 0
+        for label, (start, end, phrase) in enumerate(self.matches(text), 1):
+            if start > cursor:
+                tokens.append(text[cursor:start])
+            tokens.append((phrase, str(label)))
+            cursor = end
+        if cursor < len(text):
+            tokens.append(text[cursor:])
+        return tokens
+
+
+def segment_phrases(text: str, alt_phrases: dict, whole_words: bool = True) -> List[Union[str, Tuple[str, str]]]:
+    """One-off PhraseSegmenter(alt_phrases).segment(text); keep a PhraseSegmenter to reuse the automaton."""
+    return PhraseSegmenter(alt_phrases, whole_words).segment(text)
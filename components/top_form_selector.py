@@ -1,5 +1,11 @@
 import streamlit as st
 
+from Experimentation.languages import LANGUAGES
+
+# The pair the app translated before the selectors were wired up
+DEFAULT_INPUT_LANGUAGE = "Chinese"
+DEFAULT_OUTPUT_LANGUAGE = "English"
+
 def render_top_form_selectors():
     """
     Renders the input/output language select boxes and the sync button.
@@ -22,8 +28,8 @@ def render_top_form_selectors():
     with left:
         input_lang_selected = st.selectbox(
             "Input Language",
-            ("English", "Spanish", "French", "German", "Chinese"),
-            index=0,
+            tuple(LANGUAGES),
+            index=list(LANGUAGES).index(DEFAULT_INPUT_LANGUAGE),
             key="input_language_selector" # Unique key
         )
 
@@ -36,8 +42,8 @@ def render_top_form_selectors():
     with right:
         output_lang_selected = st.selectbox(
             "Output Language",
-            ("English", "Spanish", "French", "German", "Chinese"),
-            index=0,
+            tuple(LANGUAGES),
+            index=list(LANGUAGES).index(DEFAULT_OUTPUT_LANGUAGE),
             key="output_language_selector"
         )
     st.divider() # Divider inside the container
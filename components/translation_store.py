@@ -0,0 +1,51 @@
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+import streamlit as st
+
+from Experimentation.cache import normalize_text
+
+# Finished translations kept per browser session, most recently used last
+MAX_RESULTS_PER_SESSION = 16
+
+
+def translation_key(text: str, translate_from: str, translate_to: str) -> str:
+    payload = "\x00".join([normalize_text(text), translate_from, translate_to])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _results() -> OrderedDict:
+    if "translation_results" not in st.session_state:
+        st.session_state.translation_results = OrderedDict()
+    return st.session_state.translation_results
+
+
+def get_result(key: Optional[str]) -> Optional[dict]:
+    """
+    A finished translation (text, LogprobTable, phrase alternatives, annotated
+    tokens, the component payload and the translator's selections) or None if
+    it isn't stored.
+    """
+    results = _results()
+    result = results.get(key)
+    if result is not None:
+        results.move_to_end(key)
+    return result
+
+
+def put_result(key: str, result: dict):
+    results = _results()
+    results[key] = result
+    results.move_to_end(key)
+    while len(results) > MAX_RESULTS_PER_SESSION:
+        results.popitem(last=False)
+
+
+def current_result() -> Optional[dict]:
+    """The translation the output area is currently showing."""
+    return get_result(st.session_state.get("current_translation_key"))
+
+
+def set_current(key: str):
+    st.session_state.current_translation_key = key
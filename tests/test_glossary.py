@@ -0,0 +1,66 @@
+from components.phrase_segmenter import PhraseSegmenter, segment_phrases
+from Experimentation.glossary import Automaton, Glossary, term_counter, whole_word
+
+
+def occurrences(automaton, text):
+    return sorted((start, end, automaton.keys[i]) for start, end, i in automaton.finditer(text))
+
+
+def test_finditer_reports_overlapping_keys():
+    automaton = Automaton(["he", "she", "his", "hers"])
+    assert occurrences(automaton, "ushers") == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_finditer_matches_brute_force():
+    keys = ["a", "ab", "bab", "bc", "bca", "c", "caa"]
+    text = "abccabbcaabcab"
+    expected = sorted(
+        (start, start + len(key), key) for key in keys for start in range(len(text)) if text.startswith(key, start)
+    )
+    assert occurrences(Automaton(keys), text) == expected
+
+
+def test_longest_is_leftmost_longest():
+    automaton = Automaton(["board", "board of directors", "directors"])
+    text = "the board of directors met"
+    assert [text[s:e] for s, e, _ in automaton.longest(text)] == ["board of directors"]
+
+
+def test_longest_with_accept():
+    automaton = Automaton(["cat"])
+    text = "concatenate the cat"
+    assert automaton.longest(text) == [(3, 6, 0), (16, 19, 0)]
+    assert automaton.longest(text, lambda s, e, _: whole_word(text, s, e)) == [(16, 19, 0)]
+
+
+def test_cjk_and_empty():
+    automaton = Automaton(["研究", "人际关系", ""])
+    text = "研究表明良好的人际关系"
+    assert [(s, e) for s, e, _ in automaton.longest(text)] == [(0, 2), (7, 11)]
+    assert Automaton([]).longest(text) == []
+
+
+def test_glossary_match():
+    glossary = Glossary([
+        {"source": "Board", "target": "董事会"},
+        {"source": "board of directors", "target": "董事会成员"},
+        {"source": "API", "target": "接口", "translate_to": "Chinese"},
+        {"source": "API", "target": "Interface"},
+    ])
+    terms = glossary.match("The Board of Directors uses the API.", "English", "Chinese(Simplified)")
+    assert [t["target"] for t in terms] == ["董事会成员", "接口"]
+    assert [t["target"] for t in glossary.match("rapid", "English", "Chinese")] == []
+
+
+def test_term_counter_shared_targets():
+    present = term_counter(["board", "Board", "director"])
+    assert present("The board met") == {0, 1}
+    assert present("no match in cardboard") == set()
+
+
+def test_segmenter_labels_and_whole_words():
+    alt_phrases = {"a person": ["someone"], "good relationships": ["strong ties"], "": []}
+    text = "good relationships make a person happy, a personal view."
+    tokens = PhraseSegmenter(alt_phrases).segment(text)
+    assert tokens == [("good relationships", "1"), " make ", ("a person", "2"), " happy, a personal view."]
+    assert segment_phrases("a personal", alt_phrases, whole_words=False) == [("a person", "1"), "al"]
@@ -0,0 +1,132 @@
+import asyncio
+
+from openai.types.chat import ChatCompletion
+
+from Experimentation.backends import TranslationBackend
+from Experimentation.cache import TranslationCache, cache_key
+from Experimentation.chatcompletion import build_messages, fanyi
+from Experimentation.packing import apack_translate, split_packed, unpack_response
+
+
+def token(text, logprob=-0.1, alternatives=()):
+    return {
+        "token": text,
+        "bytes": list(text.encode("utf-8")),
+        "logprob": logprob,
+        "top_logprobs": [{"token": alt, "bytes": None, "logprob": -2.0} for alt in alternatives],
+    }
+
+
+def response(tokens, finish_reason="stop"):
+    return ChatCompletion.model_validate({
+        "id": "packed", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason,
+            "message": {"role": "assistant", "content": "".join(t["token"] for t in tokens)},
+            "logprobs": {"content": tokens},
+        }],
+    })
+
+
+def texts(spans, text):
+    return {number: text[start:end] for number, (start, end) in spans.items()}
+
+
+def test_split_all_segments():
+    text = "⟦1⟧ Hello\n⟦2⟧ Goodbye\n⟦3⟧ Thanks"
+    assert texts(split_packed(text, 3), text) == {1: "Hello", 2: "Goodbye", 3: "Thanks"}
+
+
+def test_split_missing_marker():
+    # Without ⟦2⟧, "Hello" may have swallowed segment 2: neither is trusted
+    text = "⟦1⟧ Hello Goodbye\n⟦3⟧ Thanks"
+    assert texts(split_packed(text, 3), text) == {3: "Thanks"}
+
+
+def test_split_duplicated_marker():
+    # Which ⟦2⟧ is the answer is a guess; the segments around it still end at the right markers
+    text = "⟦1⟧ Hello\n⟦2⟧ Goodbye\n⟦2⟧ Bye\n⟦3⟧ Thanks"
+    assert texts(split_packed(text, 3), text) == {1: "Hello", 3: "Thanks"}
+
+
+def test_split_out_of_order():
+    text = "⟦2⟧ Goodbye\n⟦1⟧ Hello\n⟦3⟧ Thanks"
+    assert texts(split_packed(text, 3), text) == {3: "Thanks"}
+
+
+def test_split_empty_and_out_of_range():
+    text = "⟦1⟧ \n⟦2⟧ Goodbye\n⟦3⟧ Thanks ⟦9⟧ extra"
+    assert texts(split_packed(text, 3), text) == {2: "Goodbye"}
+
+
+def test_split_truncated_drops_last_segment():
+    text = "⟦1⟧ Hello\n⟦2⟧ The quick brown fo"
+    assert texts(split_packed(text, 2), text) == {1: "Hello", 2: "The quick brown fo"}
+    assert texts(split_packed(text, 2, complete=False), text) == {1: "Hello"}
+
+
+def test_unpack_slices_logprobs():
+    tokens = [
+        token("⟦"), token("1"), token("⟧"), token(" Hello", alternatives=[" Hi"]), token(" world"),
+        token("\n⟦"), token("2⟧"), token(" 再见"),
+    ]
+    unpacked = unpack_response(response(tokens), 2)
+    first, second = unpacked[0].choices[0], unpacked[1].choices[0]
+    assert first.message.content == "Hello world"
+    assert second.message.content == "再见"
+    assert "".join(t.token for t in first.logprobs.content) == "Hello world"
+    assert "".join(t.token for t in second.logprobs.content) == "再见"
+    # Only whitespace was cut from " Hello", so it keeps its (trimmed) alternatives
+    assert [alt.token for alt in first.logprobs.content[0].top_logprobs] == ["Hi"]
+    assert first.finish_reason == second.finish_reason == "stop"
+
+
+def test_unpack_truncated_reply():
+    tokens = [token("⟦1⟧"), token(" Hello"), token("\n⟦2⟧"), token(" The quick brown fo")]
+    assert list(unpack_response(response(tokens, "stop"), 2)) == [0, 1]
+    unpacked = unpack_response(response(tokens, "length"), 2)
+    assert list(unpacked) == [0]
+    assert unpacked[0].choices[0].finish_reason == "stop"
+
+
+class PackedBackend(TranslationBackend):
+    """Answers packed requests with `reply` and single ones with "single:<source>"."""
+
+    def __init__(self, reply, finish_reason="stop"):
+        self.reply = reply
+        self.finish_reason = finish_reason
+        self.requests = []
+
+    def create(self, model, messages, **params):
+        user = messages[-1]["content"]
+        self.requests.append(user)
+        if "⟦" in user:
+            return response([token(self.reply)], self.finish_reason)
+        return response([token("single:" + user.split(":", 1)[1])])
+
+
+def test_truncated_segment_falls_back():
+    backend = PackedBackend("⟦1⟧ A\n⟦2⟧ B was cut", finish_reason="length")
+    cache = TranslationCache(":memory:")
+    results = asyncio.run(apack_translate(["甲", "乙"], backend=backend, cache=cache, glossary=None))
+    assert [r.choices[0].message.content for r in results] == ["A", "single:乙"]
+    assert len(backend.requests) == 2
+
+
+def test_packed_results_not_served_to_fanyi():
+    backend = PackedBackend("⟦1⟧ A\n⟦2⟧ B")
+    cache = TranslationCache(":memory:")
+    results = asyncio.run(apack_translate(["甲", "乙"], backend=backend, cache=cache, glossary=None))
+    assert [r.choices[0].message.content for r in results] == ["A", "B"]
+
+    # fanyi() has its own prompt, so it doesn't get the packed result back
+    assert fanyi("甲", backend=backend, cache=cache, glossary=None).choices[0].message.content == "single:甲"
+    instruction, _ = build_messages("甲")
+    assert cache.get(cache_key("甲", "Chinese(Simplified)", "English (United Kingdom)", "gpt-4o", instruction))
+
+    # A later packed run reuses both, without a request
+    sent = len(backend.requests)
+    results = asyncio.run(apack_translate(["甲", "乙"], backend=backend, cache=cache, glossary=None))
+    assert [r.choices[0].message.content for r in results] == ["single:甲", "B"]
+    assert len(backend.requests) == sent
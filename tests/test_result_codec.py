@@ -0,0 +1,111 @@
+import time
+
+import numpy as np
+import pytest
+from openai.types.chat import ChatCompletion
+
+from Experimentation.cache import TranslationCache
+from Experimentation.chatcompletion import fanyi_stream
+from Experimentation.logprob_table import LogprobTable
+from Experimentation.result_codec import (
+    decode_varints, dump_response, dump_result, encode_varints, load_response, load_result, open_result, save_result,
+)
+from benchmarks.fixtures import make_response
+
+
+def response(content, logprobs, finish_reason="stop"):
+    return ChatCompletion.model_validate({
+        "id": "r", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason,
+            "message": {"role": "assistant", "content": content},
+            "logprobs": logprobs,
+        }],
+    })
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 2 ** 21, 2 ** 35 + 7, 2 ** 63 - 1]
+    assert decode_varints(encode_varints(values)).tolist() == values
+    assert encode_varints([]) == b""
+    assert len(encode_varints([127, 128])) == 3
+
+
+def test_result_round_trip():
+    table = LogprobTable.from_logprobs(make_response(40).choices[0].logprobs.content)
+    text, loaded, meta = load_result(dump_result(table.text, table, {"id": "x"}))
+    assert text == table.text
+    assert meta == {"id": "x"}
+    assert loaded.tokens() == table.tokens()
+    assert np.array_equal(loaded.logprobs, table.logprobs)
+    assert np.array_equal(loaded.alt_logprobs, table.alt_logprobs)
+    assert [loaded.alternatives(i) for i in range(len(loaded))] == [table.alternatives(i) for i in range(len(table))]
+
+
+def test_half_precision():
+    table = LogprobTable.from_logprobs(make_response(19).choices[0].logprobs.content)
+    _, loaded, _ = load_result(dump_result(table.text, table, half=True))
+    assert np.allclose(loaded.logprobs, table.logprobs, atol=1e-2)
+    assert len(dump_result(table.text, table, half=True)) < len(dump_result(table.text, table))
+
+
+def test_text_that_differs_from_tokens():
+    # A message that isn't just its tokens' text is stored as it is
+    table = LogprobTable.from_logprobs(make_response(5).choices[0].logprobs.content)
+    text, loaded, _ = load_result(dump_result("Something else", table))
+    assert text == "Something else"
+    assert loaded.text == table.text
+
+
+def test_response_round_trip():
+    original = make_response(19)
+    loaded = load_response(dump_response(original))
+    choice, expected = loaded.choices[0], original.choices[0]
+    assert choice.message.content == expected.message.content
+    assert choice.finish_reason == "stop"
+    assert [t.token for t in choice.logprobs.content] == [t.token for t in expected.logprobs.content]
+    assert [t.bytes for t in choice.logprobs.content] == [t.bytes for t in expected.logprobs.content]
+    assert [[alt.token for alt in t.top_logprobs] for t in choice.logprobs.content] == \
+        [[alt.token for alt in t.top_logprobs] for t in expected.logprobs.content]
+
+
+@pytest.mark.parametrize("content, logprobs", [
+    ("Hello", None),
+    ("", {"content": []}),
+    ("", {"content": None}),
+])
+def test_responses_without_tokens(content, logprobs):
+    loaded = load_response(dump_response(response(content, logprobs)))
+    assert loaded.choices[0].message.content == content
+    assert not (loaded.choices[0].logprobs and loaded.choices[0].logprobs.content)
+
+
+def test_open_result_maps_file(tmp_path):
+    table = LogprobTable.from_logprobs(make_response(100).choices[0].logprobs.content)
+    save_result(tmp_path / "result.bin", table.text, table)
+    text, loaded, _ = open_result(tmp_path / "result.bin")
+    assert text == table.text
+    assert not loaded.logprobs.flags.owndata
+    assert np.array_equal(loaded.logprobs, table.logprobs)
+
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        load_result(b"\0" * 200)
+
+
+def test_cache_drops_unreadable_rows():
+    cache = TranslationCache(":memory:")
+    now = time.time()
+    cache._conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", ("key", b"TRLP\x01broken", 11, now, now))
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_stream_cache_hit_without_logprobs():
+    class Cache(TranslationCache):
+        def get(self, key):
+            return load_response(dump_response(response("Hello", None)))
+
+    assert list(fanyi_stream("你好", backend=object(), cache=Cache(":memory:"), glossary=None)) == [("Hello", [])]